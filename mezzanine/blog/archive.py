@@ -0,0 +1,144 @@
+"""
+The months that blog posts were published in, with the number of
+posts published in each, for the ``blog_months`` template tag.
+
+Months are counted in the database, in the current timezone, and
+stored in cache for each site and timezone when it's installed, under
+a version number stored in cache for each site. When a blog post is
+published, unpublished or deleted, the version for its site is
+incremented once the change is committed, so that the months are
+counted again. Entries are also counted again once they're older than
+``CACHE_MIDDLEWARE_SECONDS``, or when a post is due to be published
+or to expire.
+"""
+from datetime import datetime
+from functools import partial
+from time import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.timezone import now
+
+from mezzanine.conf import settings
+from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.sites import current_site_id
+
+
+def _version_key(site_id):
+    return f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.blog.months.{site_id}.version"
+
+
+def _months_key(site_id, tzname):
+    version_key = _version_key(site_id)
+    version = cache.get(version_key)
+    if version is None:
+        # Start from the current time rather than zero, so that months
+        # left in cache from before the version was evicted can't
+        # match it again.
+        cache.add(version_key, int(time() * 1000), None)
+        version = cache.get(version_key)
+    prefix = f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.blog.months.{site_id}"
+    return f"{prefix}.{version}.{tzname}"
+
+
+def _timestamp(date):
+    return date.timestamp() if date is not None else None
+
+
+def post_state(post):
+    """
+    Returns the ``publish_date`` the post is counted under if it's
+    published, and the time at which that next changes if it's due
+    to be published or to expire, given a ``BlogPost`` or a dict of
+    its field values.
+    """
+    from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+    if not isinstance(post, dict):
+        post = post.__dict__
+    if post.get("status") != CONTENT_STATUS_PUBLISHED:
+        return None, None
+    current = now()
+    publish_date = post.get("publish_date")
+    expiry_date = post.get("expiry_date")
+    if publish_date is not None and publish_date > current:
+        return None, _timestamp(publish_date)
+    if expiry_date is not None and expiry_date < current:
+        return None, None
+    return publish_date, _timestamp(expiry_date)
+
+
+def _count_months(tzinfo):
+    """
+    Counts the published posts for the current site in each month,
+    returning a dict with the counts mapped to ``(year, month)``, and
+    the time at which the next post is due to be published or to
+    expire.
+    """
+    from mezzanine.blog.models import BlogPost
+    from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+    posts = BlogPost.objects.published().order_by()
+    months = posts.annotate(month=TruncMonth("publish_date", tzinfo=tzinfo))
+    months = months.values("month").annotate(post_count=Count("id"))
+    counts = {
+        (m["month"].year, m["month"].month): m["post_count"]
+        for m in months
+        if m["month"] is not None
+    }
+    current = now()
+    bounds = BlogPost.objects.filter(status=CONTENT_STATUS_PUBLISHED).aggregate(
+        publish=Min("publish_date", filter=Q(publish_date__gt=current)),
+        expiry=Min("expiry_date", filter=Q(expiry_date__gte=current)),
+    )
+    changes = [_timestamp(d) for d in bounds.values() if d is not None]
+    return {"months": counts, "expires": min(changes, default=None)}
+
+
+def get_blog_months():
+    """
+    Returns a list of dicts for the months that posts were published
+    in for the current site, in the current timezone, with the first
+    day of the month as ``date`` and the number of posts published in
+    it as ``post_count``, most recent first.
+    """
+    tzinfo, tzname = None, ""
+    if settings.USE_TZ:
+        tzinfo = timezone.get_current_timezone()
+        tzname = timezone.get_current_timezone_name()
+    if cache_installed():
+        months_key = _months_key(current_site_id(), tzname)
+        archive = cache.get(months_key)
+        if archive is None or (archive["expires"] or float("inf")) <= time():
+            archive = _count_months(tzinfo)
+            cache.set(months_key, archive, settings.CACHE_MIDDLEWARE_SECONDS)
+    else:
+        archive = _count_months(tzinfo)
+    months = sorted(archive["months"].items(), reverse=True)
+    return [
+        {"date": datetime(year, month, 1), "post_count": count}
+        for (year, month), count in months
+    ]
+
+
+def update_blog_months(site_id, old_state, new_state, using=None):
+    """
+    Increments the version of the months stored in cache for the given
+    site once the transaction is committed, when a post's state changes
+    from ``old_state`` to ``new_state``, as returned by ``post_state``.
+    Incrementing it any earlier would let the months be counted again
+    and stored under the new version before the change is visible.
+    """
+    if not cache_installed() or old_state == new_state:
+        return
+    transaction.on_commit(partial(_increment_version, site_id), using=using)
+
+
+def _increment_version(site_id):
+    try:
+        cache.incr(_version_key(site_id))
+    except ValueError:
+        pass
@@ -1,16 +1,22 @@
+from hashlib import md5
+
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.contrib.syndication.views import Feed, add_domain
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
 from django.utils.feedgenerator import Atom1Feed
 from django.utils.html import strip_tags
+from django.utils.http import http_date
 
 from mezzanine.blog.models import BlogCategory, BlogPost
 from mezzanine.conf import settings
+from mezzanine.core import richtext
 from mezzanine.core.request import current_request
-from mezzanine.core.templatetags.mezzanine_tags import richtext_filters
 from mezzanine.generic.models import Keyword
+from mezzanine.utils.cache import cache_installed
 from mezzanine.utils.html import absolute_urls
 from mezzanine.utils.sites import current_site_id
 
@@ -57,10 +63,50 @@ class PostsRSS(Feed):
                 self._title = settings.SITE_TITLE
                 self._description = settings.SITE_TAGLINE
 
-    def __call__(self, *args, **kwarg):
+    def __call__(self, request, *args, **kwargs):
+        """
+        Sets ``ETag`` and ``Last-Modified`` headers for the feed from
+        its items, and returns a ``304 Not Modified`` response if the
+        ``ETag`` matches the request's ``If-None-Match`` header, without
+        building the items. ``If-Modified-Since`` isn't used, since the
+        feed changes without its latest date changing when items are
+        removed.
+        """
         self._request = current_request()
         self._site = Site.objects.get(id=current_site_id())
-        return super().__call__(*args, **kwarg)
+        etag, last_modified = self.validators()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().__call__(request, *args, **kwargs)
+        if etag is not None and response.status_code in (200, 304):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def validators(self):
+        """
+        Returns the ``ETag`` and ``Last-Modified`` timestamp for the
+        feed, or ``None`` for both if it has no items. The ``ETag``
+        changes when items are added, removed or updated, or when the
+        feed's settings change. The timestamp is the latest date an
+        item was updated or published, since scheduled posts are
+        published after they were last updated.
+        """
+        if not self._public:
+            return None, None
+        versions = list(self.items().values_list("id", "updated", "publish_date"))
+        dates = [d for item in versions for d in item[1:] if d is not None]
+        if not dates:
+            return None, None
+        version = [
+            self.feed_type.__name__,
+            self.feed_url(),
+            self._title,
+            self._description,
+            richtext.filters_version(),
+        ] + [f"{item_id}:{updated}" for item_id, updated, _ in versions]
+        etag = md5(repr(version).encode("utf-8")).hexdigest()
+        return quote_etag(etag), int(max(dates).timestamp())
 
     def add_domain(self, link):
         return add_domain(self._site.domain, link, self._request.is_secure())
@@ -97,11 +143,28 @@ class PostsRSS(Feed):
         return blog_posts
 
     def item_description(self, item):
-        description = richtext_filters(item.content)
+        """
+        Returns the post's filtered content with absolute URLs, stored
+        in cache for each version of the content and host when it's
+        installed, so that it's only parsed once.
+        """
+        key = None
+        if cache_installed():
+            version = richtext.content_version(item.content)
+            version += self._request.build_absolute_uri("/")
+            version = md5(version.encode("utf-8")).hexdigest()
+            key = f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.blog.feed.{version}"
+            description = cache.get(key)
+            if description is not None:
+                return description
+        description = item.filtered_content()
         absolute_urls_name = "mezzanine.utils.html.absolute_urls"
         if absolute_urls_name not in settings.RICHTEXT_FILTERS:
             description = absolute_urls(description)
-        return unicode(description)
+        description = str(description)
+        if key is not None:
+            cache.set(key, description, settings.CACHE_MIDDLEWARE_SECONDS)
+        return description
 
     def categories(self):
         if not self._public:
@@ -4,12 +4,14 @@ from django.contrib.auth import get_user_model
 from django.contrib.redirects.models import Redirect
 from django.contrib.sites.models import Site
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils.encoding import force_str
 from django.utils.html import strip_tags
 
 from mezzanine.blog.models import BlogCategory, BlogPost
 from mezzanine.conf import settings
 from mezzanine.core.models import CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED
+from mezzanine.generic.fields import suspend_related_updates
 from mezzanine.generic.models import Keyword, ThreadedComment
 from mezzanine.pages.models import RichTextPage
 from mezzanine.utils.html import decode_entities
@@ -200,73 +202,78 @@ class BaseImporterCommand(BaseCommand):
         # Run the subclassed ``handle_import`` and save posts, tags,
         # categories, and comments to the DB.
         self.handle_import(options)
-        for post_data in self.posts:
-            categories = post_data.pop("categories")
-            tags = post_data.pop("tags")
-            comments = post_data.pop("comments")
-            old_url = post_data.pop("old_url")
-            post_data = self.trunc(BlogPost, prompt, **post_data)
-            initial = {
-                "title": post_data.pop("title"),
-                "user": mezzanine_user,
-            }
-            if post_data["publish_date"] is None:
-                post_data["status"] = CONTENT_STATUS_DRAFT
-            post, created = BlogPost.objects.get_or_create(**initial)
-            for k, v in post_data.items():
-                setattr(post, k, v)
-            post.save()
-            if created and verbosity >= 1:
-                print("Imported post: %s" % post)
-            for name in categories:
-                cat = self.trunc(BlogCategory, prompt, title=name)
-                if not cat["title"]:
-                    continue
-                cat, created = BlogCategory.objects.get_or_create(**cat)
+        # Comment counts and keywords strings are calculated once
+        # for each post and page when the import is done. Everything is
+        # saved in a single transaction, so that the redirects created
+        # are invalidated once rather than for each of them.
+        with transaction.atomic(), suspend_related_updates():
+            for post_data in self.posts:
+                categories = post_data.pop("categories")
+                tags = post_data.pop("tags")
+                comments = post_data.pop("comments")
+                old_url = post_data.pop("old_url")
+                post_data = self.trunc(BlogPost, prompt, **post_data)
+                initial = {
+                    "title": post_data.pop("title"),
+                    "user": mezzanine_user,
+                }
+                if post_data["publish_date"] is None:
+                    post_data["status"] = CONTENT_STATUS_DRAFT
+                post, created = BlogPost.objects.get_or_create(**initial)
+                for k, v in post_data.items():
+                    setattr(post, k, v)
+                post.save()
                 if created and verbosity >= 1:
-                    print("Imported category: %s" % cat)
-                post.categories.add(cat)
-            for comment in comments:
-                comment = self.trunc(ThreadedComment, prompt, **comment)
-                comment["site"] = site
-                post.comments.create(**comment)
-                if verbosity >= 1:
-                    print("Imported comment by: %s" % comment["user_name"])
-            self.add_meta(post, tags, prompt, verbosity, old_url)
+                    print("Imported post: %s" % post)
+                for name in categories:
+                    cat = self.trunc(BlogCategory, prompt, title=name)
+                    if not cat["title"]:
+                        continue
+                    cat, created = BlogCategory.objects.get_or_create(**cat)
+                    if created and verbosity >= 1:
+                        print("Imported category: %s" % cat)
+                    post.categories.add(cat)
+                for comment in comments:
+                    comment = self.trunc(ThreadedComment, prompt, **comment)
+                    comment["site"] = site
+                    post.comments.create(**comment)
+                    if verbosity >= 1:
+                        print("Imported comment by: %s" % comment["user_name"])
+                self.add_meta(post, tags, prompt, verbosity, old_url)
 
-        # Create any pages imported (Wordpress can include pages)
-        in_menus = []
-        footer = [
-            menu[0]
-            for menu in settings.PAGE_MENU_TEMPLATES
-            if menu[-1] == "pages/menus/footer.html"
-        ]
-        if options["in_navigation"]:
-            in_menus = [menu[0] for menu in settings.PAGE_MENU_TEMPLATES]
-            if footer and not options["in_footer"]:
-                in_menus.remove(footer[0])
-        elif footer and options["in_footer"]:
-            in_menus = footer
-        parents = []
-        for page in self.pages:
-            tags = page.pop("tags")
-            old_url = page.pop("old_url")
-            old_id = page.pop("old_id")
-            old_parent_id = page.pop("old_parent_id")
-            page = self.trunc(RichTextPage, prompt, **page)
-            page["status"] = CONTENT_STATUS_PUBLISHED
-            page["in_menus"] = in_menus
-            page, created = RichTextPage.objects.get_or_create(**page)
-            if created and verbosity >= 1:
-                print("Imported page: %s" % page)
-            self.add_meta(page, tags, prompt, verbosity, old_url)
-            parents.append(
-                {
-                    "old_id": old_id,
-                    "old_parent_id": old_parent_id,
-                    "page": page,
-                }
-            )
+            # Create any pages imported (Wordpress can include pages)
+            in_menus = []
+            footer = [
+                menu[0]
+                for menu in settings.PAGE_MENU_TEMPLATES
+                if menu[-1] == "pages/menus/footer.html"
+            ]
+            if options["in_navigation"]:
+                in_menus = [menu[0] for menu in settings.PAGE_MENU_TEMPLATES]
+                if footer and not options["in_footer"]:
+                    in_menus.remove(footer[0])
+            elif footer and options["in_footer"]:
+                in_menus = footer
+            parents = []
+            for page in self.pages:
+                tags = page.pop("tags")
+                old_url = page.pop("old_url")
+                old_id = page.pop("old_id")
+                old_parent_id = page.pop("old_parent_id")
+                page = self.trunc(RichTextPage, prompt, **page)
+                page["status"] = CONTENT_STATUS_PUBLISHED
+                page["in_menus"] = in_menus
+                page, created = RichTextPage.objects.get_or_create(**page)
+                if created and verbosity >= 1:
+                    print("Imported page: %s" % page)
+                self.add_meta(page, tags, prompt, verbosity, old_url)
+                parents.append(
+                    {
+                        "old_id": old_id,
+                        "old_parent_id": old_parent_id,
+                        "page": page,
+                    }
+                )
 
         for obj in parents:
             if obj["old_parent_id"]:
@@ -281,12 +288,16 @@ class BaseImporterCommand(BaseCommand):
         Adds tags and a redirect for the given obj, which is a blog
         post or a page.
         """
+        keywords = []
         for tag in tags:
             keyword = self.trunc(Keyword, prompt, title=tag)
             keyword, created = Keyword.objects.get_or_create_iexact(**keyword)
-            obj.keywords.create(keyword=keyword)
+            keywords.append(keyword)
             if created and verbosity >= 1:
                 print("Imported tag: %s" % keyword)
+        if keywords:
+            field = obj._meta.get_field(obj.get_keywordsfield_name())
+            field.set_keywords(obj, keywords)
         if old_url is not None:
             old_path = urlparse(old_url).path
             if not old_path.strip("/"):
@@ -1,11 +1,14 @@
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
+from mezzanine.blog.archive import post_state, update_blog_months
 from mezzanine.conf import settings
 from mezzanine.core.fields import FileField
 from mezzanine.core.models import Displayable, Ownable, RichText, Slugged
 from mezzanine.generic.fields import CommentsField, RatingField
+from mezzanine.utils.cache import cache_installed, cache_tag, invalidate_cache_tags
 from mezzanine.utils.models import AdminThumbMixin, upload_to
 
 
@@ -34,8 +37,13 @@ class BlogPost(Displayable, Ownable, RichText, AdminThumbMixin):
     related_posts = models.ManyToManyField(
         "self", verbose_name=_("Related posts"), blank=True
     )
+    content_filtered = models.TextField(editable=False, blank=True, default="")
+    content_filtered_version = models.CharField(
+        editable=False, max_length=32, blank=True, default=""
+    )
 
     admin_thumb_field = "featured_image"
+    content_filtered_field = "content_filtered"
 
     class Meta:
         verbose_name = _("Blog post")
@@ -69,6 +77,40 @@ class BlogPost(Displayable, Ownable, RichText, AdminThumbMixin):
         return reverse(url_name, kwargs=kwargs)
 
 
+def blog_post_saving(sender, instance, raw=False, **kwargs):
+    """
+    Stores the state of the post before it's saved, for updating the
+    months in ``mezzanine.blog.archive``.
+    """
+    old = None
+    if instance.pk and not raw:
+        fields = ("status", "publish_date", "expiry_date")
+        old = BlogPost._base_manager.filter(pk=instance.pk).values(*fields).first()
+    instance._archive_state = post_state(old or {})
+
+
+def blog_post_changed(sender, instance, **kwargs):
+    """
+    Updates the months in ``mezzanine.blog.archive`` when a post is
+    published, unpublished or deleted.
+    """
+    if kwargs.get("raw"):
+        return
+    old_state = getattr(instance, "_archive_state", (None, None))
+    new_state = (None, None)
+    if kwargs.get("created") is not None:
+        # Saved rather than deleted.
+        new_state = post_state(instance)
+    else:
+        old_state = post_state(instance)
+    update_blog_months(instance.site_id, old_state, new_state, kwargs.get("using"))
+
+
+pre_save.connect(blog_post_saving, sender=BlogPost)
+post_save.connect(blog_post_changed, sender=BlogPost)
+post_delete.connect(blog_post_changed, sender=BlogPost)
+
+
 class BlogCategory(Slugged):
     """
     A category for grouping blog posts into a series.
@@ -81,3 +123,17 @@ class BlogCategory(Slugged):
 
     def get_absolute_url(self):
         return reverse("blog_post_list_category", kwargs={"category": self.slug})
+
+
+def invalidate_categories_cache(sender, **kwargs):
+    """
+    Invalidates cached pages and template tags listing blog
+    categories, when categories or their posts are changed.
+    """
+    if cache_installed():
+        invalidate_cache_tags(cache_tag(BlogCategory))
+
+
+post_save.connect(invalidate_categories_cache, sender=BlogCategory)
+post_delete.connect(invalidate_categories_cache, sender=BlogCategory)
+m2m_changed.connect(invalidate_categories_cache, sender=BlogPost.categories.through)
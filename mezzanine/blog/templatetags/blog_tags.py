@@ -1,38 +1,34 @@
-from datetime import datetime
-
 from django.contrib.auth import get_user_model
 from django.db.models import Count, Q
-from django.utils import timezone
 
 from mezzanine import template
+from mezzanine.blog.archive import get_blog_months
 from mezzanine.blog.forms import BlogPostForm
 from mezzanine.blog.models import BlogCategory, BlogPost
 from mezzanine.generic.models import Keyword
+from mezzanine.utils.cache import add_cache_tags
 
 User = get_user_model()
 
 register = template.Library()
 
+# Dependency tags for the cached sidebar tags, invalidated when blog
+# posts, categories or keywords change.
+BLOG_CACHE_TAGS = ("blog.blogpost", "blog.blogcategory", "generic.keyword")
+
 
 @register.as_tag
 def blog_months(*args):
     """
     Put a list of dates for blog posts into the template context.
+    Months are counted in the database and cached, see
+    ``mezzanine.blog.archive``.
     """
-    dates = BlogPost.objects.published().values_list("publish_date", flat=True)
-    tz = timezone.get_current_timezone()
-    dates = [d.astimezone(tz) for d in dates]
-    date_dicts = [{"date": datetime(d.year, d.month, 1)} for d in dates]
-    month_dicts = []
-    for date_dict in date_dicts:
-        if date_dict not in month_dicts:
-            month_dicts.append(date_dict)
-    for date_dict in month_dicts:
-        date_dict["post_count"] = date_dicts.count(date_dict)
-    return month_dicts
+    add_cache_tags("blog.blogpost")
+    return get_blog_months()
 
 
-@register.as_tag
+@register.as_tag(cache_tags=BLOG_CACHE_TAGS)
 def blog_categories(*args):
     """
     Put a list of categories for blog posts into the template context.
@@ -42,7 +38,7 @@ def blog_categories(*args):
     return list(categories.annotate(post_count=Count("blogposts")))
 
 
-@register.as_tag
+@register.as_tag(cache_tags=BLOG_CACHE_TAGS)
 def blog_authors(*args):
     """
     Put a list of authors (users) for blog posts into the template context.
@@ -52,7 +48,7 @@ def blog_authors(*args):
     return list(authors.annotate(post_count=Count("blogposts")))
 
 
-@register.as_tag
+@register.as_tag(cache_tags=BLOG_CACHE_TAGS)
 def blog_recent_posts(limit=5, tag=None, username=None, category=None):
     """
     Put a list of recently published blog posts into the template
@@ -4,20 +4,29 @@ consistent access method for settings defined in applications, the project
 or Django itself. Settings can also be made editable via the admin.
 """
 
+import threading
 from functools import partial
 from importlib import import_module
+from time import time
 from warnings import warn
 from weakref import WeakKeyDictionary
 
 from django.conf import settings as django_settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils.functional import Promise
 from django.utils.module_loading import module_has_submodule
+from django.utils.translation import get_language
 
 from mezzanine import __version__  # noqa
 from mezzanine.core.request import current_request
 
 registry = {}
 
+# Site IDs whose editable settings have changed in the current thread,
+# with their versions in cache incremented once the change commits.
+_changed_sites = threading.local()
+
 
 def register_setting(
     name=None,
@@ -119,6 +128,13 @@ class Settings:
         bytes: partial(bytes, encoding="utf8"),
     }
 
+    def __init__(self):
+        # Editable settings loaded from cache, kept for the lifetime of
+        # the process. These are assigned via ``__dict__`` since
+        # ``__setattr__`` forwards to Django's settings.
+        self.__dict__["_site_caches"] = {}
+        self.__dict__["_null_request_cache"] = {}
+
     @property
     def _current_request(self):
         return current_request() or self.NULL_REQUEST
@@ -139,15 +155,56 @@ class Settings:
             stacklevel=2,
         )
 
+    # When a cache backend is installed, the number of seconds that
+    # editable settings are reused for outside of a request, such as in
+    # management commands, before their version is checked again.
+    NULL_REQUEST_SECONDS = 1
+
     def clear_cache(self):
         """Clear the settings cache for the current request."""
         if hasattr(self, "_editable_caches"):
             self._editable_caches.pop(self._current_request, None)
+        self._null_request_cache.clear()
+
+    def invalidate_editable(self, site_id, using=None):
+        """
+        Called when editable settings for the given site are saved or
+        deleted. Clears the copies held by the current process, and
+        once the transaction is committed, bumps the version of the
+        site's settings stored in cache, so that every process loads
+        them again. Bumping the version any earlier would let another
+        process store the old settings under the new version.
+        """
+        from mezzanine.utils.cache import cache_installed
+
+        self.clear_cache()
+        self._site_caches.clear()
+        if cache_installed():
+            if not hasattr(_changed_sites, "site_ids"):
+                _changed_sites.site_ids = set()
+            _changed_sites.site_ids.add(site_id)
+            # Every setting changed adds a callback, but only the first
+            # to run has any versions left to increment.
+            transaction.on_commit(self._increment_versions, using=using)
+
+    def _increment_versions(self):
+        site_ids = getattr(_changed_sites, "site_ids", set())
+        while site_ids:
+            version_key, _ = self._cache_keys(site_ids.pop())
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                pass
+        self._site_caches.clear()
+
+    def _cache_keys(self, site_id, language=""):
+        prefix = f"{django_settings.CACHE_MIDDLEWARE_KEY_PREFIX}.settings.{site_id}"
+        return f"{prefix}.version", f"{prefix}.{language}"
 
     def _get_editable(self, request):
         """
         Get the dictionary of editable settings for a given request. Settings
-        are fetched from the database once per request and then stored in
+        are fetched once per request and then stored in
         ``_editable_caches``, a WeakKeyDictionary that will automatically
         discard each entry when no more references to the request exist.
         """
@@ -157,14 +214,79 @@ class Settings:
             # to ensure that the database is hit at most once per request, and that each
             # request sees the same settings for its duration.
             self._editable_caches = WeakKeyDictionary()
+        null_request_key = None
+        if request is self.NULL_REQUEST:
+            # Outside of a request, the site and language can change
+            # between calls, e.g. with ``override_current_site_id``.
+            null_request_key = self._site_language()
+            try:
+                loaded, editable_settings = self._null_request_cache[null_request_key]
+            except KeyError:
+                pass
+            else:
+                if time() - loaded < self.NULL_REQUEST_SECONDS:
+                    return editable_settings
         try:
             editable_settings = self._editable_caches[request]
         except KeyError:
-            editable_settings = self._load()
+            editable_settings, shared = self._load_shared()
             if request is not self.NULL_REQUEST:
                 self._editable_caches[request] = editable_settings
+            elif shared:
+                self._null_request_cache[null_request_key] = (
+                    time(),
+                    editable_settings,
+                )
         return editable_settings
 
+    def _site_language(self):
+        """
+        Returns the current site ID and language, which editable
+        settings are stored in cache for.
+        """
+        from mezzanine.utils.sites import current_site_id
+
+        language = ""
+        if self.USE_MODELTRANSLATION:
+            language = get_language() or ""
+        return current_site_id(), language
+
+    def _load_shared(self):
+        """
+        When a cache backend is installed, editable settings are stored
+        in cache for each site, along with a version number for each
+        site that's incremented whenever they change. A copy is also
+        kept for the lifetime of the process, so that loading settings
+        only requires reading the version from cache. Returns the
+        settings, and whether they came from the cache.
+        """
+        from mezzanine.utils.cache import cache_installed
+
+        if not cache_installed():
+            return self._load(), False
+        site_id, language = self._site_language()
+        version_key, settings_key = self._cache_keys(site_id, language)
+        version = cache.get(version_key)
+        if version is None:
+            # Start from the current time rather than zero, so that
+            # settings left in cache from before the version was
+            # evicted can't match it again.
+            cache.add(version_key, int(time() * 1000), None)
+            version = cache.get(version_key)
+        try:
+            loaded_version, editable_settings = self._site_caches[settings_key]
+        except KeyError:
+            loaded_version = None
+        if loaded_version != version:
+            packed = cache.get(settings_key)
+            if packed is not None and packed[0] == version:
+                editable_settings = packed[1]
+            else:
+                editable_settings = self._load()
+                cache.set(settings_key, (version, editable_settings), None)
+            self._site_caches[settings_key] = (version, editable_settings)
+        return editable_settings, True
+
     @classmethod
     def _to_python(cls, setting, raw_value):
         """
@@ -62,6 +62,10 @@ def settings(request=None):
     Add the settings object to the template context.
     """
     from mezzanine.conf import settings
+    from mezzanine.utils.cache import add_cache_tags
+
+    # Cached pages need to be invalidated when editable settings change.
+    add_cache_tags("conf.setting", request=request)
 
     allowed_settings = settings.TEMPLATE_ACCESSIBLE_SETTINGS
 
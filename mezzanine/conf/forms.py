@@ -1,6 +1,7 @@
 from collections import defaultdict
 
 from django import forms
+from django.db import transaction
 from django.template.defaultfilters import urlize
 from django.utils.safestring import mark_safe
 from django.utils.translation import activate, get_language
@@ -113,9 +114,11 @@ class SettingsForm(forms.Form):
                 fields[i].group = misc
         return iter(sorted(fields, key=lambda x: (x.group == misc, x.group)))
 
+    @transaction.atomic
     def save(self):
         """
-        Save each of the settings to the DB.
+        Save each of the settings to the DB, in a single transaction so
+        that cached settings are invalidated once.
         """
         active_language = get_language()
         for (name, value) in self.cleaned_data.items():
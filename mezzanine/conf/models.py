@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import gettext_lazy as _
 
+from mezzanine.conf import settings
 from mezzanine.core.models import SiteRelated
+from mezzanine.utils.cache import cache_installed, cache_tag, invalidate_cache_tags
 
 
 class Setting(SiteRelated):
@@ -18,3 +21,17 @@ class Setting(SiteRelated):
 
     def __str__(self):
         return f"{self.name}: {self.value}"
+
+
+def invalidate_settings_cache(sender, instance, **kwargs):
+    """
+    Invalidates cached editable settings and pages when editable
+    settings are changed.
+    """
+    settings.invalidate_editable(instance.site_id, kwargs.get("using"))
+    if cache_installed():
+        invalidate_cache_tags(cache_tag(Setting))
+
+
+post_save.connect(invalidate_settings_cache, sender=Setting)
+post_delete.connect(invalidate_settings_cache, sender=Setting)
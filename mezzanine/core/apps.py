@@ -1,3 +1,5 @@
+from importlib import import_module
+
 from django.apps import AppConfig
 
 
@@ -6,4 +8,14 @@ class CoreConfig(AppConfig):
     name = "mezzanine.core"
 
     def ready(self):
+        from mezzanine.conf import settings
+
         from . import checks  # noqa
+        from .thumbnails import media_library_changed
+
+        fb_name = getattr(settings, "PACKAGE_NAME_FILEBROWSER", "")
+        if fb_name in settings.INSTALLED_APPS:
+            fb_views = import_module(f"{fb_name}.views")
+            for action in ("upload", "rename", "delete"):
+                signal = getattr(fb_views, f"filebrowser_post_{action}")
+                signal.connect(media_library_changed)
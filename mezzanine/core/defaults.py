@@ -105,6 +105,31 @@ register_setting(
     default=30,
 )
 
+register_setting(
+    name="CACHE_LOCK_WAIT_SECONDS",
+    description=_(
+        "Number of seconds to wait for a cache entry that doesn't exist "
+        "yet, while it's being generated by another client. After this "
+        "time, the client will generate the entry itself. Set to ``0`` to "
+        "never wait."
+    ),
+    editable=False,
+    default=1,
+)
+
+register_setting(
+    name="CACHE_REFRESH_THREADS",
+    description=_(
+        "Number of background threads used to refresh cache entries "
+        "before they expire, when a refresh function is given to "
+        "``mezzanine.utils.cache.cache_get``. Entries are refreshed when "
+        "requested within ``CACHE_SET_DELAY_SECONDS`` of their expiry. "
+        "Set to ``0`` to disable background refreshing."
+    ),
+    editable=False,
+    default=0,
+)
+
 if "mezzanine.blog" in settings.INSTALLED_APPS:
     dashboard_tags = (
         ("blog_tags.quick_blog", "mezzanine_tags.app_list"),
@@ -500,6 +525,22 @@ register_setting(
     default=RICHTEXT_FILTER_LEVEL_HIGH,
 )
 
+register_setting(
+    name="SEARCH_BACKEND",
+    description=_(
+        "Dotted path to the class used to match search terms against "
+        "content. ``mezzanine.core.search.SimpleSearchBackend`` matches "
+        "terms against each search field with a ``LIKE`` query, while "
+        "``mezzanine.core.search.IndexSearchBackend`` maintains an index "
+        "of the words in each object's search fields, which is much "
+        "faster for large sites. After switching to the index, existing "
+        "content should be indexed with the ``rebuild_search_index`` "
+        "management command."
+    ),
+    editable=False,
+    default="mezzanine.core.search.SimpleSearchBackend",
+)
+
 register_setting(
     name="SEARCH_MODEL_CHOICES",
     description=_(
@@ -1017,6 +1058,19 @@ register_setting(
     default=".thumbnails",
 )
 
+register_setting(
+    name="THUMBNAILS_WORKERS",
+    description=_(
+        "Number of worker processes to generate thumbnails in. When "
+        "set, thumbnails are generated in the background rather than "
+        "while rendering the page that first uses them, which shows "
+        "the original image until they're ready. When zero, they're "
+        "generated while rendering."
+    ),
+    editable=False,
+    default=0,
+)
+
 register_setting(
     name="TINYMCE_SETUP_JS",
     description=_(
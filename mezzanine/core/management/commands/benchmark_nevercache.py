@@ -0,0 +1,68 @@
+from timeit import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import Context, Template
+
+from mezzanine.utils.cache import nevercache_render, nevercache_split, nevercache_token
+
+
+def split_compile_render(content, context):
+    """
+    Renders cached content the way it was before pages were stored
+    pre-split: splitting the full content on every request, and
+    compiling a new template for each ``nevercache`` fragment.
+    """
+    parts = content.split(nevercache_token().encode("utf-8"))
+    for i, part in enumerate(parts):
+        if i % 2:
+            part = Template(part.decode("utf-8")).render(context).encode("utf-8")
+        parts[i] = part
+    return b"".join(parts)
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks the second phase of rendering performed for pages served
+    from cache, comparing the pre-split format stored in cache against
+    splitting the content and compiling each ``nevercache`` fragment on
+    every request.
+    """
+
+    help = "Benchmarks rendering nevercache fragments of cached pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fragments",
+            type=int,
+            default=20,
+            help="Number of nevercache fragments in the page. Defaults to 20.",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=500,
+            help="Number of times the page is rendered. Defaults to 500.",
+        )
+
+    def handle(self, **options):
+        fragments = options["fragments"]
+        iterations = options["iterations"]
+        token = nevercache_token()
+        static = "<div>" + "lorem ipsum " * 500 + "</div>"
+        fragment = "{% if user %}{{ user }}{% else %}{{ value|upper }}{% endif %}"
+        content = (static + token + fragment + token) * fragments + static
+        content = content.encode("utf-8")
+        context = Context({"value": "anon"})
+
+        parts = nevercache_split(content)
+        if nevercache_render(parts, context) != split_compile_render(content, context):
+            raise CommandError("The rendered pages don't match")
+
+        split = timeit(
+            lambda: split_compile_render(content, context), number=iterations
+        )
+        packed = timeit(lambda: nevercache_render(parts, context), number=iterations)
+        self.stdout.write(f"{fragments} fragments, {iterations} iterations:")
+        self.stdout.write(f"  split and compiled per request: {split:.3f}s")
+        self.stdout.write(f"  pre-split, compiled once:       {packed:.3f}s")
+        self.stdout.write(f"  speedup:                        {split / packed:.1f}x")
@@ -0,0 +1,87 @@
+import os
+import re
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.template import engines
+from django.template.utils import get_app_template_dirs
+
+from mezzanine.conf import settings
+from mezzanine.core import richtext, thumbnails
+from mezzanine.core.fields import FileField
+from mezzanine.core.models import RichText
+
+# Matches ``thumbnail`` tags given a variable, width and height only,
+# capturing the last part of the variable, eg ``featured_image`` for
+# ``blog_post.featured_image``.
+THUMBNAIL_TAG = re.compile(r"{%\s*thumbnail\s+[\w.]*?(\w+)\s+(\d+)\s+(\d+)\s*%}")
+
+
+class Command(BaseCommand):
+    """
+    Generates the thumbnails used by templates, the admin and rich text
+    content ahead of time, so that pages don't generate them when first
+    viewed.
+
+    The sizes used by templates are found by searching them for the
+    ``thumbnail`` tag, and are generated for the file fields with the
+    same name as the variable given to the tag, eg ``featured_image``.
+    Rich text content is passed through ``RICHTEXT_FILTERS``, which
+    generates the thumbnails for its images by default.
+    """
+
+    help = "Generates the thumbnails used by templates and rich text content."
+
+    def template_sizes(self):
+        """
+        Returns the thumbnail sizes used in templates, mapped to the
+        names of the fields they're given.
+        """
+        dirs = set(get_app_template_dirs("templates"))
+        for engine in engines.all():
+            dirs.update(getattr(engine, "template_dirs", ()))
+        sizes = defaultdict(set)
+        for template_dir in dirs:
+            for root, _, filenames in os.walk(template_dir):
+                for filename in filenames:
+                    try:
+                        with open(os.path.join(root, filename)) as f:
+                            source = f.read()
+                    except (OSError, UnicodeDecodeError):
+                        continue
+                    for name, width, height in THUMBNAIL_TAG.findall(source):
+                        sizes[name].add((int(width), int(height)))
+        return sizes
+
+    def handle(self, **options):
+        verbosity = int(options.get("verbosity", 1))
+        sizes = self.template_sizes()
+        admin_size = tuple(int(i) for i in settings.ADMIN_THUMB_SIZE.split("x"))
+        for model in apps.get_models():
+            count = 0
+            admin_field = getattr(model, "admin_thumb_field", None)
+            for field in model._meta.local_fields:
+                if not isinstance(field, (models.FileField, FileField)):
+                    continue
+                field_sizes = set(sizes.get(field.name, ()))
+                if field.name == admin_field:
+                    field_sizes.add(admin_size)
+                if not field_sizes:
+                    continue
+                images = model._base_manager.exclude(**{field.name: ""})
+                for image in images.values_list(field.name, flat=True).iterator():
+                    for width, height in field_sizes:
+                        thumbnails.thumbnail(image, width, height)
+                        count += 1
+            fields = [f.name for f in model._meta.local_fields]
+            if issubclass(model, RichText) and "content" in fields:
+                contents = model._base_manager.values_list("content", flat=True)
+                for content in contents.iterator():
+                    richtext.apply_filters(content)
+                    count += 1
+            if count and verbosity >= 1:
+                name = model._meta.verbose_name_plural
+                self.stdout.write(f"Generated thumbnails for {count} {name}")
+        thumbnails.wait_for_pending()
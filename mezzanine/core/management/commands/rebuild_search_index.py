@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from mezzanine.core.models import Displayable, SearchTerm
+from mezzanine.core.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the search index for every ``Displayable`` instance
+    across all sites, for search backends that maintain an index,
+    such as ``mezzanine.core.search.IndexSearchBackend``.
+    """
+
+    help = "Rebuilds the search index for all content."
+
+    def handle(self, **options):
+        verbosity = int(options.get("verbosity", 1))
+        backend = get_search_backend()
+        SearchTerm.objects.all().delete()
+        for model in apps.get_models():
+            # Instances of models using multi-table inheritance are
+            # indexed via their base concrete model, eg ``Page``.
+            if not issubclass(model, Displayable) or model._meta.parents:
+                continue
+            count = 0
+            for instance in model._base_manager.iterator():
+                backend.index(instance)
+                count += 1
+            if verbosity >= 1:
+                name = model._meta.verbose_name_plural
+                self.stdout.write(f"Indexed {count} {name}")
@@ -0,0 +1,77 @@
+from tempfile import TemporaryFile
+from urllib.parse import urljoin
+
+from django.contrib.sites.models import Site
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from mezzanine.core.sitemaps import (
+    get_sitemaps,
+    sitemap_index_urls,
+    sitemapindex_xml,
+    urlset_xml,
+)
+from mezzanine.utils.sites import current_site_id, override_current_site_id
+
+
+class Command(BaseCommand):
+    """
+    Renders the sitemap index and the sitemap for each page of each
+    model to files in the default storage, so that large sites can
+    serve them as static files. The index lists the URLs of the stored
+    sitemaps rather than those served by the ``sitemap_section`` view.
+    """
+
+    help = "Renders the sitemap index and sitemaps to files in storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--site", type=int, dest="site_id", help="ID of the site to render."
+        )
+        parser.add_argument(
+            "--protocol",
+            default="https",
+            help="Protocol of the URLs in the sitemaps. Defaults to https.",
+        )
+        parser.add_argument(
+            "--directory",
+            default="sitemaps",
+            help="Directory in storage to save the sitemaps in. "
+            "Defaults to sitemaps.",
+        )
+
+    def save(self, name, xml):
+        """
+        Writes the XML to a temporary file as it's generated, and
+        saves it to storage under the given name.
+        """
+        with TemporaryFile() as f:
+            for chunk in xml:
+                f.write(chunk.encode("utf-8"))
+            f.seek(0)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, File(f))
+        return name
+
+    def handle(self, **options):
+        verbosity = int(options.get("verbosity", 1))
+        site_id = options["site_id"] or current_site_id()
+        directory = options["directory"].strip("/")
+        with override_current_site_id(site_id):
+            domain = Site.objects.get(id=site_id).domain
+            base_url = f"{options['protocol']}://{domain}"
+            sitemaps = get_sitemaps()
+
+            def section_url(section, page):
+                name = f"{directory}/sitemap-{section}-{page}.xml"
+                self.save(name, urlset_xml(sitemaps[section].urls(page, base_url)))
+                if verbosity >= 2:
+                    self.stdout.write(f"Rendered {name}")
+                return urljoin(base_url, default_storage.url(name))
+
+            index = sitemap_index_urls(sitemaps, section_url)
+            name = self.save(f"{directory}/sitemap.xml", sitemapindex_xml(index))
+        if verbosity >= 1:
+            self.stdout.write(f"Rendered {len(index)} sitemaps to {name}")
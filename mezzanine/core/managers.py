@@ -1,18 +1,33 @@
+import heapq
 from functools import reduce
-from operator import iand, ior
+from itertools import islice
+from operator import ior
 from string import punctuation
 
 import django
 from django.apps import apps
 from django.contrib.sites.managers import CurrentSiteManager as DjangoCSM
 from django.core.exceptions import ImproperlyConfigured
-from django.db.models import CharField, Manager, Q, TextField
+from django.db.models import (
+    Case,
+    CharField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Manager,
+    Q,
+    TextField,
+    Value,
+    When,
+)
+from django.db.models.functions import Power
 from django.db.models.manager import ManagerDescriptor
 from django.db.models.query import QuerySet
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 from mezzanine.conf import settings
+from mezzanine.core.search import Age, get_search_backend
 from mezzanine.utils.sites import current_site_id
 from mezzanine.utils.urls import home_slug
 
@@ -158,43 +173,7 @@ class SearchableQuerySet(QuerySet):
 
         # ### BUILD QUERYSET FILTER ###
 
-        # Create the queryset combining each set of terms.
-        excluded = [
-            reduce(
-                iand,
-                [
-                    ~Q(**{"%s__icontains" % f: t[1:]})
-                    for f in self._search_fields.keys()
-                ],
-            )
-            for t in terms
-            if t[0:1] == "-"
-        ]
-        required = [
-            reduce(
-                ior,
-                [Q(**{"%s__icontains" % f: t[1:]}) for f in self._search_fields.keys()],
-            )
-            for t in terms
-            if t[0:1] == "+"
-        ]
-        optional = [
-            reduce(
-                ior, [Q(**{"%s__icontains" % f: t}) for f in self._search_fields.keys()]
-            )
-            for t in terms
-            if t[0:1] not in "+-"
-        ]
-        queryset = self
-        if excluded:
-            queryset = queryset.filter(reduce(iand, excluded))
-        if required:
-            queryset = queryset.filter(reduce(iand, required))
-        # Optional terms aren't relevant to the filter if there are
-        # terms that are explicitly required.
-        elif optional:
-            queryset = queryset.filter(reduce(ior, optional))
-        return queryset.distinct()
+        return get_search_backend().search(self, terms)
 
     def _clone(self, *args, **kwargs):
         """
@@ -216,9 +195,12 @@ class SearchableQuerySet(QuerySet):
 
     def annotate_scores(self):
         """
-        If search has occurred and no ordering has occurred, decorate
-        each result with the number of search terms so that it can be
-        sorted by the number of occurrence of terms.
+        If search has occurred and no ordering has occurred, annotate
+        each result with a ``result_count`` score, calculated in the
+        database from the number of occurrences of the search terms,
+        weighted by search field and scaled down by age according to
+        the ``SEARCH_AGE_SCALE_FACTOR`` setting, and order the results
+        by it.
 
         In the case of search fields that span model relationships, we
         cannot accurately match occurrences without some very
@@ -228,30 +210,99 @@ class SearchableQuerySet(QuerySet):
         we assume one match for one of the fields, and use the average
         weight of all search fields with relationships.
         """
-        results = super().iterator()
-        if self._search_terms and not self._search_ordered:
-            results = list(results)
-            for i, result in enumerate(results):
-                count = 0
-                related_weights = []
-                for (field, weight) in self._search_fields.items():
-                    if "__" in field:
-                        related_weights.append(weight)
-                    for term in self._search_terms:
-                        field_value = getattr(result, field, None)
-                        if field_value:
-                            count += field_value.lower().count(term) * weight
-                if not count and related_weights:
-                    count = int(sum(related_weights) / len(related_weights))
-
-                if result.publish_date:
-                    age = (now() - result.publish_date).total_seconds()
-                    if age > 0:
-                        count = count / age**settings.SEARCH_AGE_SCALE_FACTOR
-
-                results[i].result_count = count
-            return iter(results)
-        return results
+        if not self._search_terms or self._search_ordered:
+            return self
+        queryset = self.annotate(search_score=get_search_backend().score(self))
+        count = F("search_score")
+        related_weights = [w for f, w in self._search_fields.items() if "__" in f]
+        if related_weights:
+            count = Case(
+                When(
+                    search_score=0,
+                    then=Value(float(sum(related_weights) // len(related_weights))),
+                ),
+                default=count,
+            )
+        factor = settings.SEARCH_AGE_SCALE_FACTOR
+        fields = [f.name for f in self.model._meta.get_fields()]
+        if factor and "publish_date" in fields:
+            count = Case(
+                When(
+                    publish_date__lt=now(),
+                    then=count / Power(Age("publish_date"), Value(float(factor))),
+                ),
+                default=count,
+            )
+        queryset = queryset.annotate(
+            result_count=ExpressionWrapper(count, output_field=FloatField())
+        )
+        # Bypass our order_by, since ordering by score isn't an
+        # ordering chosen by the caller.
+        return QuerySet.order_by(queryset, "-result_count", "-pk")
+
+
+class SearchResults:
+    """
+    Results of ``SearchableManager.search`` across several models.
+    Each model's results are scored and ordered in the database by
+    ``SearchableQuerySet.annotate_scores``, and merged by score as
+    they're read, so taking a slice of the results, such as a page of
+    them, only loads as many rows from each model as the end of the
+    slice. Supports ``count``, ``len``, iteration, indexing and
+    slicing, so it can be given to Django's ``Paginator``.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self._count = None
+        self._results = None
+
+    def __repr__(self):
+        return "<%s: %s>" % (self.__class__.__name__, list(self))
+
+    def count(self):
+        if self._results is not None:
+            return len(self._results)
+        if self._count is None:
+            self._count = sum(queryset.count() for queryset in self.querysets)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        return self.count() > 0
+
+    def merge(self, limit=None):
+        """
+        Returns an iterator of the results of every model, ordered by
+        score, limiting each model to the given number of results.
+        """
+        querysets = self.querysets
+        if limit is not None:
+            querysets = [queryset[:limit] for queryset in querysets]
+        key = lambda result: getattr(result, "result_count", 0)
+        return heapq.merge(*querysets, key=key, reverse=True)
+
+    def __iter__(self):
+        if self._results is None:
+            self._results = list(self.merge())
+        return iter(self._results)
+
+    def __getitem__(self, k):
+        if self._results is not None:
+            return self._results[k]
+        if isinstance(k, slice):
+            start, stop = k.start or 0, k.stop
+            if k.step or start < 0 or (stop is not None and stop < 0):
+                return list(self)[k]
+            return list(islice(self.merge(stop), start, stop))
+        if k < 0:
+            return list(self)[k]
+        try:
+            return next(islice(self.merge(k + 1), k, None))
+        except StopIteration:
+            raise IndexError("Search result index out of range")
 
 
 class SearchableManager(Manager):
@@ -377,15 +428,15 @@ class SearchableManager(Manager):
             models -= parents
         else:
             models = [self.model]
-        all_results = []
+        querysets = []
         user = kwargs.pop("for_user", None)
         for model in models:
             try:
                 queryset = model.objects.published(for_user=user)
             except AttributeError:
                 queryset = model.objects.get_queryset()
-            all_results.extend(queryset.search(*args, **kwargs).annotate_scores())
-        return sorted(all_results, key=lambda r: r.result_count, reverse=True)
+            querysets.append(queryset.search(*args, **kwargs).annotate_scores())
+        return SearchResults(querysets)
 
 
 class CurrentSiteManager(DjangoCSM):
@@ -4,8 +4,9 @@ from functools import lru_cache
 from django.contrib import admin
 from django.contrib.auth import logout
 from django.contrib.messages import error
-from django.contrib.redirects.models import Redirect
 from django.core.exceptions import MiddlewareNotUsed
+from django.core.paginator import Page
+from django.db.models import Model, QuerySet
 from django.http import (
     HttpResponse,
     HttpResponseGone,
@@ -13,7 +14,7 @@ from django.http import (
     HttpResponseRedirect,
 )
 from django.middleware.csrf import CsrfViewMiddleware, get_token
-from django.template import RequestContext, Template
+from django.template import RequestContext
 from django.urls import resolve, reverse
 from django.utils.cache import get_max_age
 from django.utils.deprecation import MiddlewareMixin
@@ -25,17 +26,20 @@ from mezzanine.core.management.commands.createdb import (
     DEFAULT_PASSWORD,
     DEFAULT_USERNAME,
 )
-from mezzanine.core.models import SitePermission
+from mezzanine.core.redirects import get_redirect
 from mezzanine.utils.cache import (
     cache_get,
     cache_installed,
     cache_key_prefix,
+    cache_release,
     cache_set,
-    nevercache_token,
+    cache_tag,
+    nevercache_render,
+    nevercache_split,
 )
 from mezzanine.utils.conf import middlewares_or_subclasses_installed
 from mezzanine.utils.deprecation import is_authenticated
-from mezzanine.utils.sites import current_site_id
+from mezzanine.utils.sites import current_site_id, user_site_ids
 from mezzanine.utils.urls import next_url
 
 
@@ -88,10 +92,7 @@ class SitePermissionMiddleware(MiddlewareMixin):
         if request.user.is_superuser:
             has_site_permission = True
         elif request.user.is_staff:
-            lookup = {"user": request.user, "sites": current_site_id()}
-            try:
-                SitePermission.objects.get(**lookup)
-            except SitePermission.DoesNotExist:
+            if int(current_site_id()) not in user_site_ids(request.user):
                 admin_index = reverse("admin:index")
                 if request.path.startswith(admin_index):
                     logout(request)
@@ -146,10 +147,18 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         # Caching is only applicable for text-based, non-streaming
         # responses. We also skip it for non-200 statuses during
         # development, so that stack traces are correctly rendered.
+        # A response marked for updating that isn't cached must release
+        # the lock acquired on the cache get miss, so that other
+        # clients don't wait for it.
+        marked_for_update = getattr(request, "_update_cache", False)
+        if marked_for_update:
+            cache_key = cache_key_prefix(request) + request.get_full_path()
         is_text = response.get("content-type", "").startswith("text")
         valid_status = response.status_code == 200
         streaming = getattr(response, "streaming", False)
         if not is_text or streaming or (settings.DEBUG and not valid_status):
+            if marked_for_update:
+                cache_release(cache_key)
             return response
 
         # Cache the response if all the required conditions are met.
@@ -158,14 +167,19 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         # user must not be authenticated, the HTTP status must be OK
         # and the response mustn't include an expiry age, indicating it
         # shouldn't be cached.
-        marked_for_update = getattr(request, "_update_cache", False)
         anon = hasattr(request, "user") and not is_authenticated(request.user)
         timeout = get_max_age(response)
         if timeout is None:
             timeout = settings.CACHE_MIDDLEWARE_SECONDS
-        if anon and valid_status and marked_for_update and timeout:
-            cache_key = cache_key_prefix(request) + request.get_full_path()
-            _cache_set = lambda r: cache_set(cache_key, r.content, timeout)
+        if marked_for_update and not (anon and valid_status and timeout):
+            cache_release(cache_key)
+        elif marked_for_update:
+
+            def _cache_set(r):
+                r._nevercache_parts = nevercache_split(r.content)
+                tags = response_cache_tags(request, r)
+                cache_set(cache_key, r._nevercache_parts, timeout, tags=tags)
+
             if callable(getattr(response, "render", None)):
                 response.add_post_render_callback(_cache_set)
             else:
@@ -175,12 +189,11 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         # content. Split on the delimiter the ``nevercache`` tag
         # wrapped its contents in, and render only the content
         # enclosed by it, to avoid possible template code injection.
-        token = nevercache_token()
-        try:
-            token = token.encode("utf-8")
-        except AttributeError:
-            pass
-        parts = response.content.split(token)
+        # Responses served from cache by ``FetchFromCacheMiddleware``
+        # are already split, so only the enclosed content is rendered.
+        parts = getattr(response, "_nevercache_parts", None)
+        if parts is None:
+            parts = nevercache_split(response.content)
         # Restore csrf token from cookie - check the response
         # first as it may be being set for the first time.
         csrf_token = None
@@ -193,12 +206,7 @@ class UpdateCacheMiddleware(MiddlewareMixin):
                 pass
         if csrf_token:
             request.META["CSRF_COOKIE"] = csrf_token
-        context = RequestContext(request)
-        for i, part in enumerate(parts):
-            if i % 2:
-                part = Template(part.decode("utf-8")).render(context).encode("utf-8")
-            parts[i] = part
-        response.content = b"".join(parts)
+        response.content = nevercache_render(parts, RequestContext(request))
         response["Content-Length"] = len(response.content)
         if hasattr(request, "_messages"):
             # Required to clear out user messages.
@@ -213,6 +221,29 @@ class UpdateCacheMiddleware(MiddlewareMixin):
         return response
 
 
+def response_cache_tags(request, response):
+    """
+    Returns the dependency tags for a response being cached: the
+    current page, model instances in the response's template context,
+    the models of querysets and paginated lists in it, and any tags
+    added while rendering with ``mezzanine.utils.cache.add_cache_tags``.
+    """
+    tags = set(getattr(request, "_cache_tags", ()))
+    page = getattr(request, "page", None)
+    if page is not None:
+        tags.add(cache_tag(page))
+    context = getattr(response, "context_data", None)
+    if isinstance(context, dict):
+        for value in context.values():
+            if isinstance(value, Page):
+                value = value.object_list
+            if isinstance(value, Model):
+                tags.add(cache_tag(value))
+            elif isinstance(value, QuerySet):
+                tags.add(cache_tag(value.model))
+    return tags
+
+
 @lru_cache(maxsize=None)
 def csrf_middleware_installed():
     csrf_mw_name = "django.middleware.csrf.CsrfViewMiddleware"
@@ -244,7 +275,12 @@ class FetchFromCacheMiddleware(MiddlewareMixin):
             if response is None:
                 request._update_cache = True
             else:
-                return HttpResponse(response)
+                if isinstance(response, bytes):
+                    # Entry cached prior to responses being stored split.
+                    response = nevercache_split(response)
+                cached_response = HttpResponse()
+                cached_response._nevercache_parts = response
+                return cached_response
 
 
 class SSLRedirectMiddleware(MiddlewareMixin):
@@ -307,7 +343,9 @@ class SSLRedirectMiddleware(MiddlewareMixin):
 class RedirectFallbackMiddleware(MiddlewareMixin):
     """
     Port of Django's ``RedirectFallbackMiddleware`` that uses
-    Mezzanine's approach for determining the current site.
+    Mezzanine's approach for determining the current site, and looks
+    up redirects in a table held by each process, see
+    ``mezzanine.core.redirects``.
     """
 
     def __init__(self, *args, **kwargs):
@@ -317,17 +355,9 @@ class RedirectFallbackMiddleware(MiddlewareMixin):
 
     def process_response(self, request, response):
         if response.status_code == 404:
-            lookup = {
-                "site_id": current_site_id(),
-                "old_path": request.get_full_path(),
-            }
-            try:
-                redirect = Redirect.objects.get(**lookup)
-            except Redirect.DoesNotExist:
-                pass
-            else:
-                if not redirect.new_path:
-                    response = HttpResponseGone()
-                else:
-                    response = HttpResponsePermanentRedirect(redirect.new_path)
+            new_path = get_redirect(current_site_id(), request.get_full_path())
+            if new_path == "":
+                response = HttpResponseGone()
+            elif new_path is not None:
+                response = HttpResponsePermanentRedirect(new_path)
         return response
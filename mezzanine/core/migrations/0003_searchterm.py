@@ -0,0 +1,52 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("core", "0002_auto_20150414_2140"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=100, verbose_name="Term")),
+                ("object_pk", models.IntegerField()),
+                ("field", models.CharField(max_length=100, verbose_name="Field")),
+                ("frequency", models.IntegerField(verbose_name="Frequency")),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.ContentType",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Search term",
+                "verbose_name_plural": "Search terms",
+                "indexes": [
+                    models.Index(
+                        fields=["term", "content_type", "object_pk"],
+                        name="core_search_term_2a0500_idx",
+                    ),
+                    models.Index(
+                        fields=["content_type", "object_pk"],
+                        name="core_search_content_34d947_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -4,10 +4,13 @@ from urllib.request import urlopen
 
 from django.apps import apps
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.sites.models import Site
 from django.db import models
 from django.db.models.base import ModelBase
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.template.defaultfilters import truncatewords_html
 from django.utils.html import format_html, strip_tags
+from django.utils.safestring import mark_safe
 from django.utils.timesince import timesince
 from django.utils.timezone import now
 from django.utils.translation import gettext
@@ -17,9 +20,15 @@ from mezzanine.conf import settings
 from mezzanine.core.fields import OrderField, RichTextField
 from mezzanine.core.managers import CurrentSiteManager, DisplayableManager
 from mezzanine.generic.fields import KeywordsField
+from mezzanine.utils.cache import cache_installed, cache_tag, invalidate_cache_tags
 from mezzanine.utils.html import TagCloser
 from mezzanine.utils.models import base_concrete_model, get_user_model_name
-from mezzanine.utils.sites import current_request, current_site_id
+from mezzanine.utils.sites import (
+    current_request,
+    current_site_id,
+    invalidate_site_permissions,
+    invalidate_sites,
+)
 from mezzanine.utils.urls import admin_url, slugify, unique_slug
 
 user_model_name = get_user_model_name()
@@ -181,11 +190,12 @@ class MetaData(models.Model):
                     if isinstance(field, field_type) and field.name != "description":
                         description = getattr(self, field.name)
                         if description:
-                            from mezzanine.core.templatetags.mezzanine_tags import (
-                                richtext_filters,
-                            )
+                            from mezzanine.core import richtext
 
-                            description = richtext_filters(description)
+                            if isinstance(self, RichText) and field.name == "content":
+                                description = self.filtered_content()
+                            else:
+                                description = richtext.filter_content(description)
                             break
         # Fall back to the title if description couldn't be determined.
         if not description:
@@ -269,6 +279,10 @@ class Displayable(Slugged, MetaData, TimeStamped):
     objects = wrapped_manager(DisplayableManager)
     search_fields = {"keywords": 10, "title": 5}
 
+    # Fields loaded for each item listed in the sitemap, which are all
+    # that ``get_absolute_url`` and ``lastmod`` need.
+    sitemap_fields = ("slug", "publish_date", "updated")
+
     class Meta:
         abstract = True
 
@@ -409,11 +423,65 @@ class RichText(models.Model):
 
     content = RichTextField(_("Content"))
 
+    # Name of a field that ``content`` is stored in when saved, after
+    # passing it through ``RICHTEXT_FILTERS``, so that it isn't
+    # filtered again when rendered. The hash of the content and the
+    # filters' settings it was filtered with is stored in a field of
+    # the same name with a ``_version`` suffix.
+    content_filtered_field = None
+
     search_fields = ("content",)
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        """
+        Store the filtered content if ``content_filtered_field`` is
+        set.
+        """
+        field = self.content_filtered_field
+        update_fields = kwargs.get("update_fields")
+        if field and (update_fields is None or "content" in update_fields):
+            self.set_filtered_content()
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields)
+                kwargs["update_fields"].update((field, field + "_version"))
+        super().save(*args, **kwargs)
+
+    def set_filtered_content(self):
+        """
+        Stores the content passed through ``RICHTEXT_FILTERS`` in the
+        field named by ``content_filtered_field``.
+        """
+        from mezzanine.core import richtext, thumbnails
+
+        field = self.content_filtered_field
+        deferred = thumbnails.deferred_count()
+        filtered = richtext.filter_content(self.content)
+        version = richtext.content_version(self.content)
+        if thumbnails.deferred_count() != deferred:
+            # Thumbnails are still being generated, so filter the
+            # content again when it's next rendered.
+            version = ""
+        setattr(self, field, str(filtered))
+        setattr(self, field + "_version", version)
+
+    def filtered_content(self):
+        """
+        Returns the content passed through ``RICHTEXT_FILTERS``, using
+        the copy stored in ``content_filtered_field`` if it was
+        filtered from the current content with the current settings.
+        """
+        from mezzanine.core import richtext
+
+        field = self.content_filtered_field
+        if field and self.content:
+            version = getattr(self, field + "_version")
+            if version == richtext.content_version(self.content):
+                return mark_safe(getattr(self, field))
+        return richtext.filter_content(self.content)
+
 
 class OrderableBase(ModelBase):
     """
@@ -622,3 +690,97 @@ class SitePermission(models.Model):
     class Meta:
         verbose_name = _("Site permission")
         verbose_name_plural = _("Site permissions")
+
+
+def site_permission_changed(sender, instance, **kwargs):
+    """
+    Invalidates the cached site IDs for users whose ``SitePermission``
+    or its sites change.
+    """
+    if isinstance(instance, SitePermission):
+        user_ids = [instance.user_id]
+    elif kwargs.get("pk_set"):
+        permissions = SitePermission.objects.filter(id__in=kwargs["pk_set"])
+        user_ids = permissions.values_list("user_id", flat=True)
+    else:
+        user_ids = instance.sitepermission_set.values_list("user_id", flat=True)
+    for user_id in user_ids:
+        invalidate_site_permissions(user_id)
+
+
+post_save.connect(site_permission_changed, sender=SitePermission)
+post_delete.connect(site_permission_changed, sender=SitePermission)
+m2m_changed.connect(site_permission_changed, sender=SitePermission.sites.through)
+
+
+class SearchTerm(models.Model):
+    """
+    Entry in the inverted search index maintained by
+    ``mezzanine.core.search.IndexSearchBackend``, storing the number
+    of times a word occurs in a search field of an object.
+    """
+
+    term = models.CharField(_("Term"), max_length=100)
+    content_type = models.ForeignKey(
+        "contenttypes.ContentType", on_delete=models.CASCADE
+    )
+    object_pk = models.IntegerField()
+    field = models.CharField(_("Field"), max_length=100)
+    frequency = models.IntegerField(_("Frequency"))
+
+    class Meta:
+        verbose_name = _("Search term")
+        verbose_name_plural = _("Search terms")
+        indexes = [
+            models.Index(fields=["term", "content_type", "object_pk"]),
+            models.Index(fields=["content_type", "object_pk"]),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+def invalidate_displayable_cache(sender, instance, **kwargs):
+    """
+    Invalidates cached pages that depend on a ``Displayable`` instance,
+    or list instances of its model, when it's saved or deleted.
+    """
+    if isinstance(instance, Displayable) and cache_installed():
+        invalidate_cache_tags(cache_tag(instance), cache_tag(sender))
+
+
+post_save.connect(invalidate_displayable_cache)
+post_delete.connect(invalidate_displayable_cache)
+
+
+def index_displayable(sender, instance, **kwargs):
+    """
+    Updates the search index for a ``Displayable`` instance when it's
+    saved, for search backends that maintain an index.
+    """
+    if isinstance(instance, Displayable):
+        from mezzanine.core.search import get_search_backend
+
+        get_search_backend().index(instance)
+
+
+def unindex_displayable(sender, instance, **kwargs):
+    """
+    Removes a deleted ``Displayable`` instance from the search index.
+    """
+    if isinstance(instance, Displayable):
+        from mezzanine.core.search import get_search_backend
+
+        get_search_backend().unindex(instance)
+
+
+post_save.connect(index_displayable)
+post_delete.connect(unindex_displayable)
+post_save.connect(invalidate_sites, sender=Site)
+post_delete.connect(invalidate_sites, sender=Site)
+
+if "django.contrib.redirects" in settings.INSTALLED_APPS:
+    from mezzanine.core.redirects import invalidate_redirects
+
+    post_save.connect(invalidate_redirects, sender="redirects.Redirect")
+    post_delete.connect(invalidate_redirects, sender="redirects.Redirect")
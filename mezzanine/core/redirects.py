@@ -0,0 +1,166 @@
+"""
+Looks up the redirect for a path, for ``RedirectFallbackMiddleware``.
+
+The redirects for each site are loaded from the database once per
+process, into a dict of paths for exact redirects, and a trie of
+prefixes for redirects whose old path ends with ``*``, so that looking
+up the redirect for a path, including one that has no redirect, is
+done without any queries. The redirects are loaded again once a
+transaction saving or deleting any of the site's redirects commits,
+in every process when a cache backend is installed, via a version
+number stored in cache for each site. Without a cache backend, they're
+loaded again every ``RELOAD_SECONDS``, so that changes made in other
+processes are seen.
+"""
+import threading
+from time import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from mezzanine.conf import settings
+from mezzanine.utils.cache import cache_installed
+
+# Marks a node of a trie that ends a prefix, mapped to its new path.
+END = None
+
+# Redirect tables for each site ID, with the version of the site's
+# redirects they were loaded for, and when.
+_tables = {}
+
+# Seconds after which the redirects are loaded again when there's no
+# cache to share their version between processes.
+RELOAD_SECONDS = 10
+
+# Guards ``_tables``.
+_lock = threading.Lock()
+
+# Site IDs whose redirects have changed in the current thread, with
+# their tables invalidated once the change commits.
+_changed = threading.local()
+
+
+def _version_key(site_id):
+    # Don't use Mezzanine's cache_key_prefix here, since the site ID
+    # is already given.
+    return f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.redirects.{site_id}.version"
+
+
+def _redirects_version(site_id):
+    if not cache_installed():
+        return None
+    version_key = _version_key(site_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, int(time() * 1000), None)
+        version = cache.get(version_key)
+    return version
+
+
+def load_redirects(site_id):
+    """
+    Returns a dict of the site's exact redirects, mapping old paths to
+    new paths, and a trie of the prefixes of its redirects whose old
+    paths end with ``*``.
+    """
+    from django.contrib.redirects.models import Redirect
+
+    paths, prefixes = {}, {}
+    redirects = Redirect.objects.filter(site_id=site_id)
+    for old_path, new_path in redirects.values_list("old_path", "new_path"):
+        if old_path.endswith("*"):
+            node = prefixes
+            for char in old_path[:-1]:
+                node = node.setdefault(char, {})
+            node[END] = new_path
+        else:
+            paths[old_path] = new_path
+    return paths, prefixes
+
+
+def _match_prefix(prefixes, path):
+    """
+    Returns the new path for the longest prefix in the trie that the
+    path starts with, and the rest of the path after it.
+    """
+    match = None
+    node = prefixes
+    for i, char in enumerate(path):
+        if END in node:
+            match = (node[END], path[i:])
+        node = node.get(char)
+        if node is None:
+            return match
+    if END in node:
+        match = (node[END], "")
+    return match
+
+
+def get_redirect(site_id, path):
+    """
+    Returns the path that the given path redirects to for the site, an
+    empty string if the path is gone, or ``None`` if it has no
+    redirect. Redirects with old paths ending in ``*`` match any path
+    starting with the old path, using the longest match, and if their
+    new path also ends in ``*``, the rest of the path is appended to
+    it.
+    """
+    version = _redirects_version(site_id)
+    with _lock:
+        table = _tables.get(site_id)
+    if table is not None:
+        if table[0] != version:
+            table = None
+        elif version is None and time() - table[1] > RELOAD_SECONDS:
+            table = None
+    if table is None:
+        table = (version, time()) + load_redirects(site_id)
+        with _lock:
+            _tables[site_id] = table
+    _, _, paths, prefixes = table
+    try:
+        return paths[path]
+    except KeyError:
+        pass
+    match = _match_prefix(prefixes, path)
+    if match is None:
+        return None
+    new_path, rest = match
+    if new_path.endswith("*"):
+        new_path = new_path[:-1] + rest
+    return new_path
+
+
+def invalidate_redirects(sender, instance, using=None, **kwargs):
+    """
+    Called when a ``Redirect`` is saved or deleted. Marks the redirects
+    of its site as changed, to be invalidated once the transaction is
+    committed, since a table loaded any earlier could be kept with the
+    old redirects. Saving many redirects in a single transaction
+    invalidates each site's redirects once.
+    """
+    if not hasattr(_changed, "site_ids"):
+        _changed.site_ids = set()
+    _changed.site_ids.add(instance.site_id)
+    # Every redirect changed adds a callback, but only the first to
+    # run has any sites left to invalidate.
+    transaction.on_commit(_invalidate_changed, using=using)
+
+
+def _invalidate_changed():
+    """
+    Clears the tables of redirects held by the current process for the
+    sites whose redirects have changed, and increments the version of
+    each site's redirects stored in cache so that other processes load
+    them again.
+    """
+    site_ids = getattr(_changed, "site_ids", set())
+    while site_ids:
+        site_id = site_ids.pop()
+        with _lock:
+            _tables.pop(site_id, None)
+        if cache_installed():
+            try:
+                cache.incr(_version_key(site_id))
+            except ValueError:
+                pass
@@ -0,0 +1,142 @@
+"""
+Passes rich text content through the functions named in the
+``RICHTEXT_FILTERS`` setting.
+
+The functions are imported once, and the filtered HTML is memoized by
+a hash of the content and the version of the filters, which changes
+with any of the settings that control them. Filtered HTML is kept for
+``CACHE_MIDDLEWARE_SECONDS``, in the current process and also in the
+cache when it's installed, so that content rendered on many pages,
+such as blog post descriptions, is only filtered once.
+"""
+import threading
+import warnings
+from collections import OrderedDict
+from hashlib import md5
+from time import time
+
+from django.core.cache import cache
+from django.utils.safestring import SafeText, mark_safe
+
+from mezzanine.conf import settings
+from mezzanine.core import thumbnails
+from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.importing import import_dotted_path
+
+# Settings that change the output of the default filters, included in
+# the version of the filters.
+VERSION_SETTINGS = (
+    "RICHTEXT_FILTERS",
+    "RICHTEXT_FILTER_LEVEL",
+    "RICHTEXT_ALLOWED_TAGS",
+    "RICHTEXT_ALLOWED_ATTRIBUTES",
+    "RICHTEXT_ALLOWED_STYLES",
+    "MEDIA_URL",
+    "THUMBNAILS_DIR_NAME",
+)
+
+# Maximum number of filtered values memoized in the current process.
+MEMO_SIZE = 1000
+
+# Names and functions for the filters last imported.
+_filters = ((), ())
+
+# Filtered HTML memoized in the current process, mapping keys to their
+# expiry times and HTML, least recently used first.
+_memo = OrderedDict()
+
+# Guards ``_memo``.
+_lock = threading.Lock()
+
+
+def get_filters():
+    """
+    Returns the functions named in ``RICHTEXT_FILTERS``, importing
+    them when the setting changes.
+    """
+    global _filters
+    names = tuple(settings.RICHTEXT_FILTERS)
+    if _filters[0] != names:
+        _filters = (names, tuple(import_dotted_path(name) for name in names))
+    return zip(*_filters)
+
+
+def filters_version():
+    """
+    Returns a hash of the settings that control the output of the
+    filters, so that HTML filtered with different settings isn't used.
+    """
+    values = [getattr(settings, name, None) for name in VERSION_SETTINGS]
+    return md5(repr(values).encode("utf-8")).hexdigest()
+
+
+def apply_filters(content):
+    """
+    Passes the content through each of the filters without
+    memoization.
+    """
+    for filter_name, filter_func in get_filters():
+        content = filter_func(content)
+        if not isinstance(content, SafeText):
+            # raise TypeError(
+            # filter_name + " must mark it's return value as safe. See "
+            # "https://docs.djangoproject.com/en/stable/topics/security/"
+            # "#cross-site-scripting-xss-protection")
+            warnings.warn(
+                filter_name + " needs to ensure that any untrusted inputs are "
+                "properly escaped and mark the html it returns as safe. In a "
+                "future release this will cause an exception. See "
+                "https://docs.djangoproject.com/en/stable/topics/security/"
+                "cross-site-scripting-xss-protection",
+                FutureWarning,
+            )
+            content = mark_safe(content)
+    return content
+
+
+def content_version(content):
+    """
+    Returns a hash of the content and the version of the filters,
+    which identifies the content once filtered.
+    """
+    version = filters_version() + content
+    return md5(version.encode("utf-8")).hexdigest()
+
+
+def filter_content(content):
+    """
+    Returns the content passed through the filters, memoized by its
+    hash and the version of the filters.
+    """
+    if not isinstance(content, str):
+        return apply_filters(content)
+    version = content_version(content)
+    key = f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.richtext.{version}"
+    with _lock:
+        try:
+            expires, filtered = _memo[key]
+        except KeyError:
+            pass
+        else:
+            if expires > time():
+                _memo.move_to_end(key)
+                return mark_safe(filtered)
+            del _memo[key]
+
+    timeout = settings.CACHE_MIDDLEWARE_SECONDS
+    shared = cache_installed()
+    filtered = cache.get(key) if shared else None
+    if filtered is None:
+        deferred = thumbnails.deferred_count()
+        filtered = apply_filters(content)
+        if thumbnails.deferred_count() != deferred:
+            # Thumbnails are still being generated, so the HTML will
+            # change once they're ready.
+            return filtered
+        if shared:
+            cache.set(key, str(filtered), timeout)
+    with _lock:
+        _memo[key] = (time() + timeout, str(filtered))
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return mark_safe(filtered)
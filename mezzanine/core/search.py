@@ -0,0 +1,349 @@
+"""
+Search backends used by ``mezzanine.core.managers.SearchableQuerySet``
+to filter querysets by search terms. The backend used is configured by
+the ``SEARCH_BACKEND`` setting.
+"""
+import re
+from collections import Counter
+from functools import reduce
+from operator import iand, ior
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import (
+    Case,
+    DateTimeField,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    Func,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Length, Lower, Replace
+from django.utils.html import strip_tags
+from django.utils.timezone import now
+
+from mezzanine.conf import settings
+from mezzanine.utils.importing import import_dotted_path
+
+# Loaded backend instances, keyed by their import path.
+_backends = {}
+
+
+def get_search_backend():
+    """
+    Returns an instance of the search backend configured by the
+    ``SEARCH_BACKEND`` setting.
+    """
+    path = settings.SEARCH_BACKEND
+    try:
+        return _backends[path]
+    except KeyError:
+        backend = _backends[path] = import_dotted_path(path)()
+        return backend
+
+
+def tokenize(text):
+    """
+    Splits text into the lowercase words stored in the search index,
+    ignoring any HTML tags.
+    """
+    return re.findall(r"\w+", strip_tags(text).lower())
+
+
+class Age(Func):
+    """
+    Database function returning the number of seconds between the
+    given datetime expression and the current time.
+    """
+
+    output_field = FloatField()
+    template = "EXTRACT(EPOCH FROM (%(expressions)s))"
+    arg_joiner = " - "
+
+    def __init__(self, expression, **extra):
+        current = Value(now(), output_field=DateTimeField())
+        super().__init__(current, expression, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="(JULIANDAY(%(expressions)s)) * 86400.0",
+            arg_joiner=") - JULIANDAY(",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        # TIMESTAMPDIFF subtracts its first argument from its second.
+        clone = self.copy()
+        clone.set_source_expressions(self.get_source_expressions()[::-1])
+        return clone.as_sql(
+            compiler,
+            connection,
+            function="TIMESTAMPDIFF",
+            template="%(function)s(MICROSECOND, %(expressions)s) / 1000000.0",
+            arg_joiner=", ",
+            **extra_context,
+        )
+
+    def as_oracle(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="(CAST(%(expressions)s AS DATE)) * 86400",
+            arg_joiner=" AS DATE) - CAST(",
+            **extra_context,
+        )
+
+
+class SimpleSearchBackend:
+    """
+    Default search backend, which matches each search term against
+    each search field with a case-insensitive ``LIKE`` query.
+    """
+
+    def search(self, queryset, terms):
+        """
+        Filters the queryset by the given terms, which have already
+        been parsed from the search query by ``SearchableQuerySet``:
+        terms starting with ``+`` are required, terms starting with
+        ``-`` are excluded, and all other terms are optional.
+        """
+        search_fields = queryset._search_fields
+        excluded = [
+            reduce(
+                iand,
+                [~Q(**{"%s__icontains" % f: t[1:]}) for f in search_fields.keys()],
+            )
+            for t in terms
+            if t[0:1] == "-"
+        ]
+        required = [
+            reduce(
+                ior,
+                [Q(**{"%s__icontains" % f: t[1:]}) for f in search_fields.keys()],
+            )
+            for t in terms
+            if t[0:1] == "+"
+        ]
+        optional = [
+            reduce(ior, [Q(**{"%s__icontains" % f: t}) for f in search_fields.keys()])
+            for t in terms
+            if t[0:1] not in "+-"
+        ]
+        if excluded:
+            queryset = queryset.filter(reduce(iand, excluded))
+        if required:
+            queryset = queryset.filter(reduce(iand, required))
+        # Optional terms aren't relevant to the filter if there are
+        # terms that are explicitly required.
+        elif optional:
+            queryset = queryset.filter(reduce(ior, optional))
+        return queryset.distinct()
+
+    def score(self, queryset):
+        """
+        Returns an expression for the number of occurrences of the
+        queryset's search terms in its search fields, weighted by
+        search field, which ``SearchableQuerySet.annotate_scores``
+        uses to order results in the database. Search fields that
+        span relationships aren't counted.
+        """
+        score = Value(0.0)
+        for field, weight in queryset._search_fields.items():
+            if "__" in field:
+                continue
+            value = Lower(Coalesce(field, Value("")))
+            for term in queryset._search_terms:
+                removed = Length(value) - Length(Replace(value, Value(term)))
+                score += ExpressionWrapper(
+                    removed / len(term) * Value(float(weight)),
+                    output_field=FloatField(),
+                )
+        return score
+
+    def index(self, instance):
+        """
+        Called when a ``Displayable`` instance is saved. This backend
+        doesn't use an index, so there's nothing to do.
+        """
+
+    def unindex(self, instance):
+        """
+        Called when a ``Displayable`` instance is deleted.
+        """
+
+
+class IndexSearchBackend(SimpleSearchBackend):
+    """
+    Search backend that maintains an inverted index of the words in
+    the search fields of each ``Displayable`` instance, stored in the
+    ``SearchTerm`` model, so that terms are matched with indexed
+    lookups, and scored by the occurrences of the search terms stored
+    in the index.
+
+    Words are matched in full rather than as substrings. Quoted
+    phrases are matched against objects containing all of their words
+    first. Search fields that span relationships aren't indexed, and
+    fall back to the behaviour of ``SimpleSearchBackend``.
+
+    Existing content can be indexed with the ``rebuild_search_index``
+    management command.
+    """
+
+    def content_type(self, model):
+        """
+        Returns the content type index entries are stored against for
+        the given model. Models using multi-table inheritance share
+        the content type of their base concrete model, so that
+        searching a ``Page`` subclass matches entries stored for the
+        ``Page`` being saved, and vice versa.
+        """
+        from mezzanine.core.models import Displayable
+        from mezzanine.utils.models import base_concrete_model
+
+        return ContentType.objects.get_for_model(
+            base_concrete_model(Displayable, model)
+        )
+
+    def index(self, instance):
+        """
+        Replaces the index entries for the instance with the counts
+        of the words in each of its search fields.
+        """
+        from mezzanine.core.models import SearchTerm
+
+        content_model = getattr(instance, "content_model", None)
+        if content_model and content_model != instance._meta.model_name:
+            instance = instance.get_content_model()
+        self.unindex(instance)
+        content_type = self.content_type(type(instance))
+        max_length = SearchTerm._meta.get_field("term").max_length
+        search_fields = type(instance).objects.get_search_fields()
+        entries = []
+        for field in search_fields:
+            if "__" in field:
+                continue
+            value = getattr(instance, field, None)
+            if not value:
+                continue
+            for term, frequency in Counter(tokenize(str(value))).items():
+                if len(term) <= max_length:
+                    entries.append(
+                        SearchTerm(
+                            term=term,
+                            content_type=content_type,
+                            object_pk=instance.pk,
+                            field=field,
+                            frequency=frequency,
+                        )
+                    )
+        SearchTerm.objects.bulk_create(entries)
+
+    def unindex(self, instance):
+        """
+        Removes the index entries for the instance.
+        """
+        from mezzanine.core.models import SearchTerm
+
+        SearchTerm.objects.filter(
+            content_type=self.content_type(type(instance)),
+            object_pk=instance.pk,
+        ).delete()
+
+    def entries(self, queryset):
+        """
+        Returns the index entries for the queryset's model and its
+        indexed search fields.
+        """
+        from mezzanine.core.models import SearchTerm
+
+        fields = [f for f in queryset._search_fields if "__" not in f]
+        return SearchTerm.objects.filter(
+            content_type=self.content_type(queryset.model), field__in=fields
+        )
+
+    def term_filter(self, queryset, term):
+        """
+        Returns a ``Q`` object matching the given term, which may be a
+        quoted phrase containing several words.
+        """
+        search_fields = queryset._search_fields
+        words = tokenize(term)
+        related = [f for f in search_fields if "__" in f]
+        if not words:
+            related = list(search_fields)
+        matches = [
+            Q(pk__in=self.entries(queryset).filter(term=w).values("object_pk"))
+            for w in words
+        ]
+        if len(words) > 1:
+            # Check the exact phrase only against objects with every word.
+            local = [f for f in search_fields if "__" not in f]
+            phrase = [Q(**{"%s__icontains" % f: term}) for f in local]
+            matches.append(reduce(ior, phrase))
+        match = reduce(iand, matches) if matches else Q(pk__in=[])
+        for field in related:
+            match |= Q(**{"%s__icontains" % field: term})
+        return match
+
+    def search(self, queryset, terms):
+        from mezzanine.core.models import Displayable
+
+        if not issubclass(queryset.model, Displayable):
+            return super().search(queryset, terms)
+        term_filter = lambda t: self.term_filter(queryset, t)
+        excluded = [~term_filter(t[1:]) for t in terms if t[0:1] == "-"]
+        required = [term_filter(t[1:]) for t in terms if t[0:1] == "+"]
+        optional = [term_filter(t) for t in terms if t[0:1] not in "+-"]
+        if excluded:
+            queryset = queryset.filter(reduce(iand, excluded))
+        if required:
+            queryset = queryset.filter(reduce(iand, required))
+        elif optional:
+            queryset = queryset.filter(reduce(ior, optional))
+        if any("__" in f for f in queryset._search_fields):
+            queryset = queryset.distinct()
+        return queryset
+
+    def score(self, queryset):
+        """
+        Returns an expression for the number of occurrences of the
+        words in the queryset's search terms, weighted by the search
+        field they occur in, summed from the index.
+        """
+        from mezzanine.core.models import Displayable
+
+        if not issubclass(queryset.model, Displayable):
+            return super().score(queryset)
+        words = set()
+        for t in queryset._search_terms:
+            words.update(tokenize(t))
+        weight = Case(
+            *[
+                When(field=f, then=Value(float(w)))
+                for f, w in queryset._search_fields.items()
+                if "__" not in f
+            ],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+        scores = (
+            self.entries(queryset)
+            .filter(object_pk=OuterRef("pk"), term__in=words)
+            .values("object_pk")
+            .annotate(
+                score=Sum(
+                    ExpressionWrapper(
+                        F("frequency") * weight, output_field=FloatField()
+                    )
+                )
+            )
+            .values("score")
+        )
+        return Coalesce(Subquery(scores, output_field=FloatField()), Value(0.0))
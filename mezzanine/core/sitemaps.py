@@ -1,14 +1,23 @@
+from django.apps import apps
 from django.contrib.sitemaps import Sitemap
 from django.contrib.sites.models import Site
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger
+from django.db.models import F, Max
+from django.db.models.functions import Floor
+from django.utils.functional import cached_property
+from django.utils.html import escape
 
 from mezzanine.conf import settings
-from mezzanine.core.models import Displayable
+from mezzanine.core.models import Displayable, TimeStamped
 from mezzanine.utils.sites import current_site_id
+from mezzanine.utils.urls import home_slug
 
 blog_installed = "mezzanine.blog" in settings.INSTALLED_APPS
 if blog_installed:
     from mezzanine.blog.models import BlogPost
 
+SITEMAPS_XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
 
 class DisplayableSitemap(Sitemap):
     """
@@ -33,3 +42,186 @@ class DisplayableSitemap(Sitemap):
         """
         kwargs["site"] = Site.objects.get(id=current_site_id())
         return super().get_urls(**kwargs)
+
+
+class IDRangePaginator:
+    """
+    Splits a queryset into pages by ranges of IDs, rather than by
+    offsets, so that each page is read with a range query on the
+    primary key regardless of how deep into the queryset it is. IDs
+    are grouped into ranges of ``per_page``, and only the ranges that
+    contain items are numbered as pages, so gaps in the IDs don't
+    produce empty pages. Pages hold at most ``per_page`` items, and
+    may hold fewer.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @cached_property
+    def ranges(self):
+        """
+        Returns the index of each range of IDs that contains items, in
+        order, read with a single query grouping the IDs by range.
+        """
+        ranges = (
+            self.queryset.order_by()
+            .annotate(id_range=Floor(F("id") / self.per_page))
+            .values_list("id_range", flat=True)
+            .distinct()
+            .order_by("id_range")
+        )
+        return [int(i) for i in ranges]
+
+    @property
+    def num_pages(self):
+        return len(self.ranges) or 1
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1 or number > self.num_pages:
+            raise EmptyPage("That page contains no results")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        start = self.ranges[number - 1] * self.per_page if self.ranges else 0
+        object_list = self.queryset.filter(
+            id__gte=start, id__lt=start + self.per_page
+        ).order_by("id")
+        return Page(object_list, number, self)
+
+
+class DisplayableModelSitemap(Sitemap):
+    """
+    Sitemap for the published items of a single model that subclasses
+    ``Displayable``, split into pages by ranges of IDs. Only the fields
+    in the model's ``sitemap_fields`` are loaded for each item.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def items(self):
+        fields = ["id"] + [
+            name
+            for name in self.model.sitemap_fields
+            if name in {f.name for f in self.model._meta.concrete_fields}
+        ]
+        return (
+            self.model.objects.published()
+            .filter(in_sitemap=True)
+            .exclude(slug__startswith="http://")
+            .exclude(slug__startswith="https://")
+            .exclude(slug="/")
+            .only(*fields)
+            .order_by("id")
+        )
+
+    @cached_property
+    def paginator(self):
+        return IDRangePaginator(self.items(), self.limit)
+
+    def lastmod(self, obj):
+        if isinstance(obj, TimeStamped):
+            return obj.updated or obj.publish_date
+        return obj.publish_date
+
+    def get_latest_lastmod(self):
+        return self.items().order_by().aggregate(latest=Max("updated"))["latest"]
+
+    def urls(self, page, base_url):
+        """
+        Returns an iterator of the URL and last modified date of each
+        item on the given page, which reads them from the database in
+        chunks. Raises ``EmptyPage`` for a page out of range.
+        """
+        items = self.paginator.page(page).object_list.iterator(chunk_size=2000)
+        return ((base_url + self.location(i), self.lastmod(i)) for i in items)
+
+
+class HomeSitemap(Sitemap):
+    """
+    Sitemap for the homepage, which may not be a ``Displayable``.
+    """
+
+    def items(self):
+        return [home_slug()]
+
+    def location(self, item):
+        return item
+
+    def get_latest_lastmod(self):
+        return None
+
+    def urls(self, page, base_url):
+        self.paginator.validate_number(page)
+        return [(base_url + self.location(item), None) for item in self.items()]
+
+
+def get_sitemaps():
+    """
+    Returns a dict of sitemaps for the homepage and each model that
+    subclasses ``Displayable``, keyed by the name of the sitemap's
+    section. Models using multi-table inheritance are included via
+    their base concrete model, eg ``Page``.
+    """
+    sitemaps = {"home": HomeSitemap()}
+    for model in apps.get_models():
+        if not issubclass(model, Displayable) or model._meta.parents:
+            continue
+        if hasattr(model.objects, "published"):
+            sitemaps[model._meta.label_lower] = DisplayableModelSitemap(model)
+    return sitemaps
+
+
+def sitemap_index_urls(sitemaps, section_url):
+    """
+    Returns the URL and last modified date of each page of the given
+    sitemaps, given a function that returns the URL for a section name
+    and page number.
+    """
+    index = []
+    for section, sitemap in sitemaps.items():
+        lastmod = sitemap.get_latest_lastmod()
+        for page in sitemap.paginator.page_range:
+            index.append((section_url(section, page), lastmod))
+    return index
+
+
+def urlset_xml(urls):
+    """
+    Yields the XML for a sitemap, given the URLs and last modified
+    dates of its items.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<urlset xmlns="{SITEMAPS_XMLNS}">\n'
+    for loc, lastmod in urls:
+        yield "<url><loc>%s</loc>" % escape(loc)
+        if lastmod is not None:
+            yield "<lastmod>%s</lastmod>" % lastmod.strftime("%Y-%m-%d")
+        yield "</url>\n"
+    yield "</urlset>\n"
+
+
+def sitemapindex_xml(sitemaps):
+    """
+    Yields the XML for a sitemap index, given the URLs and last
+    modified dates of its sitemaps.
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<sitemapindex xmlns="{SITEMAPS_XMLNS}">\n'
+    for loc, lastmod in sitemaps:
+        yield "<sitemap><loc>%s</loc>" % escape(loc)
+        if lastmod is not None:
+            yield "<lastmod>%s</lastmod>" % lastmod.strftime("%Y-%m-%d")
+        yield "</sitemap>\n"
+    yield "</sitemapindex>\n"
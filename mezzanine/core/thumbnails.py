@@ -0,0 +1,387 @@
+"""
+Generates the resized images returned by the ``thumbnail`` template
+tag.
+
+Each thumbnail generated is recorded in a manifest stored in the
+cache for its image, so that rendering a thumbnail that already exists
+doesn't need to check for its file. The manifest for an image is
+cleared when its thumbnails are removed by the media library. When
+``THUMBNAILS_WORKERS`` is set, missing thumbnails are generated in a
+pool of worker processes rather than during the request that first
+renders them, and the original image is returned until the thumbnail
+is ready. Each thumbnail is only generated once at a time across all
+processes.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from urllib.parse import quote, unquote
+
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+from mezzanine.conf import settings
+from mezzanine.utils.cache import _hashed_key
+
+# Number of seconds thumbnails are recorded in the manifest for. This
+# bounds how long a thumbnail deleted outside of the media library is
+# missing for.
+MANIFEST_TIMEOUT = 60 * 60 * 24
+
+# Number of seconds after which a thumbnail being generated by another
+# process is assumed to have failed, and may be generated again.
+LOCK_TIMEOUT = 60
+
+# Process pool for generating thumbnails, created on first use when
+# ``THUMBNAILS_WORKERS`` is set.
+_pool = None
+
+# Thumbnails being generated by this process, mapping their URLs to
+# futures for their results.
+_pending = {}
+
+# Guards ``_pending`` and the creation of ``_pool``.
+_lock = threading.Lock()
+
+# Counts the thumbnails returned as pending in the current thread.
+_local = threading.local()
+
+
+def _manifest_key(image_url):
+    return _hashed_key(f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.thumbnails.{image_url}")
+
+
+def _lock_key(thumb_url):
+    return _hashed_key(f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.thumbnail.{thumb_url}")
+
+
+def thumbnail_paths(
+    image_url,
+    width,
+    height,
+    upscale=True,
+    left=0.5,
+    top=0.5,
+    padding=False,
+    padding_color="#fff",
+):
+    """
+    Returns the path of the image relative to ``MEDIA_URL``, and the
+    filesystem path and URL of its thumbnail for the given options.
+    """
+    image_url = unquote(str(image_url)).split("?")[0]
+    if image_url.startswith(settings.MEDIA_URL):
+        image_url = image_url.replace(settings.MEDIA_URL, "", 1)
+    image_dir, image_name = os.path.split(image_url)
+    image_prefix, image_ext = os.path.splitext(image_name)
+    thumb_name = f"{image_prefix}-{width}x{height}"
+    if not upscale:
+        thumb_name += "-no-upscale"
+    if left != 0.5 or top != 0.5:
+        left = min(1, max(0, left))
+        top = min(1, max(0, top))
+        thumb_name = f"{thumb_name}-{left}x{top}"
+    thumb_name += "-padded-%s" % padding_color if padding else ""
+    thumb_name = f"{thumb_name}{image_ext}"
+
+    # `image_name` is used here for the directory path, as each image
+    # requires its own sub-directory using its own name - this is so
+    # we can consistently delete all thumbnails for an individual
+    # image, which is something we do in filebrowser when a new image
+    # is written, allowing us to purge any previously generated
+    # thumbnails that may match a new image name.
+    thumb_dir = os.path.join(
+        settings.MEDIA_ROOT, image_dir, settings.THUMBNAILS_DIR_NAME, image_name
+    )
+    thumb_path = os.path.join(thumb_dir, thumb_name)
+    thumb_url = "{}/{}/{}".format(
+        settings.THUMBNAILS_DIR_NAME,
+        quote(image_name.encode("utf-8")),
+        quote(thumb_name.encode("utf-8")),
+    )
+    image_url_path = os.path.dirname(image_url)
+    if image_url_path:
+        thumb_url = f"{image_url_path}/{thumb_url}"
+    return image_url, thumb_path, thumb_url
+
+
+def generate(
+    image_url,
+    thumb_path,
+    thumb_url,
+    width,
+    height,
+    upscale=True,
+    quality=95,
+    left=0.5,
+    top=0.5,
+    padding=False,
+    padding_color="#fff",
+):
+    """
+    Resizes the image and saves it as the thumbnail, returning the
+    thumbnail's URL, or the image's URL if it couldn't be resized.
+    Run in the worker processes when ``THUMBNAILS_WORKERS`` is set.
+    """
+    from PIL import Image, ImageFile, ImageOps
+
+    thumb_dir = os.path.dirname(thumb_path)
+    if not os.path.exists(thumb_dir):
+        try:
+            os.makedirs(thumb_dir)
+        except OSError:
+            pass
+
+    image_ext = os.path.splitext(image_url)[1]
+    filetype = {".png": "PNG", ".gif": "GIF"}.get(image_ext.lower(), "JPEG")
+    left = min(1, max(0, left))
+    top = min(1, max(0, top))
+
+    f = default_storage.open(image_url)
+    try:
+        image = Image.open(f)
+    except:  # noqa
+        # Invalid image format.
+        return image_url
+
+    image_info = image.info
+
+    # Transpose to align the image to its orientation if necessary.
+    # If the image is transposed, delete the exif information as
+    # not all browsers support the CSS image-orientation:
+    # - http://caniuse.com/#feat=css-image-orientation
+    try:
+        orientation = image._getexif().get(0x0112)
+    except:  # noqa
+        orientation = None
+    if orientation:
+        methods = {
+            2: (Image.FLIP_LEFT_RIGHT,),
+            3: (Image.ROTATE_180,),
+            4: (Image.FLIP_TOP_BOTTOM,),
+            5: (Image.FLIP_LEFT_RIGHT, Image.ROTATE_90),
+            6: (Image.ROTATE_270,),
+            7: (Image.FLIP_LEFT_RIGHT, Image.ROTATE_270),
+            8: (Image.ROTATE_90,),
+        }.get(orientation, ())
+        if methods:
+            image_info.pop("exif", None)
+            for method in methods:
+                image = image.transpose(method)
+
+    to_width = int(width)
+    to_height = int(height)
+    from_width = image.size[0]
+    from_height = image.size[1]
+
+    if not upscale:
+        to_width = min(to_width, from_width)
+        to_height = min(to_height, from_height)
+
+    # Set dimensions.
+    if to_width == 0:
+        to_width = from_width * to_height // from_height
+    elif to_height == 0:
+        to_height = from_height * to_width // from_width
+    if image.mode not in ("P", "L", "RGBA") and filetype not in ("JPG", "JPEG"):
+        try:
+            image = image.convert("RGBA")
+        except:  # noqa
+            return image_url
+    # Required for progressive jpgs.
+    ImageFile.MAXBLOCK = 2 * (max(image.size) ** 2)
+
+    # Padding.
+    if padding and to_width and to_height:
+        from_ratio = float(from_width) / from_height
+        to_ratio = float(to_width) / to_height
+        pad_size = None
+        if to_ratio < from_ratio:
+            pad_height = int(to_height * (float(from_width) / to_width))
+            pad_size = (from_width, pad_height)
+            pad_top = (pad_height - from_height) // 2
+            pad_left = 0
+        elif to_ratio > from_ratio:
+            pad_width = int(to_width * (float(from_height) / to_height))
+            pad_size = (pad_width, from_height)
+            pad_top = 0
+            pad_left = (pad_width - from_width) // 2
+        if pad_size is not None:
+            pad_container = Image.new("RGBA", pad_size, padding_color)
+            pad_container.paste(image, (pad_left, pad_top))
+            image = pad_container
+
+    # Create the thumbnail.
+    to_size = (to_width, to_height)
+    to_pos = (left, top)
+    try:
+        image = ImageOps.fit(image, to_size, Image.LANCZOS, 0, to_pos)
+        image = image.save(thumb_path, filetype, quality=quality, **image_info)
+        # Push a remote copy of the thumbnail if MEDIA_URL is
+        # absolute.
+        if "://" in settings.MEDIA_URL:
+            with open(thumb_path, "rb") as f:
+                default_storage.save(unquote(thumb_url), File(f))
+    except Exception:
+        # If an error occurred, a corrupted image may have been saved,
+        # so remove it, otherwise the check for it existing will just
+        # return the corrupted image next time it's requested.
+        try:
+            os.remove(thumb_path)
+        except Exception:
+            pass
+        return image_url
+    return thumb_url
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.THUMBNAILS_WORKERS, initializer=_init_worker
+                )
+    return _pool
+
+
+def _record(image_url, thumb_url, result):
+    if result == thumb_url:
+        key = _manifest_key(image_url)
+        cache.set(key, (cache.get(key) or set()) | {thumb_url}, MANIFEST_TIMEOUT)
+
+
+def _done(image_url, thumb_url, future):
+    try:
+        if not future.cancelled() and future.exception() is None:
+            _record(image_url, thumb_url, future.result())
+    finally:
+        with _lock:
+            _pending.pop(thumb_url, None)
+        cache.delete(_lock_key(thumb_url))
+
+
+def _submit(args):
+    """
+    Submits the thumbnail to the process pool, unless it's already
+    being generated by this or another process.
+    """
+    image_url, thumb_url = args[0], args[2]
+    pool = _get_pool()
+    with _lock:
+        if thumb_url in _pending:
+            return
+        if not cache.add(_lock_key(thumb_url), True, LOCK_TIMEOUT):
+            return
+        future = _pending[thumb_url] = pool.submit(generate, *args)
+    future.add_done_callback(lambda future: _done(image_url, thumb_url, future))
+
+
+def deferred_count():
+    """
+    Returns the number of thumbnails that have been returned as the
+    original image in the current thread, while they were generated
+    in the background. Used to avoid storing HTML containing them.
+    """
+    return getattr(_local, "deferred", 0)
+
+
+def wait_for_pending():
+    """
+    Blocks until the thumbnails being generated by this process are
+    done, for the ``generate_thumbnails`` management command.
+    """
+    with _lock:
+        futures = list(_pending.values())
+    wait(futures)
+
+
+def forget(image_url):
+    """
+    Clears the thumbnails recorded in the manifest for the image,
+    when its thumbnails are removed.
+    """
+    image_url = thumbnail_paths(image_url, 0, 0)[0]
+    cache.delete(_manifest_key(image_url))
+
+
+def media_library_changed(sender, path="", filename="", **kwargs):
+    """
+    Receiver for the media library's upload, rename and delete
+    signals, which remove the thumbnails of the images changed.
+    """
+    from importlib import import_module
+
+    if "file" in kwargs:
+        forget(kwargs["file"].name)
+        return
+    functions = import_module(f"{settings.PACKAGE_NAME_FILEBROWSER}.functions")
+    directory = functions.get_directory()
+    for name in (filename, kwargs.get("new_filename")):
+        if name:
+            forget(os.path.join(directory, path, name))
+
+
+def thumbnail(
+    image_url,
+    width,
+    height,
+    upscale=True,
+    quality=95,
+    left=0.5,
+    top=0.5,
+    padding=False,
+    padding_color="#fff",
+):
+    """
+    Returns the URL of the thumbnail for the image, generating it if
+    it doesn't exist. See ``mezzanine.core.templatetags.mezzanine_tags``
+    for the arguments.
+    """
+    if not image_url:
+        return ""
+    try:
+        import PIL  # noqa
+    except ImportError:
+        return ""
+
+    image_url, thumb_path, thumb_url = thumbnail_paths(
+        image_url, width, height, upscale, left, top, padding, padding_color
+    )
+    if thumb_url in (cache.get(_manifest_key(image_url)) or ()):
+        return thumb_url
+
+    try:
+        thumb_exists = os.path.exists(thumb_path)
+    except UnicodeEncodeError:
+        # The image that was saved to a filesystem with utf-8 support,
+        # but somehow the locale has changed and the filesystem does not
+        # support utf-8.
+        from mezzanine.core.exceptions import FileSystemEncodingChanged
+
+        raise FileSystemEncodingChanged()
+    if thumb_exists:
+        # Thumbnail exists, record it and don't generate it.
+        _record(image_url, thumb_url, thumb_url)
+        return thumb_url
+    elif not default_storage.exists(image_url):
+        # Requested image does not exist, just return its URL.
+        return image_url
+
+    args = (image_url, thumb_path, thumb_url, width, height, upscale, quality)
+    args += (left, top, padding, padding_color)
+    if settings.THUMBNAILS_WORKERS:
+        # Return the original image until the thumbnail is generated.
+        _submit(args)
+        _local.deferred = deferred_count() + 1
+        return image_url
+    result = generate(*args)
+    _record(image_url, thumb_url, result)
+    return result
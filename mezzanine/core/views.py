@@ -7,9 +7,17 @@ from django.apps import apps
 from django.contrib import admin
 from django.contrib.admin.options import ModelAdmin
 from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.sites.models import Site
 from django.contrib.staticfiles import finders
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponse, HttpResponseNotFound, HttpResponseServerError
+from django.core.paginator import InvalidPage
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseNotFound,
+    HttpResponseServerError,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect
 from django.template.loader import get_template
 from django.template.response import TemplateResponse
@@ -19,8 +27,14 @@ from django.views.decorators.csrf import requires_csrf_token
 
 from mezzanine.conf import settings
 from mezzanine.core.forms import get_edit_form
-from mezzanine.core.models import Displayable, SitePermission
-from mezzanine.utils.sites import has_site_permission
+from mezzanine.core.models import Displayable
+from mezzanine.core.sitemaps import (
+    get_sitemaps,
+    sitemap_index_urls,
+    sitemapindex_xml,
+    urlset_xml,
+)
+from mezzanine.utils.sites import current_site_id, has_site_permission, user_site_ids
 from mezzanine.utils.urls import next_url
 from mezzanine.utils.views import is_editable, paginate
 
@@ -37,9 +51,7 @@ def set_site(request):
     """
     site_id = int(request.GET["site_id"])
     if not request.user.is_superuser:
-        try:
-            SitePermission.objects.get(user=request.user, sites=site_id)
-        except SitePermission.DoesNotExist:
+        if site_id not in user_site_ids(request.user):
             raise PermissionDenied
     request.session["site_id"] = site_id
     admin_url = reverse("admin:index")
@@ -186,6 +198,49 @@ def displayable_links_js(request):
     return HttpResponse(dumps([link[1] for link in sorted_links]))
 
 
+def _sitemap_response(xml):
+    response = StreamingHttpResponse(xml, content_type="application/xml")
+    response["X-Robots-Tag"] = "noindex, noodp, noarchive"
+    return response
+
+
+def _sitemap_base_url(request):
+    domain = Site.objects.get(id=current_site_id()).domain
+    return f"{request.scheme}://{domain}"
+
+
+def sitemap_index(request):
+    """
+    Sitemap index listing a sitemap for each page of each model that
+    subclasses ``Displayable``.
+    """
+    base_url = _sitemap_base_url(request)
+
+    def section_url(section, page):
+        url = reverse("sitemap_section", kwargs={"section": section})
+        return base_url + url + (f"?p={page}" if page > 1 else "")
+
+    index = sitemap_index_urls(get_sitemaps(), section_url)
+    return _sitemap_response(sitemapindex_xml(index))
+
+
+def sitemap_section(request, section):
+    """
+    Sitemap for one page of the items of a model that subclasses
+    ``Displayable``, given by the ``p`` querystring parameter, which
+    is streamed as it's read from the database.
+    """
+    try:
+        sitemap = get_sitemaps()[section]
+    except KeyError:
+        raise Http404("No sitemap available for section: %r" % section)
+    try:
+        urls = sitemap.urls(request.GET.get("p", 1), _sitemap_base_url(request))
+    except InvalidPage:
+        raise Http404("Page %s empty" % request.GET.get("p"))
+    return _sitemap_response(urlset_xml(urls))
+
+
 @requires_csrf_token
 def page_not_found(request, *args, **kwargs):
     """
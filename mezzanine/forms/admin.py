@@ -1,14 +1,11 @@
 from copy import deepcopy
-from csv import writer
-from datetime import datetime
-from io import BytesIO, StringIO
 from mimetypes import guess_type
 from os.path import join
 
 from django.contrib import admin
 from django.contrib.messages import info
 from django.core.files.storage import FileSystemStorage
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import re_path
 from django.utils.translation import gettext_lazy as _
@@ -17,11 +14,13 @@ from django.utils.translation import ngettext
 from mezzanine.conf import settings
 from mezzanine.core.admin import TabularDynamicInlineAdmin
 from mezzanine.core.forms import DynamicInlineAdminForm
+from mezzanine.forms.export import export_response
 from mezzanine.forms.forms import EntriesForm
 from mezzanine.forms.models import Field, FieldEntry, Form, FormEntry
 from mezzanine.pages.admin import PageAdmin
 from mezzanine.utils.static import static_lazy as static
-from mezzanine.utils.urls import admin_url, slugify
+from mezzanine.utils.urls import admin_url
+from mezzanine.utils.views import paginate
 
 fs = FileSystemStorage(location=settings.FORMS_UPLOAD_ROOT)
 
@@ -88,7 +87,8 @@ class FieldAdmin(TabularDynamicInlineAdmin):
 class FormAdmin(PageAdmin):
     """
     Admin class for the Form model. Includes the urls & views for exporting
-    form entries as CSV and downloading files uploaded via the forms app.
+    form entries as CSV or JSON Lines and downloading files uploaded via
+    the forms app.
     """
 
     class Media:
@@ -122,13 +122,19 @@ class FormAdmin(PageAdmin):
                 self.admin_site.admin_view(self.file_view),
                 name="form_file",
             ),
+            re_path(
+                r"^entry/(?P<entry_id>\d+)/file/(?P<field_id>\d+)/$",
+                self.admin_site.admin_view(self.entry_file_view),
+                name="form_entry_file",
+            ),
         ]
         return extra_urls + urls
 
     def entries_view(self, request, form_id):
         """
-        Displays the form entries in a HTML table with option to
-        export as CSV file.
+        Displays a page of the form entries in a HTML table with
+        options to export them as a CSV or JSON Lines file, which is
+        streamed as the entries are read.
         """
         if request.POST.get("back"):
             change_url = admin_url(Form, "change", form_id)
@@ -140,29 +146,9 @@ class FormAdmin(PageAdmin):
         submitted = entries_form.is_valid()
         if submitted:
             if request.POST.get("export"):
-                response = HttpResponse(content_type="text/csv")
-                timestamp = slugify(datetime.now().ctime())
-                fname = f"{form.slug}-{timestamp}.csv"
-                header = "attachment; filename=%s" % fname
-                response["Content-Disposition"] = header
-                queue = StringIO()
-                delimiter = settings.FORMS_CSV_DELIMITER
-                try:
-                    csv = writer(queue, delimiter=delimiter)
-                    writerow = csv.writerow
-                except TypeError:
-                    queue = BytesIO()
-                    delimiter = bytes(delimiter, encoding="utf-8")
-                    csv = writer(queue, delimiter=delimiter)
-                    writerow = lambda row: csv.writerow(
-                        [c.encode("utf-8") if hasattr(c, "encode") else c for c in row]
-                    )
-                writerow(entries_form.columns())
-                for row in entries_form.rows(csv=True):
-                    writerow(row)
-                data = queue.getvalue()
-                response.write(data)
-                return response
+                return export_response(entries_form, "csv")
+            elif request.POST.get("export_jsonl"):
+                return export_response(entries_form, "jsonl")
             elif request.POST.get("delete") and can_delete_entries:
                 selected = request.POST.getlist("selected")
                 if selected:
@@ -174,6 +160,16 @@ class FormAdmin(PageAdmin):
                             "1 entry deleted", "%(count)s entries deleted", count
                         )
                         info(request, message % {"count": count})
+            entries_page = paginate(
+                entries_form.entries(),
+                request.POST.get("page", 1),
+                settings.FORMS_ENTRIES_PER_PAGE,
+                settings.MAX_PAGING_LINKS,
+            )
+            entries = list(entries_page.object_list)
+            entry_rows = list(entries_form.rows(entries=entries))
+        else:
+            entries_page = entry_rows = None
         template = "admin/forms/entries.html"
         context = {
             "title": _("View Entries"),
@@ -182,20 +178,39 @@ class FormAdmin(PageAdmin):
             "original": form,
             "can_delete_entries": can_delete_entries,
             "submitted": submitted,
+            "entries_page": entries_page,
+            "entry_rows": entry_rows,
         }
         return render(request, template, context)
 
-    def file_view(self, request, field_entry_id):
+    def file_response(self, value):
         """
-        Output the file for the requested field entry.
+        Output the uploaded file stored with the given value.
         """
-        field_entry = get_object_or_404(FieldEntry, id=field_entry_id)
-        path = join(fs.location, field_entry.value)
+        path = join(fs.location, value)
         response = HttpResponse(content_type=guess_type(path)[0])
         with open(path, "r+b") as f:
             response["Content-Disposition"] = "attachment; filename=%s" % f.name
             response.write(f.read())
         return response
 
+    def file_view(self, request, field_entry_id):
+        """
+        Output the file for the requested field entry.
+        """
+        field_entry = get_object_or_404(FieldEntry, id=field_entry_id)
+        return self.file_response(field_entry.value)
+
+    def entry_file_view(self, request, entry_id, field_id):
+        """
+        Output the file for the requested field of an entry, however
+        the entry is stored.
+        """
+        entry = get_object_or_404(FormEntry, id=entry_id)
+        value = entry.get_field_values().get(int(field_id))
+        if not value:
+            raise Http404
+        return self.file_response(value)
+
 
 admin.site.register(Form, FormAdmin)
@@ -20,6 +20,13 @@ register_setting(
     default=2000,
 )
 
+register_setting(
+    name="FORMS_ENTRIES_PER_PAGE",
+    description=_("Number of form entries shown per page when viewing entries."),
+    editable=False,
+    default=100,
+)
+
 register_setting(
     name="FORMS_CSV_DELIMITER",
     description=_(
@@ -29,6 +36,29 @@ register_setting(
     default=",",
 )
 
+register_setting(
+    name="FORMS_EXPORT_CHUNK_SIZE",
+    description=_(
+        "Number of form entries read from the database at a time "
+        "when exporting or viewing form entries."
+    ),
+    editable=False,
+    default=500,
+)
+
+register_setting(
+    name="FORMS_ENTRY_STORAGE",
+    description=_(
+        "How the values of new form entries are stored. ``fields`` "
+        "stores a row for each field's value, and ``json`` stores the "
+        "values as a single JSON document on the entry, which requires "
+        "Django 3.1 or later. Existing entries can be converted to JSON "
+        "with the ``convert_form_entries`` management command."
+    ),
+    editable=False,
+    default="fields",
+)
+
 register_setting(
     name="FORMS_UPLOAD_ROOT",
     description=_("Absolute path for storing file uploads for the forms app."),
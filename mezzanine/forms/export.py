@@ -0,0 +1,75 @@
+"""
+Exports the entries of a form, as filtered by an ``EntriesForm``, in
+each of the formats in ``EXPORT_FORMATS``. Each format is written as
+the rows are read from the database, so that forms with very many
+entries can be exported without holding them all in memory, either
+streamed in a response by the ``entries_view`` admin view, or written
+to a file by the ``export_form_entries`` management command.
+"""
+import json
+from csv import writer
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from mezzanine.conf import settings
+from mezzanine.utils.urls import slugify
+
+
+class Echo:
+    """
+    File-like object that returns what's written to it, for getting
+    each line from a CSV writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_csv(entries_form):
+    """
+    Yields the header and each row of the entries as lines of CSV.
+    """
+    csv = writer(Echo(), delimiter=settings.FORMS_CSV_DELIMITER)
+    yield csv.writerow(entries_form.columns())
+    for row in entries_form.rows(csv=True):
+        yield csv.writerow(row)
+
+
+def export_jsonl(entries_form):
+    """
+    Yields each row of the entries as a line of JSON, mapping the
+    column names to the row's values.
+    """
+    columns = entries_form.columns()
+    for row in entries_form.rows(csv=True):
+        line = json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder)
+        yield line + "\n"
+
+
+# The function and content type for each export format.
+EXPORT_FORMATS = {
+    "csv": (export_csv, "text/csv"),
+    "jsonl": (export_jsonl, "application/x-ndjson"),
+}
+
+
+def export_filename(form, export_format):
+    """
+    Returns the name of the file to export the form's entries to.
+    """
+    timestamp = slugify(datetime.now().ctime())
+    return f"{form.slug}-{timestamp}.{export_format}"
+
+
+def export_response(entries_form, export_format="csv"):
+    """
+    Returns a response that streams the entries as an attachment in
+    the given format.
+    """
+    export, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(export(entries_form), content_type=content_type)
+    filename = export_filename(entries_form.form, export_format)
+    response["Content-Disposition"] = "attachment; filename=%s" % filename
+    return response
@@ -1,9 +1,10 @@
-from datetime import date, datetime
+from datetime import datetime, timedelta
 from os.path import join, split
 from uuid import uuid4
 
 from django import forms
 from django.core.files.storage import FileSystemStorage
+from django.db.models import Exists, OuterRef, Q
 from django.forms.widgets import SelectDateWidget
 from django.template import Template
 from django.urls import reverse
@@ -74,22 +75,72 @@ DATE_FILTER_CHOICES = (
     (FILTER_CHOICE_BETWEEN, _("Is between")),
 )
 
-# The filter function for each filter type
-FILTER_FUNCS = {
-    FILTER_CHOICE_CONTAINS: lambda val, field: val.lower() in field.lower(),
-    FILTER_CHOICE_DOESNT_CONTAIN: lambda val, field: val.lower() not in field.lower(),
-    FILTER_CHOICE_EQUALS: lambda val, field: val.lower() == field.lower(),
-    FILTER_CHOICE_DOESNT_EQUAL: lambda val, field: val.lower() != field.lower(),
-    FILTER_CHOICE_BETWEEN: lambda val_from, val_to, field: (
-        (not val_from or val_from <= field) and (not val_to or val_to >= field)
+
+def choice_query(choice):
+    """
+    Returns a query matching field values that include the given
+    choice, where values for multiple choices are separated by commas.
+    """
+    return (
+        Q(value=choice)
+        | Q(value__startswith="%s," % choice)
+        | Q(value__endswith=", %s" % choice)
+        | Q(value__contains=", %s," % choice)
+    )
+
+
+def any_choice_query(choices):
+    """
+    Returns a query matching field values that include any of the
+    given choices.
+    """
+    query = Q()
+    for choice in choices:
+        query |= choice_query(choice)
+    return query
+
+
+def all_choices_query(choices, field_choices):
+    """
+    Returns a query matching field values that include all of the
+    given choices, and none of the field's other choices.
+    """
+    query = Q()
+    for choice in set(choices) | set(field_choices):
+        if choice in choices:
+            query &= choice_query(choice)
+        else:
+            query &= ~choice_query(choice)
+    return query
+
+
+def between_query(val_from, val_to):
+    """
+    Returns a query matching date values between the given dates,
+    comparing the dates as strings in ISO format, as stored for date
+    and date/time fields.
+    """
+    query = Q()
+    if val_from:
+        query &= Q(value__gte=str(val_from))
+    if val_to:
+        query &= Q(value__lt=str(val_to + timedelta(days=1)))
+    return query
+
+
+# The query for field values that match each filter type
+FILTER_QUERIES = {
+    FILTER_CHOICE_CONTAINS: lambda val: Q(value__icontains=val),
+    FILTER_CHOICE_DOESNT_CONTAIN: lambda val: ~Q(value__icontains=val),
+    FILTER_CHOICE_EQUALS: lambda val: Q(value__iexact=val),
+    FILTER_CHOICE_DOESNT_EQUAL: lambda val: ~Q(value__iexact=val),
+    FILTER_CHOICE_BETWEEN: between_query,
+    FILTER_CHOICE_CONTAINS_ANY: lambda val, choices: any_choice_query(val),
+    FILTER_CHOICE_CONTAINS_ALL: all_choices_query,
+    FILTER_CHOICE_DOESNT_CONTAIN_ANY: lambda val, choices: ~any_choice_query(val),
+    FILTER_CHOICE_DOESNT_CONTAIN_ALL: lambda val, choices: ~all_choices_query(
+        val, choices
     ),
-    FILTER_CHOICE_CONTAINS_ANY: lambda val, field: set(val) & set(split_choices(field)),
-    FILTER_CHOICE_CONTAINS_ALL: lambda val, field: set(val)
-    == set(split_choices(field)),
-    FILTER_CHOICE_DOESNT_CONTAIN_ANY: lambda val, field: not set(val)
-    & set(split_choices(field)),
-    FILTER_CHOICE_DOESNT_CONTAIN_ALL: lambda val, field: set(val)
-    != set(split_choices(field)),
 }
 
 # Export form fields for each filter type grouping
@@ -129,8 +180,7 @@ class FormForForm(forms.ModelForm):
         # with its field values.
         field_entries = {}
         if kwargs.get("instance"):
-            for field_entry in kwargs["instance"].fields.all():
-                field_entries[field_entry.field_id] = field_entry.value
+            field_entries = kwargs["instance"].get_field_values()
         super().__init__(*args, **kwargs)
         # Create the form fields.
         for field in self.form_fields:
@@ -200,15 +250,16 @@ class FormForForm(forms.ModelForm):
 
     def save(self, **kwargs):
         """
-        Create a ``FormEntry`` instance and related ``FieldEntry``
-        instances for each form field.
+        Create a ``FormEntry`` instance with the value of each form
+        field, stored either in the entry's JSON document, or as
+        related ``FieldEntry`` instances, according to the
+        ``FORMS_ENTRY_STORAGE`` setting. Existing entries keep the
+        storage they were created with.
         """
         entry = super().save(commit=False)
         entry.form = self.form
         entry.entry_time = now()
-        entry.save()
-        entry_fields = entry.fields.values_list("field_id", flat=True)
-        new_entry_fields = []
+        field_values = {}
         for field in self.form_fields:
             field_key = "field_%s" % field.id
             value = self.cleaned_data[field_key]
@@ -216,12 +267,22 @@ class FormForForm(forms.ModelForm):
                 value = fs.save(join("forms", str(uuid4()), value.name), value)
             if isinstance(value, list):
                 value = ", ".join(v.strip() for v in value)
-            if field.id in entry_fields:
-                field_entry = entry.fields.get(field_id=field.id)
+            field_values[field.id] = value
+        json_storage = settings.FORMS_ENTRY_STORAGE == "json"
+        if entry.values is not None or (entry.pk is None and json_storage):
+            entry.set_field_values(field_values)
+            entry.save()
+            return entry
+        entry.save()
+        entry_fields = entry.fields.values_list("field_id", flat=True)
+        new_entry_fields = []
+        for field_id, value in field_values.items():
+            if field_id in entry_fields:
+                field_entry = entry.fields.get(field_id=field_id)
                 field_entry.value = value
                 field_entry.save()
             else:
-                new = {"entry": entry, "field_id": field.id, "value": value}
+                new = {"entry": entry, "field_id": field_id, "value": value}
                 new_entry_fields.append(FieldEntry(**new))
         if new_entry_fields:
             FieldEntry.objects.bulk_create(new_entry_fields)
@@ -344,102 +405,110 @@ class EntriesForm(forms.Form):
             fields.append(self.entry_time_name)
         return fields
 
-    def rows(self, csv=False):
+    def filter_query(self, field):
+        """
+        Returns the query for the values of the given field that match
+        its selected filter, or ``None`` if it isn't filtered.
         """
-        Returns each row based on the selected criteria.
+        field_key = "field_%s" % field.id
+        filter_type = self.cleaned_data.get("%s_filter" % field_key)
+        if not filter_type:
+            return None
+        if filter_type == FILTER_CHOICE_BETWEEN:
+            val_from = self.cleaned_data["%s_from" % field_key]
+            val_to = self.cleaned_data["%s_to" % field_key]
+            if not (val_from or val_to):
+                return None
+            return FILTER_QUERIES[filter_type](val_from, val_to)
+        filter_args = [self.cleaned_data["%s_contains" % field_key]]
+        if not filter_args[0]:
+            return None
+        if field.is_a(*(fields.CHOICES + fields.MULTIPLE)):
+            filter_args.append([choice for choice, label in field.get_choices()])
+        return FILTER_QUERIES[filter_type](*filter_args)
+
+    def entries(self):
+        """
+        Returns the entries for the form that match the selected
+        filters, newest first. An entry is excluded by a field's
+        filter when it has a value for the field that doesn't match
+        it, which is checked with a subquery on the field entries, and
+        another on the values of entries stored as JSON documents, so
+        that only the matching entries are read from the database.
+        """
+        entries = self.form.entries.all()
+        if self.cleaned_data["field_0_filter"] == FILTER_CHOICE_BETWEEN:
+            time_from = self.cleaned_data["field_0_from"]
+            time_to = self.cleaned_data["field_0_to"]
+            if time_from and time_to:
+                entries = entries.filter(entry_time__range=(time_from, time_to))
+        for field in self.form_fields:
+            query = self.filter_query(field)
+            if query is not None:
+                unmatched = FieldEntry.objects.filter(
+                    entry=OuterRef("pk"), field_id=field.id
+                ).exclude(query)
+                unmatched_value = FormEntry.objects.field_value(field.id)
+                unmatched_value = unmatched_value.filter(pk=OuterRef("pk"))
+                unmatched_value = unmatched_value.exclude(query)
+                name = "field_%s_unmatched" % field.id
+                entries = entries.annotate(
+                    **{
+                        name: Exists(unmatched),
+                        name + "_value": Exists(unmatched_value),
+                    }
+                )
+                entries = entries.filter(**{name: False, name + "_value": False})
+        return entries.order_by("-id")
+
+    def rows(self, csv=False, entries=None):
+        """
+        Returns each row based on the selected criteria, for the given
+        entries if specified, otherwise for all of the entries that
+        match the selected filters.
         """
 
         # Store the index of each field against its ID for building each
         # entry row with columns in the correct order. Also store the IDs of
-        # fields with a type of FileField or Date-like for special handling of
-        # their values.
+        # fields with a type of FileField for special handling of their
+        # values.
         field_indexes = {}
         file_field_ids = []
-        date_field_ids = []
         for field in self.form_fields:
             if self.cleaned_data["field_%s_export" % field.id]:
                 field_indexes[field.id] = len(field_indexes)
                 if field.is_a(fields.FILE):
                     file_field_ids.append(field.id)
-                elif field.is_a(*fields.DATES):
-                    date_field_ids.append(field.id)
         num_columns = len(field_indexes)
         include_entry_time = self.cleaned_data["field_0_export"]
         if include_entry_time:
             num_columns += 1
 
-        # Get the field entries for the given form and filter by entry_time
-        # if specified.
-        field_entries = (
-            FieldEntry.objects.filter(entry__form=self.form)
-            .order_by("-entry__id")
-            .select_related("entry")
-        )
-        if self.cleaned_data["field_0_filter"] == FILTER_CHOICE_BETWEEN:
-            time_from = self.cleaned_data["field_0_from"]
-            time_to = self.cleaned_data["field_0_to"]
-            if time_from and time_to:
-                field_entries = field_entries.filter(
-                    entry__entry_time__range=(time_from, time_to)
-                )
-
-        # Loop through each field value ordered by entry, building up each
-        # entry as a row. Use the ``valid_row`` flag for marking a row as
-        # invalid if it fails one of the filtering criteria specified.
-        current_entry = None
-        current_row = None
-        valid_row = True
-        for field_entry in field_entries:
-            if field_entry.entry_id != current_entry:
-                # New entry, write out the current row and start a new one.
-                if valid_row and current_row is not None:
+        # Loop through the entries, building each one as a row from its
+        # field values. The entries are read in chunks rather than all
+        # at once, so that rows can be exported as they're built.
+        if entries is None:
+            entries = self.entries()
+        chunk_size = settings.FORMS_EXPORT_CHUNK_SIZE
+        for entry in FormEntry.objects.with_values(entries, chunk_size):
+            row = [""] * num_columns
+            for field_id, value in entry.get_field_values().items():
+                # Only use values for fields that were selected.
+                if field_id not in field_indexes:
+                    continue
+                field_value = value or ""
+                # Create download URL for file fields.
+                if value and field_id in file_field_ids:
+                    url = reverse("admin:form_entry_file", args=(entry.id, field_id))
+                    field_value = url
+                    if self.request is not None:
+                        field_value = self.request.build_absolute_uri(url)
                     if not csv:
-                        current_row.insert(0, current_entry)
-                    yield current_row
-                current_entry = field_entry.entry_id
-                current_row = [""] * num_columns
-                valid_row = True
-                if include_entry_time:
-                    current_row[-1] = field_entry.entry.entry_time
-            field_value = field_entry.value or ""
-            # Check for filter.
-            field_id = field_entry.field_id
-            filter_type = self.cleaned_data.get("field_%s_filter" % field_id)
-            filter_args = None
-            if filter_type:
-                if filter_type == FILTER_CHOICE_BETWEEN:
-                    f, t = "field_%s_from" % field_id, "field_%s_to" % field_id
-                    filter_args = [self.cleaned_data[f], self.cleaned_data[t]]
-                else:
-                    field_name = "field_%s_contains" % field_id
-                    filter_args = self.cleaned_data[field_name]
-                    if filter_args:
-                        filter_args = [filter_args]
-            if filter_args:
-                # Convert dates before checking filter.
-                if field_id in date_field_ids:
-                    y, m, d = field_value.split(" ")[0].split("-")
-                    dte = date(int(y), int(m), int(d))
-                    filter_args.append(dte)
-                else:
-                    filter_args.append(field_value)
-                filter_func = FILTER_FUNCS[filter_type]
-                if not filter_func(*filter_args):
-                    valid_row = False
-            # Create download URL for file fields.
-            if field_entry.value and field_id in file_field_ids:
-                url = reverse("admin:form_file", args=(field_entry.id,))
-                field_value = self.request.build_absolute_uri(url)
-                if not csv:
-                    parts = (field_value, split(field_entry.value)[1])
-                    field_value = mark_safe('<a href="%s">%s</a>' % parts)
-            # Only use values for fields that were selected.
-            try:
-                current_row[field_indexes[field_id]] = field_value
-            except KeyError:
-                pass
-        # Output the final row.
-        if valid_row and current_row is not None:
+                        parts = (field_value, split(value)[1])
+                        field_value = mark_safe('<a href="%s">%s</a>' % parts)
+                row[field_indexes[field_id]] = field_value
+            if include_entry_time:
+                row[-1] = entry.entry_time
             if not csv:
-                current_row.insert(0, current_entry)
-            yield current_row
+                row.insert(0, entry.id)
+            yield row
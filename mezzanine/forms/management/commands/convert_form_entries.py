@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mezzanine.forms.models import FieldEntry, Form, FormEntry, JSONField
+
+
+class Command(BaseCommand):
+    """
+    Converts form entries stored as a ``FieldEntry`` for each field
+    into entries storing their values in a single JSON document, a
+    batch of entries at a time, each batch in its own transaction so
+    that the command can be stopped and run again. Used along with
+    setting ``FORMS_ENTRY_STORAGE`` to ``json`` for new entries.
+    """
+
+    help = "Converts form entries stored as field entries into JSON documents."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--form",
+            help="ID or slug of the form to convert the entries of. "
+            "Defaults to all forms.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of entries to convert in each batch.",
+        )
+
+    def convert(self, entries):
+        """
+        Stores the field entries of the given entries in their JSON
+        documents, and deletes the field entries.
+        """
+        entry_ids = [entry.id for entry in entries]
+        field_values = defaultdict(dict)
+        field_entries = FieldEntry.objects.filter(entry_id__in=entry_ids)
+        for entry_id, field_id, value in field_entries.values_list(
+            "entry_id", "field_id", "value"
+        ):
+            field_values[entry_id][field_id] = value
+        with transaction.atomic():
+            for entry in entries:
+                entry.values = {}
+                entry.set_field_values(field_values[entry.id])
+            FormEntry.objects.bulk_update(entries, ["values"])
+            field_entries.delete()
+
+    def handle(self, **options):
+        if JSONField is None:
+            raise CommandError(
+                "Storing form entries as JSON requires Django 3.1 or later"
+            )
+        verbosity = int(options.get("verbosity", 1))
+        entries = FormEntry.objects.filter(values__isnull=True)
+        if options["form"]:
+            form = options["form"]
+            lookup = {"id": form} if form.isdigit() else {"slug": form}
+            try:
+                entries = entries.filter(form=Form.objects.get(**lookup))
+            except Form.DoesNotExist:
+                raise CommandError("Form not found: %s" % form)
+        entries = entries.only("id", "values").order_by("id")
+        total = entries.count()
+        count = 0
+        batch = list(entries[: options["batch_size"]])
+        while batch:
+            self.convert(batch)
+            count += len(batch)
+            if verbosity >= 1:
+                self.stdout.write(f"Converted {count} of {total} entries")
+            batch = entries.filter(id__gt=batch[-1].id)
+            batch = list(batch[: options["batch_size"]])
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mezzanine.forms.export import EXPORT_FORMATS, export_filename
+from mezzanine.forms.forms import EntriesForm
+from mezzanine.forms.models import Form
+
+
+class Command(BaseCommand):
+    """
+    Exports all of the entries for a form to a file, writing each
+    entry as it's read from the database, and reporting progress as
+    it goes. Useful for forms with too many entries to export from
+    the admin, and for scheduled exports. Links to uploaded files are
+    written relative to the site.
+    """
+
+    help = "Exports the entries for a form to a CSV or JSON Lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("form", help="ID or slug of the form to export.")
+        parser.add_argument(
+            "--format",
+            choices=sorted(EXPORT_FORMATS),
+            default="csv",
+            help="Format to export the entries in. Defaults to csv.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Path of the file to export to. Defaults to a file named "
+            "after the form and the current time.",
+        )
+        parser.add_argument(
+            "--progress",
+            type=int,
+            default=10000,
+            help="Number of entries to export between each progress report.",
+        )
+
+    def get_form(self, form):
+        lookup = {"id": form} if form.isdigit() else {"slug": form}
+        try:
+            return Form.objects.get(**lookup)
+        except Form.DoesNotExist:
+            raise CommandError("Form not found: %s" % form)
+
+    def handle(self, **options):
+        verbosity = int(options.get("verbosity", 1))
+        form = self.get_form(options["form"])
+        export_format = options["format"]
+        path = options["output"] or export_filename(form, export_format)
+        # Include every field, without any filters.
+        field_ids = list(form.fields.values_list("id", flat=True)) + [0]
+        data = {"field_%s_export" % field_id: True for field_id in field_ids}
+        entries_form = EntriesForm(form, None, data)
+        if not entries_form.is_valid():
+            raise CommandError(entries_form.errors.as_text())
+        total = form.entries.count()
+        export = EXPORT_FORMATS[export_format][0]
+        lines = export(entries_form)
+        if export_format == "csv":
+            header = [next(lines)]
+        else:
+            header = []
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            f.writelines(header)
+            for line in lines:
+                f.write(line)
+                count += 1
+                if verbosity >= 1 and count % options["progress"] == 0:
+                    self.stdout.write(f"Exported {count} of {total} entries")
+        if verbosity >= 1:
+            self.stdout.write(f"Exported {count} entries to {path}")
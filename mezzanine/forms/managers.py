@@ -0,0 +1,70 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.apps import apps
+from django.db.models import Manager, TextField
+from django.db.models.functions import Cast
+
+try:
+    from django.db.models.fields.json import KeyTextTransform
+except ImportError:
+    # Django < 3.1, where entries are only stored as field entries.
+    KeyTextTransform = None
+
+
+def values_key(field_id):
+    """
+    Returns the key in an entry's JSON document for the value of the
+    given field. Keys aren't just the field's ID, since numeric keys
+    are treated as array indexes by some databases.
+    """
+    return "field_%s" % field_id
+
+
+class FormEntryManager(Manager):
+    """
+    Reads the values of form entries, whether each entry is stored as
+    a JSON document in its ``values`` field, or as a ``FieldEntry``
+    for each of its fields.
+    """
+
+    def field_value(self, field_id):
+        """
+        Returns the entries stored as JSON documents that have a value
+        for the given field, annotated with the value as ``value``, so
+        that they can be filtered with the same text lookups as field
+        entries.
+        """
+        if KeyTextTransform is None:
+            return self.none()
+        key = values_key(field_id)
+        entries = self.filter(values__has_key=key)
+        value = Cast(KeyTextTransform(key, "values"), TextField())
+        return entries.annotate(value=value)
+
+    def with_values(self, entries, chunk_size=500):
+        """
+        Yields each of the given entries with its field values loaded,
+        reading the field entries for the entries that aren't stored
+        as JSON documents with one query per chunk of entries.
+        """
+        FieldEntry = apps.get_model("forms", "FieldEntry")
+        if hasattr(entries, "iterator"):
+            entries = entries.iterator(chunk_size=chunk_size)
+        entries = iter(entries)
+        chunk = list(islice(entries, chunk_size))
+        while chunk:
+            field_values = defaultdict(dict)
+            entry_ids = [entry.id for entry in chunk if entry.values is None]
+            if entry_ids:
+                field_entries = FieldEntry.objects.filter(entry_id__in=entry_ids)
+                field_entries = field_entries.values_list(
+                    "entry_id", "field_id", "value"
+                )
+                for entry_id, field_id, value in field_entries:
+                    field_values[entry_id][field_id] = value
+            for entry in chunk:
+                if entry.values is None:
+                    entry._field_values = field_values[entry.id]
+                yield entry
+            chunk = list(islice(entries, chunk_size))
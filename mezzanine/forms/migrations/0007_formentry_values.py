@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+try:
+    from django.db.models import JSONField
+except ImportError:
+    JSONField = None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("forms", "0006_auto_20170425_2225"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="formentry",
+            name="values",
+            field=(JSONField or models.TextField)(editable=False, null=True),
+        ),
+    ]
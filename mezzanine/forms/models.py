@@ -1,3 +1,4 @@
+from django.core.exceptions import ImproperlyConfigured
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -5,8 +6,15 @@ from mezzanine.conf import settings
 from mezzanine.core.fields import RichTextField
 from mezzanine.core.models import Orderable, RichText, wrapped_manager
 from mezzanine.forms import fields
+from mezzanine.forms.managers import FormEntryManager, values_key
 from mezzanine.pages.models import Page
 
+try:
+    from django.db.models import JSONField
+except ImportError:
+    # Django < 3.1, where entries are only stored as field entries.
+    JSONField = None
+
 
 class Form(Page, RichText):
     """
@@ -145,11 +153,42 @@ class FormEntry(models.Model):
 
     form = models.ForeignKey("Form", on_delete=models.CASCADE, related_name="entries")
     entry_time = models.DateTimeField(_("Date/time"))
+    values = (JSONField or models.TextField)(null=True, editable=False)
+
+    objects = FormEntryManager()
 
     class Meta:
         verbose_name = _("Form entry")
         verbose_name_plural = _("Form entries")
 
+    def get_field_values(self):
+        """
+        Returns a dict mapping the ID of each field to the entry's
+        value for it, from its JSON document if it's stored as one,
+        otherwise from its field entries.
+        """
+        if self.values is not None:
+            values = self.values.items()
+            return {int(key.split("_")[1]): value for key, value in values}
+        if not hasattr(self, "_field_values"):
+            self._field_values = dict(self.fields.values_list("field_id", "value"))
+        return self._field_values
+
+    def set_field_values(self, field_values):
+        """
+        Stores the given dict of field IDs and values in the entry's
+        JSON document, keeping the values of any other fields. Values
+        are stored as strings, as they are for field entries.
+        """
+        if JSONField is None:
+            raise ImproperlyConfigured(
+                "Storing form entries as JSON requires Django 3.1 or later"
+            )
+        values = dict(self.values or {})
+        for field_id, value in field_values.items():
+            values[values_key(field_id)] = "" if value is None else str(value)
+        self.values = values
+
 
 class FieldEntry(models.Model):
     """
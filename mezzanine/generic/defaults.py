@@ -87,6 +87,29 @@ if generic_comments:
         default=5,
     )
 
+    register_setting(
+        name="COMMENTS_PER_PAGE",
+        label=_("Comments per page"),
+        description=_(
+            "Number of top-level comments shown per page, along with their "
+            "replies. Use 0 to show every comment on a single page."
+        ),
+        editable=True,
+        default=0,
+    )
+
+    register_setting(
+        name="COMMENTS_MAX_DEPTH",
+        label=_("Comment reply depth"),
+        description=_(
+            "Number of levels of replies shown below each top-level comment "
+            "when comments are paginated. Deeper replies are loaded when "
+            "requested."
+        ),
+        editable=True,
+        default=3,
+    )
+
     register_setting(
         name="COMMENTS_UNAPPROVED_VISIBLE",
         label=_("Show unapproved comments"),
@@ -126,6 +149,19 @@ if generic_comments:
     )
 
 
+register_setting(
+    name="GENERIC_INCREMENTAL_AGGREGATES",
+    description=_(
+        "If ``True``, the counts, sums and averages stored for comments and "
+        "ratings are updated in place by the difference each comment or "
+        "rating makes when it's saved or deleted, rather than recalculated "
+        "from every comment or rating. Use the ``reconcile_aggregates`` "
+        "command to recalculate them all."
+    ),
+    editable=False,
+    default=True,
+)
+
 register_setting(
     name="RATINGS_ACCOUNT_REQUIRED",
     label=_("Accounts required for rating"),
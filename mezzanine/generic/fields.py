@@ -1,12 +1,90 @@
+import threading
+from contextlib import contextmanager
 from copy import copy
+from functools import partial
 
+from django.apps import apps
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.exceptions import AppRegistryNotReady, ImproperlyConfigured
-from django.db.models import CharField, FloatField, IntegerField
-from django.db.models.signals import post_delete, post_save
-
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import (
+    Case,
+    CharField,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from mezzanine.conf import settings
 from mezzanine.utils.deprecation import get_related_model
 
+# The objects whose custom fields are waiting to be recalculated, for
+# each database, and the number of ``suspend_related_updates`` blocks
+# entered, for the current thread.
+_pending = threading.local()
+
+
+def _pending_updates(using):
+    try:
+        updates = _pending.updates
+    except AttributeError:
+        updates = _pending.updates = {}
+    return updates.setdefault(using, {})
+
+
+def related_updates_suspended():
+    """
+    Returns whether the current thread is within a
+    ``suspend_related_updates`` block.
+    """
+    return getattr(_pending, "suspended", 0) > 0
+
+
+def flush_related_updates(using=None):
+    """
+    Recalculates the custom fields of each object whose related items
+    have changed since they were last recalculated, for the given
+    database, or every database if none is given. Called when the
+    transaction the related items were changed in is committed.
+    """
+    if related_updates_suspended():
+        return
+    aliases = [using] if using else list(getattr(_pending, "updates", {}))
+    for alias in aliases:
+        pending = _pending_updates(alias)
+        while pending:
+            field, object_pks = pending.popitem()
+            field.recalculate(object_pks, using=alias)
+
+
+@contextmanager
+def suspend_related_updates():
+    """
+    Context manager that stops the custom fields of generic relation
+    fields from being updated as related items are saved or deleted
+    within it, and instead recalculates them once for each object
+    whose related items changed, when the outermost block exits. The
+    number of times each keyword is assigned is also updated once at
+    the end. For use when importing or changing many related items at
+    once.
+    """
+    from mezzanine.generic.managers import flush_keyword_counts
+
+    _pending.suspended = getattr(_pending, "suspended", 0) + 1
+    try:
+        yield
+    finally:
+        _pending.suspended -= 1
+    flush_related_updates()
+    flush_keyword_counts()
+
 
 class BaseGenericRelation(GenericRelation):
     """
@@ -22,11 +100,33 @@ class BaseGenericRelation(GenericRelation):
       calculated value can be stored against the custom fields since
       aggregates aren't available for GenericRelation instances.
 
+    - For subclasses that set ``supports_incremental`` and implement
+      ``item_values``, when the ``GENERIC_INCREMENTAL_AGGREGATES``
+      setting is ``True``, update the custom fields in place by the
+      difference in the values each related item contributes to them
+      before and after it's saved or deleted, instead of calling
+      ``related_items_changed``.
+
+    - Otherwise for subclasses that set ``supports_aggregates`` and
+      implement ``aggregate_values``, note each object whose related
+      items are saved or deleted, and recalculate the custom fields
+      for all of them with a single aggregate query once the
+      transaction is committed, updating only the custom fields rather
+      than saving each object.
+
     """
 
     # Mapping of field names to model fields that will be added.
     fields = {}
 
+    # Whether ``item_values`` is implemented, for updating the custom
+    # fields incrementally.
+    supports_incremental = False
+
+    # Whether ``aggregate_values`` is implemented, for recalculating
+    # the custom fields in bulk.
+    supports_aggregates = False
+
     def __init__(self, *args, **kwargs):
         """
         Set up some defaults and check for a ``default_related_model``
@@ -93,25 +193,184 @@ class BaseGenericRelation(GenericRelation):
             sender = get_related_model(self)
             post_save.connect(self._related_items_changed, sender=sender)
             post_delete.connect(self._related_items_changed, sender=sender)
+            if self.supports_incremental:
+                pre_save.connect(self._related_item_saving, sender=sender)
+
+    def incremental(self):
+        """
+        Returns whether the custom fields are updated in place by the
+        difference each related item makes to them.
+        """
+        return self.supports_incremental and settings.GENERIC_INCREMENTAL_AGGREGATES
+
+    def owner(self):
+        """
+        Returns the field that the custom fields were added for. Models
+        that inherit this field from a concrete parent model also
+        inherit its custom fields, so this is the parent's field.
+        """
+        name = list(self.fields.keys())[0] % self.related_field_name
+        owner_model = self.model._meta.get_field(name).model
+        return owner_model._meta.get_field(self.related_field_name)
+
+    def _for_this_model(self, item):
+        """
+        Returns whether the related item is for the model this field
+        applies to, leaving inherited fields to the parent's field.
+        """
+        from django.contrib.contenttypes.models import ContentType
+
+        if self.owner() is not self:
+            return False
+        content_type = ContentType.objects.get_for_id(item.content_type_id)
+        for_model = content_type.model_class()
+        return for_model and issubclass(for_model, self.model)
+
+    def _related_item_saving(self, **kwargs):
+        """
+        Stores the values a related item contributes to the custom
+        fields before it's saved, for working out the difference once
+        it's saved.
+        """
+        item = kwargs["instance"]
+        if kwargs.get("raw") or item._state.adding or not self.incremental():
+            return
+        if related_updates_suspended():
+            return
+        if not self._for_this_model(item):
+            return
+        before = type(item)._base_manager.filter(pk=item.pk).first()
+        if before is not None:
+            item._item_values_before = self.item_values(before)
 
     def _related_items_changed(self, **kwargs):
         """
         Ensure that the given related item is actually for the model
         this field applies to, and pass the instance to the real
-        ``related_items_changed`` handler.
+        ``related_items_changed`` handler, update the custom fields by
+        the difference the item makes to them, or mark them to be
+        recalculated when the transaction is committed.
         """
-        for_model = kwargs["instance"].content_type.model_class()
-        if for_model and issubclass(for_model, self.model):
-            instance_id = kwargs["instance"].object_pk
-            try:
-                instance = for_model.objects.get(id=instance_id)
-            except self.model.DoesNotExist:
-                # Instance itself was deleted - signals are irrelevant.
-                return
-            if hasattr(instance, "get_content_model"):
-                instance = instance.get_content_model()
-            related_manager = getattr(instance, self.related_field_name)
-            self.related_items_changed(instance, related_manager)
+        item = kwargs["instance"]
+        if not self._for_this_model(item):
+            return
+        using = kwargs["using"]
+        if related_updates_suspended():
+            self.defer_update(item.object_pk, using)
+            return
+        if not kwargs.get("raw") and self.incremental():
+            before = item.__dict__.pop("_item_values_before", {})
+            after = {}
+            if kwargs["signal"] is post_save:
+                after = self.item_values(item)
+            else:
+                before = self.item_values(item)
+            deltas = {
+                name: after.get(name, 0) - before.get(name, 0) for name in self.fields
+            }
+            if any(deltas.values()):
+                updates = self.aggregate_updates(deltas)
+                self.model._base_manager.filter(pk=item.object_pk).update(**updates)
+                self.fields_written([item.object_pk], using)
+            return
+        if self.supports_aggregates:
+            self.defer_update(item.object_pk, using)
+            # Every item changed adds a callback, but only the first
+            # to run has any objects left to recalculate.
+            transaction.on_commit(partial(flush_related_updates, using), using=using)
+            return
+        for_model = item.content_type.model_class()
+        try:
+            instance = for_model.objects.get(id=item.object_pk)
+        except self.model.DoesNotExist:
+            # Instance itself was deleted - signals are irrelevant.
+            return
+        if hasattr(instance, "get_content_model"):
+            instance = instance.get_content_model()
+        related_manager = getattr(instance, self.related_field_name)
+        self.related_items_changed(instance, related_manager)
+
+    def defer_update(self, object_pk, using=DEFAULT_DB_ALIAS):
+        """
+        Marks the custom fields of the object with the given primary
+        key to be recalculated by ``flush_related_updates``.
+        """
+        _pending_updates(using).setdefault(self, set()).add(str(object_pk))
+
+    def recalculate(self, object_pks=None, using=DEFAULT_DB_ALIAS):
+        """
+        Recalculates the custom fields for the objects with the given
+        primary keys, or every object if none are given, and stores
+        them for the objects whose values have changed, returning the
+        number of objects updated. Uses a single aggregate query when
+        ``aggregate_values`` is implemented, otherwise calls
+        ``related_items_changed`` for each object.
+        """
+        from django.contrib.contenttypes.models import ContentType
+
+        objects = self.model._base_manager.db_manager(using)
+        if object_pks is not None:
+            objects = objects.filter(pk__in=list(object_pks))
+        if not self.supports_aggregates:
+            count = 0
+            for instance in objects.iterator():
+                if hasattr(instance, "get_content_model"):
+                    instance = instance.get_content_model()
+                related_manager = getattr(instance, self.related_field_name)
+                self.related_items_changed(instance, related_manager)
+                count += 1
+            return count
+        models = [m for m in apps.get_models() if issubclass(m, self.model)]
+        content_types = ContentType.objects.db_manager(using).get_for_models(
+            *models, for_concrete_models=False
+        )
+        items = self.related_model._base_manager.db_manager(using).filter(
+            content_type__in=content_types.values()
+        )
+        if object_pks is not None:
+            items = items.filter(object_pk__in=list(object_pks))
+        values = self.aggregate_values(items)
+        names = {name: name % self.related_field_name for name in self.fields}
+        empty = {name: field.get_default() for name, field in self.fields.items()}
+        changed = []
+        for obj in objects.only("pk", *names.values()).iterator():
+            obj_values = values.get(str(obj.pk), empty)
+            if any(getattr(obj, names[n]) != v for n, v in obj_values.items()):
+                for name, value in obj_values.items():
+                    setattr(obj, names[name], value)
+                changed.append(obj)
+        objects.bulk_update(changed, names.values(), batch_size=500)
+        self.fields_written([obj.pk for obj in changed], using)
+        return len(changed)
+
+    def fields_written(self, object_pks, using=DEFAULT_DB_ALIAS):
+        """
+        Called after the custom fields are written for the objects with
+        the given primary keys without saving them, so without sending
+        ``post_save``. Does what its receivers do for ``Displayable``
+        instances: updates the search index for the objects when the
+        custom fields are search fields, and invalidates the cached
+        pages that depend on them.
+        """
+        from mezzanine.core.models import (
+            Displayable,
+            index_displayable,
+            invalidate_displayable_cache,
+        )
+
+        model = self.owner().model
+        if not object_pks or not issubclass(model, Displayable):
+            return
+        names = {name % self.related_field_name for name in self.fields}
+        searched = names & set(model.objects.get_search_fields())
+        if searched:
+            objects = model._base_manager.using(using).filter(pk__in=object_pks)
+        else:
+            objects = [model(pk=pk) for pk in object_pks]
+        for obj in objects:
+            if searched:
+                index_displayable(model, obj)
+            invalidate_displayable_cache(model, obj)
 
     def related_items_changed(self, instance, related_manager):
         """
@@ -122,6 +381,37 @@ class BaseGenericRelation(GenericRelation):
         """
         pass
 
+    def item_values(self, item):
+        """
+        Can be implemented by subclasses that set
+        ``supports_incremental`` - returns a dict mapping the names in
+        ``fields`` to the amount the given related item adds to each of
+        them, for updating them incrementally.
+        """
+        return {}
+
+    def aggregate_updates(self, deltas):
+        """
+        Returns the expressions for updating the custom fields in the
+        database, given a dict mapping the names in ``fields`` to the
+        amounts they change by. Can be overridden by subclasses for
+        fields that aren't simple totals.
+        """
+        return {
+            name % self.related_field_name: F(name % self.related_field_name) + delta
+            for name, delta in deltas.items()
+        }
+
+    def aggregate_values(self, queryset):
+        """
+        Can be implemented by subclasses that set
+        ``supports_aggregates`` - returns a dict mapping the
+        ``object_pk`` of each object with related items in the queryset
+        to a dict of the values for each of the names in ``fields``,
+        calculated in bulk. Used by ``recalculate``.
+        """
+        return {}
+
     def value_from_object(self, obj):
         """
         Returns the value of this field in the given model instance.
@@ -139,6 +429,8 @@ class CommentsField(BaseGenericRelation):
 
     default_related_model = "generic.ThreadedComment"
     fields = {"%s_count": IntegerField(editable=False, default=0)}
+    supports_incremental = True
+    supports_aggregates = True
 
     def related_items_changed(self, instance, related_manager):
         """
@@ -154,6 +446,21 @@ class CommentsField(BaseGenericRelation):
         setattr(instance, count_field_name, count)
         instance.save()
 
+    def item_values(self, item):
+        """
+        Visible comments each add one to the number of comments.
+        """
+        from mezzanine.generic.managers import comment_is_visible
+
+        return {"%s_count": int(comment_is_visible(item))}
+
+    def aggregate_values(self, queryset):
+        from mezzanine.generic.managers import visible_comments
+
+        counts = visible_comments(queryset).values("object_pk").order_by()
+        counts = counts.annotate(count=Count("id"))
+        return {str(c["object_pk"]): {"%s_count": c["count"]} for c in counts}
+
 
 class KeywordsField(BaseGenericRelation):
     """
@@ -164,6 +471,7 @@ class KeywordsField(BaseGenericRelation):
 
     default_related_model = "generic.AssignedKeyword"
     fields = {"%s_string": CharField(editable=False, blank=True, max_length=500)}
+    supports_aggregates = True
 
     def __init__(self, *args, **kwargs):
         """
@@ -187,27 +495,103 @@ class KeywordsField(BaseGenericRelation):
     def save_form_data(self, instance, data):
         """
         The ``KeywordsWidget`` field will return data as a string of
-        comma separated IDs for the ``Keyword`` model - convert these
-        into actual ``AssignedKeyword`` instances. Also delete
-        ``Keyword`` instances if their last related ``AssignedKeyword``
-        instance is being removed.
+        comma separated IDs for the ``Keyword`` model - assign these
+        to the instance with ``set_keywords``.
+        """
+        self.set_keywords(instance, [i for i in data.split(",") if i])
+
+    def set_keywords(self, instance, keywords):
         """
-        from mezzanine.generic.models import Keyword
+        Sets the keywords assigned to the instance to the given
+        sequence of ``Keyword`` instances or IDs, in order. Existing
+        ``AssignedKeyword`` instances for keywords that are kept are
+        reordered in place, the rest are deleted, and those for new
+        keywords are created with a single query. ``Keyword``
+        instances are deleted if their last assignment is removed,
+        and the ``KEYWORDS_FIELD_NAME_string`` field is updated once
+        at the end, without saving the instance, then reindexed for
+        search via ``fields_written``. Importers can use
+        this via the field, eg::
+
+            field = obj._meta.get_field(obj.get_keywordsfield_name())
+            field.set_keywords(obj, keywords)
 
+        """
+        from mezzanine.generic.models import (
+            Keyword,
+            KeywordCount,
+            invalidate_keywords_cache,
+        )
+
+        keyword_ids = []
+        for keyword in keywords:
+            keyword_id = int(getattr(keyword, "pk", keyword))
+            if keyword_id not in keyword_ids:
+                keyword_ids.append(keyword_id)
         related_manager = getattr(instance, self.name)
-        # Get a list of Keyword IDs being removed.
-        old_ids = [str(a.keyword_id) for a in related_manager.all()]
-        new_ids = data.split(",")
-        removed_ids = set(old_ids) - set(new_ids)
-        # Remove current AssignedKeyword instances.
-        related_manager.all().delete()
-        # Convert the data into AssignedKeyword instances.
-        if data:
-            data = [related_manager.create(keyword_id=i) for i in new_ids]
-        # Remove keywords that are no longer assigned to anything.
-        Keyword.objects.delete_unused(removed_ids)
-
-        getattr(instance, self.name).set(data)
+        using = related_manager.db
+        assigned = {}
+        removed = []
+        for assignment in related_manager.only("id", "keyword_id", "_order"):
+            if assignment.keyword_id in keyword_ids:
+                assigned.setdefault(assignment.keyword_id, assignment)
+            if assigned.get(assignment.keyword_id) is not assignment:
+                removed.append(assignment)
+        reordered, created = [], []
+        for order, keyword_id in enumerate(keyword_ids):
+            assignment = assigned.get(keyword_id)
+            if assignment is None:
+                created.append(
+                    self.related_model(
+                        keyword_id=keyword_id,
+                        _order=order,
+                        **{
+                            self.content_type_field_name: related_manager.content_type,
+                            self.object_id_field_name: related_manager.pk_val,
+                        }
+                    )
+                )
+            elif assignment._order != order:
+                assignment._order = order
+                reordered.append(assignment)
+        # Deleting sends the signals for each assignment, so suspend
+        # the updates they cause, since the keywords string is
+        # calculated here, and the keyword counts are then updated
+        # together with those for the created assignments.
+        assignments = self.related_model._base_manager.using(using)
+        with suspend_related_updates():
+            if removed:
+                assignments.filter(id__in=[a.id for a in removed]).delete()
+            if reordered:
+                assignments.bulk_update(reordered, ["_order"])
+            if created:
+                assignments.bulk_create(created)
+                # Creating in bulk doesn't send the signals for each
+                # assignment, so update the keyword counts here.
+                counts = KeywordCount.objects.db_manager(using)
+                deltas = {assignment.keyword_id: 1 for assignment in created}
+                counts.change(related_manager.content_type.id, deltas)
+                invalidate_keywords_cache(sender=self.related_model)
+            pending = _pending_updates(using).get(self.owner())
+            if pending:
+                pending.discard(str(instance.pk))
+        if removed:
+            removed_ids = [assignment.keyword_id for assignment in removed]
+            Keyword.objects.db_manager(using).delete_unused(removed_ids)
+        titles = dict(
+            Keyword.objects.using(using)
+            .filter(id__in=keyword_ids)
+            .values_list("id", "title")
+        )
+        keywords_string = " ".join(titles[i] for i in keyword_ids if i in titles)
+        string_field_name = list(self.fields.keys())[0] % self.related_field_name
+        if getattr(instance, string_field_name) != keywords_string:
+            setattr(instance, string_field_name, keywords_string)
+            owner_model = self.owner().model
+            owner_model._base_manager.using(using).filter(pk=instance.pk).update(
+                **{string_field_name: keywords_string}
+            )
+            self.fields_written([instance.pk], using)
 
     def contribute_to_class(self, cls, name):
         """
@@ -241,6 +625,13 @@ class KeywordsField(BaseGenericRelation):
             setattr(instance, string_field_name, keywords)
             instance.save()
 
+    def aggregate_values(self, queryset):
+        assigned = queryset.order_by("object_pk", "_order", "id")
+        keywords = {}
+        for object_pk, title in assigned.values_list("object_pk", "keyword__title"):
+            keywords.setdefault(str(object_pk), []).append(title)
+        return {pk: {"%s_string": " ".join(titles)} for pk, titles in keywords.items()}
+
 
 class RatingField(BaseGenericRelation):
     """
@@ -255,6 +646,8 @@ class RatingField(BaseGenericRelation):
         "%s_sum": IntegerField(default=0, editable=False),
         "%s_average": FloatField(default=0, editable=False),
     }
+    supports_incremental = True
+    supports_aggregates = True
 
     def related_items_changed(self, instance, related_manager):
         """
@@ -268,3 +661,41 @@ class RatingField(BaseGenericRelation):
         setattr(instance, "%s_sum" % self.related_field_name, _sum)
         setattr(instance, "%s_average" % self.related_field_name, average)
         instance.save()
+
+    def item_values(self, item):
+        return {"%s_count": 1, "%s_sum": int(item.value)}
+
+    def aggregate_updates(self, deltas):
+        """
+        Updates the count and sum by their differences, and calculates
+        the average from them. The average is set first, since some
+        databases use the values already set for later assignments.
+        """
+        count, _sum, average = (name % self.related_field_name for name in self.fields)
+        new_count = F(count) + deltas["%s_count"]
+        new_sum = F(_sum) + deltas["%s_sum"]
+        new_average = ExpressionWrapper(
+            Cast(new_sum, FloatField()) / new_count, output_field=FloatField()
+        )
+        return {
+            average: Case(
+                When(**{"%s__gt" % count: -deltas["%s_count"], "then": new_average}),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            _sum: new_sum,
+            count: new_count,
+        }
+
+    def aggregate_values(self, queryset):
+        ratings = queryset.values("object_pk").order_by()
+        ratings = ratings.annotate(count=Count("id"), sum=Sum("value"))
+        values = {}
+        for r in ratings:
+            average = r["sum"] / r["count"] if r["count"] > 0 else 0
+            values[str(r["object_pk"])] = {
+                "%s_count": r["count"],
+                "%s_sum": r["sum"],
+                "%s_average": average,
+            }
+        return values
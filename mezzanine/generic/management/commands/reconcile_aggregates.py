@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from mezzanine.generic.fields import BaseGenericRelation
+from mezzanine.generic.models import KeywordCount
+
+
+class Command(BaseCommand):
+    """
+    Recalculates the values stored by generic relation fields such as
+    ``CommentsField`` and ``RatingField`` for every object, with a
+    single aggregate query per field. Useful when the values have
+    drifted, eg after related items are created or deleted in bulk,
+    or after changing the settings that control which comments are
+    counted. Also recalculates the number of times each keyword is
+    assigned, and its weight in tag clouds.
+    """
+
+    help = "Recalculates the stored counts of comments, ratings and keywords."
+
+    def handle(self, **options):
+        verbosity = int(options.get("verbosity", 1))
+        for model in apps.get_models():
+            for field in model._meta.private_fields:
+                if not isinstance(field, BaseGenericRelation):
+                    continue
+                if field.model is model and field.owner() is field:
+                    count = field.recalculate()
+                    if count and verbosity >= 1:
+                        name = model._meta.verbose_name_plural
+                        self.stdout.write(
+                            f"Updated {field.related_field_name} for {count} {name}"
+                        )
+        KeywordCount.objects.rebuild()
@@ -1,7 +1,45 @@
+import threading
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F
 from django_comments.managers import CommentManager as DjangoCM
 
 from mezzanine.conf import settings
 from mezzanine.core.managers import CurrentSiteManager
+from mezzanine.generic.fields import related_updates_suspended
+from mezzanine.utils.sites import override_current_site_id
+
+# The (database, site ID, content type ID) groups of keyword counts
+# whose weights are waiting to be recalculated, and the changes to
+# keyword counts held while related updates are suspended, for the
+# current thread.
+_pending_weights = threading.local()
+_pending_counts = threading.local()
+
+
+def visible_comments(queryset):
+    """
+    Filters the comments queryset to those that are visible based on
+    the ``COMMENTS_XXX_VISIBLE`` settings.
+    """
+    if not settings.COMMENTS_UNAPPROVED_VISIBLE:
+        queryset = queryset.filter(is_public=True)
+    if not settings.COMMENTS_REMOVED_VISIBLE:
+        queryset = queryset.filter(is_removed=False)
+    return queryset
+
+
+def comment_is_visible(comment):
+    """
+    Returns whether the comment is visible based on the
+    ``COMMENTS_XXX_VISIBLE`` settings, matching ``visible_comments``.
+    """
+    if not settings.COMMENTS_UNAPPROVED_VISIBLE and not comment.is_public:
+        return False
+    if not settings.COMMENTS_REMOVED_VISIBLE and comment.is_removed:
+        return False
+    return True
 
 
 class CommentManager(CurrentSiteManager, DjangoCM):
@@ -18,12 +56,7 @@ class CommentManager(CurrentSiteManager, DjangoCM):
         that shouldn't be shown, and are given placeholders in
         the template ``generic/includes/comment.html``.
         """
-        visible = self.all()
-        if not settings.COMMENTS_UNAPPROVED_VISIBLE:
-            visible = visible.filter(is_public=True)
-        if not settings.COMMENTS_REMOVED_VISIBLE:
-            visible = visible.filter(is_removed=False)
-        return visible
+        return visible_comments(self.all())
 
     def count_queryset(self):
         """
@@ -65,3 +98,175 @@ class KeywordManager(CurrentSiteManager):
         else:
             keywords = self.filter(id__in=keyword_ids)
         keywords.filter(assignments__isnull=True).delete()
+
+
+def keyword_weights(counts, sizes):
+    """
+    Returns the weight of each of the given numbers of assignments of
+    keywords in a tag cloud with the given number of sizes, from 1 for
+    the least assigned keywords to ``sizes`` for the most.
+    """
+    if not counts:
+        return []
+    min_count, max_count = min(counts), max(counts)
+    factor = sizes - 1.0
+    if min_count != max_count:
+        factor /= max_count - min_count
+    return [int(round((count - min_count) * factor)) + 1 for count in counts]
+
+
+def flush_keyword_weights():
+    """
+    Recalculates the weights of each group of keyword counts that
+    have changed since their weights were last calculated. Called
+    when the transaction they were changed in is committed.
+    """
+    from mezzanine.generic.models import KeywordCount
+
+    pending = getattr(_pending_weights, "groups", set())
+    while pending:
+        using, site_id, content_type_id = pending.pop()
+        manager = KeywordCount.objects.db_manager(using)
+        manager.update_weights(site_id, content_type_id)
+
+
+def flush_keyword_counts():
+    """
+    Applies the changes to keyword counts held while related updates
+    were suspended. Called when a ``suspend_related_updates`` block
+    exits.
+    """
+    from mezzanine.generic.models import KeywordCount
+
+    if related_updates_suspended():
+        return
+    pending = getattr(_pending_counts, "deltas", {})
+    while pending:
+        (using, content_type_id), deltas = pending.popitem()
+        KeywordCount.objects.db_manager(using).change(content_type_id, deltas)
+
+
+class KeywordCountManager(CurrentSiteManager):
+    """
+    Maintains the number of assignments of each keyword to objects of
+    each content type, and their weights in a tag cloud.
+    """
+
+    def _all_sites(self):
+        return self.model._base_manager.using(self._db)
+
+    def defer_weights(self, site_id, content_type_id):
+        """
+        Marks the weights of the keywords for the site and content type
+        to be recalculated once the transaction is committed.
+        """
+        using = self._db or DEFAULT_DB_ALIAS
+        try:
+            groups = _pending_weights.groups
+        except AttributeError:
+            groups = _pending_weights.groups = set()
+        groups.add((using, site_id, content_type_id))
+        transaction.on_commit(flush_keyword_weights, using=using)
+
+    def change(self, content_type_id, deltas):
+        """
+        Adds the given amounts to the number of times each keyword is
+        assigned to objects of the content type, given a dict mapping
+        keyword IDs to amounts, and defers updating the weights of the
+        content type's keywords. Within a ``suspend_related_updates``
+        block, the amounts are held until the block exits.
+        """
+        using = self._db or DEFAULT_DB_ALIAS
+        if related_updates_suspended():
+            try:
+                pending = _pending_counts.deltas
+            except AttributeError:
+                pending = _pending_counts.deltas = {}
+            pending = pending.setdefault((using, content_type_id), Counter())
+            pending.update(deltas)
+            return
+        deltas = {keyword_id: delta for keyword_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        counts = self._all_sites().filter(
+            content_type_id=content_type_id, keyword_id__in=list(deltas)
+        )
+        existing = dict(counts.values_list("keyword_id", "site_id"))
+        new_ids = [i for i, delta in deltas.items() if i not in existing and delta > 0]
+        if new_ids:
+            keyword_model = self.model._meta.get_field("keyword").related_model
+            keywords = keyword_model._base_manager.using(self._db)
+            keywords = keywords.filter(id__in=new_ids).values_list("id", "site_id")
+            created = [
+                self.model(
+                    keyword_id=keyword_id,
+                    site_id=site_id,
+                    content_type_id=content_type_id,
+                    item_count=0,
+                )
+                for keyword_id, site_id in keywords
+            ]
+            # Another transaction may be creating the same counts, so
+            # create them empty, ignoring those that already exist, and
+            # add to them along with the existing counts.
+            self._all_sites().bulk_create(created, ignore_conflicts=True)
+            existing.update((count.keyword_id, count.site_id) for count in created)
+        keyword_ids = {}
+        for keyword_id in existing:
+            keyword_ids.setdefault(deltas[keyword_id], []).append(keyword_id)
+        for delta, ids in keyword_ids.items():
+            changed = counts.filter(keyword_id__in=ids)
+            changed.update(item_count=F("item_count") + delta)
+        site_ids = set(existing.values())
+        if any(delta < 0 for delta in deltas.values()):
+            counts.filter(item_count__lte=0).delete()
+        for site_id in site_ids:
+            self.defer_weights(site_id, content_type_id)
+
+    def update_weights(self, site_id, content_type_id):
+        """
+        Recalculates the weights of the keywords for the site and
+        content type, using the site's ``TAG_CLOUD_SIZES`` setting.
+        """
+        counts = self._all_sites().filter(
+            site_id=site_id, content_type_id=content_type_id
+        )
+        counts = list(counts.only("id", "item_count", "weight"))
+        with override_current_site_id(site_id):
+            sizes = settings.TAG_CLOUD_SIZES
+        weights = keyword_weights([count.item_count for count in counts], sizes)
+        changed = []
+        for count, weight in zip(counts, weights):
+            if count.weight != weight:
+                count.weight = weight
+                changed.append(count)
+        self._all_sites().bulk_update(changed, ["weight"], batch_size=500)
+
+    def rebuild(self):
+        """
+        Recalculates the number of assignments of every keyword to
+        objects of each content type, and their weights.
+        """
+        from mezzanine.generic.models import AssignedKeyword
+
+        assigned = AssignedKeyword.objects.using(self._db).order_by()
+        assigned = assigned.values_list(
+            "keyword_id", "keyword__site_id", "content_type_id"
+        )
+        assigned = assigned.annotate(item_count=Count("id"))
+        self._all_sites().all().delete()
+        self._all_sites().bulk_create(
+            [
+                self.model(
+                    keyword_id=keyword_id,
+                    site_id=site_id,
+                    content_type_id=content_type_id,
+                    item_count=item_count,
+                )
+                for keyword_id, site_id, content_type_id, item_count in assigned
+            ],
+            batch_size=500,
+        )
+        groups = self._all_sites().values_list("site_id", "content_type_id")
+        for site_id, content_type_id in groups.distinct().order_by():
+            self.update_weights(site_id, content_type_id)
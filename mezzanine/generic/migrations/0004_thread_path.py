@@ -0,0 +1,47 @@
+from django.db import migrations, models
+from django.utils.http import int_to_base36
+
+
+def set_thread_paths(apps, schema_editor):
+    """
+    Sets the thread path and depth of existing comments, in order of
+    ID so that each comment's parent is done before it.
+    """
+    ThreadedComment = apps.get_model("generic", "ThreadedComment")
+    paths = {}
+    comments = []
+    for comment in ThreadedComment.objects.only("id", "replied_to_id").order_by("id"):
+        segment = int_to_base36(comment.id).rjust(7, "0")
+        parent_path, parent_depth = paths.get(comment.replied_to_id, ("", -1))
+        comment.thread_path = parent_path + segment
+        comment.depth = parent_depth + 1
+        if len(comment.thread_path) > 255:
+            comment.thread_path = parent_path
+        paths[comment.id] = (comment.thread_path, comment.depth)
+        comments.append(comment)
+    ThreadedComment.objects.bulk_update(
+        comments, ["thread_path", "depth"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("generic", "0003_auto_20170411_0504"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="threadedcomment",
+            name="depth",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="threadedcomment",
+            name="thread_path",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(set_thread_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_keyword_counts(apps, schema_editor):
+    """
+    Counts the existing assignments of each keyword to objects of each
+    content type, and calculates their weights for each site's
+    ``TAG_CLOUD_SIZES`` setting.
+    """
+    from mezzanine.conf import registry
+
+    AssignedKeyword = apps.get_model("generic", "AssignedKeyword")
+    KeywordCount = apps.get_model("generic", "KeywordCount")
+    Setting = apps.get_model("conf", "Setting")
+    sizes = Setting.objects.filter(name="TAG_CLOUD_SIZES")
+    sizes = dict(sizes.values_list("site_id", "value"))
+    assigned = AssignedKeyword.objects.order_by()
+    assigned = assigned.values_list("keyword_id", "keyword__site_id", "content_type_id")
+    groups = {}
+    for keyword_id, site_id, content_type_id, item_count in assigned.annotate(
+        item_count=Count("id")
+    ):
+        count = KeywordCount(
+            keyword_id=keyword_id,
+            site_id=site_id,
+            content_type_id=content_type_id,
+            item_count=item_count,
+        )
+        groups.setdefault((site_id, content_type_id), []).append(count)
+    for (site_id, _), counts in groups.items():
+        item_counts = [count.item_count for count in counts]
+        min_count, max_count = min(item_counts), max(item_counts)
+        default = registry["TAG_CLOUD_SIZES"]["default"]
+        factor = int(sizes.get(site_id, default)) - 1.0
+        if min_count != max_count:
+            factor /= max_count - min_count
+        for count in counts:
+            count.weight = int(round((count.item_count - min_count) * factor)) + 1
+        KeywordCount.objects.bulk_create(counts, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("conf", "0001_initial"),
+        ("contenttypes", "0001_initial"),
+        ("generic", "0004_thread_path"),
+        ("sites", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KeywordCount",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("item_count", models.IntegerField(default=0)),
+                ("weight", models.IntegerField(default=1)),
+                (
+                    "content_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="contenttypes.contenttype",
+                    ),
+                ),
+                (
+                    "keyword",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="counts",
+                        to="generic.keyword",
+                    ),
+                ),
+                (
+                    "site",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="sites.site",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Keyword count",
+                "verbose_name_plural": "Keyword counts",
+                "indexes": [
+                    models.Index(
+                        fields=["site", "content_type"],
+                        name="generic_key_site_id_3d7d9c_idx",
+                    )
+                ],
+                "unique_together": {("keyword", "content_type")},
+            },
+        ),
+        migrations.RunPython(fill_keyword_counts, migrations.RunPython.noop),
+    ]
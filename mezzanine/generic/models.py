@@ -1,5 +1,6 @@
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from django.template.defaultfilters import truncatewords_html
 from django.utils.html import format_html
 from django.utils.translation import gettext
@@ -7,9 +8,16 @@ from django.utils.translation import gettext_lazy as _
 from django_comments.models import Comment
 
 from mezzanine.conf import settings
-from mezzanine.core.models import Orderable, Slugged
+from mezzanine.conf.models import Setting
+from mezzanine.core.models import Orderable, SiteRelated, Slugged
 from mezzanine.generic.fields import RatingField
-from mezzanine.generic.managers import CommentManager, KeywordManager
+from mezzanine.generic.managers import (
+    CommentManager,
+    KeywordCountManager,
+    KeywordManager,
+)
+from mezzanine.generic.threads import comment_page_number, thread_path_segment
+from mezzanine.utils.cache import cache_installed, cache_tag, invalidate_cache_tags
 from mezzanine.utils.models import get_user_model_name
 from mezzanine.utils.sites import current_site_id
 
@@ -33,6 +41,10 @@ class ThreadedComment(Comment):
         related_name="comments",
     )
     rating = RatingField(verbose_name=_("Rating"))
+    thread_path = models.CharField(
+        editable=False, max_length=255, default="", db_index=True
+    )
+    depth = models.IntegerField(editable=False, default=0)
 
     objects = CommentManager()
 
@@ -43,20 +55,53 @@ class ThreadedComment(Comment):
     def get_absolute_url(self):
         """
         Use the URL for the comment's content object, with a URL hash
-        appended that references the individual comment.
+        appended that references the individual comment, and the page
+        of comments it's on when ``COMMENTS_PER_PAGE`` is set.
         """
         url = self.content_object.get_absolute_url()
+        per_page = settings.COMMENTS_PER_PAGE
+        if per_page and self.thread_path:
+            comments = ThreadedComment.objects.visible().filter(
+                content_type_id=self.content_type_id, object_pk=self.object_pk
+            )
+            page = comment_page_number(self, comments, per_page)
+            if page > 1:
+                url = f"{url}?comments_page={page}"
         return f"{url}#comment-{self.id}"
 
     def save(self, *args, **kwargs):
         """
         Set the current site ID, and ``is_public`` based on the setting
-        ``COMMENTS_DEFAULT_APPROVED``.
+        ``COMMENTS_DEFAULT_APPROVED``. Also set the thread path and
+        depth once the comment has an ID.
         """
         if not self.id:
             self.is_public = settings.COMMENTS_DEFAULT_APPROVED
             self.site_id = current_site_id()
         super().save(*args, **kwargs)
+        if not self.thread_path:
+            self.set_thread_path()
+
+    def set_thread_path(self):
+        """
+        Sets the comment's path in its thread, made of a segment for
+        the ID of each comment from the top-level comment down to it,
+        and its depth below the top-level comment.
+        """
+        self.thread_path = thread_path_segment(self.id)
+        self.depth = 0
+        if self.replied_to_id is not None:
+            parent = ThreadedComment._base_manager.get(id=self.replied_to_id)
+            self.depth = parent.depth + 1
+            self.thread_path = parent.thread_path + self.thread_path
+            max_length = self._meta.get_field("thread_path").max_length
+            if len(self.thread_path) > max_length:
+                # Too deep to fit - sort the comment with its parent's
+                # replies, after the parent.
+                self.thread_path = parent.thread_path
+        ThreadedComment._base_manager.filter(id=self.id).update(
+            thread_path=self.thread_path, depth=self.depth
+        )
 
     ################################
     # Admin listing column methods #
@@ -131,6 +176,35 @@ class AssignedKeyword(Orderable):
         return str(self.keyword)
 
 
+class KeywordCount(SiteRelated):
+    """
+    The number of times a ``Keyword`` is assigned to objects of a
+    content type, and its weight in a tag cloud of the keywords for
+    the content type. Maintained as keywords are assigned, for the
+    ``keywords_for`` template tag.
+    """
+
+    keyword = models.ForeignKey(
+        "Keyword", on_delete=models.CASCADE, related_name="counts"
+    )
+    content_type = models.ForeignKey(
+        "contenttypes.ContentType", on_delete=models.CASCADE
+    )
+    item_count = models.IntegerField(default=0)
+    weight = models.IntegerField(default=1)
+
+    objects = KeywordCountManager()
+
+    class Meta:
+        verbose_name = _("Keyword count")
+        verbose_name_plural = _("Keyword counts")
+        unique_together = ("keyword", "content_type")
+        indexes = [models.Index(fields=["site", "content_type"])]
+
+    def __str__(self):
+        return f"{self.keyword}: {self.item_count}"
+
+
 class Rating(models.Model):
     """
     A rating that can be given to a piece of content.
@@ -165,3 +239,63 @@ class Rating(models.Model):
                 "Invalid rating. {} is not in {}".format(self.value, ", ".join(valid))
             )
         super().save(*args, **kwargs)
+
+
+def invalidate_content_object_cache(sender, instance, **kwargs):
+    """
+    Invalidates cached pages for the object a comment or rating
+    belongs to, when the comment or rating is saved or deleted.
+    """
+    model = instance.content_type.model_class()
+    if model is not None and cache_installed():
+        invalidate_cache_tags(f"{cache_tag(model)}.{instance.object_pk}")
+
+
+def invalidate_keywords_cache(sender, **kwargs):
+    """
+    Invalidates cached pages listing keywords, such as tag clouds,
+    when keywords or their assignments are changed.
+    """
+    if cache_installed():
+        invalidate_cache_tags(cache_tag(Keyword))
+
+
+def update_keyword_count(sender, instance, **kwargs):
+    """
+    Updates the number of times the keyword is assigned to objects of
+    the content type when an assignment is created or deleted.
+    """
+    if kwargs.get("raw") or kwargs.get("created") is False:
+        return
+    delta = 1 if kwargs["signal"] is post_save else -1
+    counts = KeywordCount.objects.db_manager(kwargs["using"])
+    counts.change(instance.content_type_id, {instance.keyword_id: delta})
+
+
+def tag_cloud_sizes_changed(sender, instance, **kwargs):
+    """
+    Updates the weights of the site's keywords when its
+    ``TAG_CLOUD_SIZES`` setting is changed in the admin.
+    """
+    if instance.name == "TAG_CLOUD_SIZES":
+        using = kwargs["using"]
+        counts = KeywordCount._base_manager.using(using)
+        counts = counts.filter(site_id=instance.site_id).order_by()
+        content_type_ids = counts.values_list("content_type_id", flat=True)
+        for content_type_id in content_type_ids.distinct():
+            manager = KeywordCount.objects.db_manager(using)
+            manager.defer_weights(instance.site_id, content_type_id)
+
+
+post_save.connect(invalidate_content_object_cache, sender=ThreadedComment)
+post_delete.connect(invalidate_content_object_cache, sender=ThreadedComment)
+post_save.connect(invalidate_content_object_cache, sender=Rating)
+post_delete.connect(invalidate_content_object_cache, sender=Rating)
+post_save.connect(invalidate_keywords_cache, sender=Keyword)
+post_delete.connect(invalidate_keywords_cache, sender=Keyword)
+post_save.connect(invalidate_keywords_cache, sender=AssignedKeyword)
+post_delete.connect(invalidate_keywords_cache, sender=AssignedKeyword)
+post_save.connect(update_keyword_count, sender=AssignedKeyword)
+post_delete.connect(update_keyword_count, sender=AssignedKeyword)
+post_save.connect(tag_cloud_sizes_changed, sender=Setting)
+post_delete.connect(tag_cloud_sizes_changed, sender=Setting)
@@ -6,6 +6,7 @@ from django.urls import reverse
 from mezzanine import template
 from mezzanine.conf import settings
 from mezzanine.generic.models import ThreadedComment
+from mezzanine.generic.threads import comments_page
 from mezzanine.utils.importing import import_dotted_path
 
 register = template.Library()
@@ -39,18 +40,32 @@ def comment_thread(context, parent):
     Return a list of child comments for the given parent, storing all
     comments in a dict in the context when first called, using parents
     as keys for retrieval on subsequent recursive calls from the
-    comments template.
+    comments template. When ``COMMENTS_PER_PAGE`` is set, only the
+    current page of top-level comments is loaded, with their replies
+    up to ``COMMENTS_MAX_DEPTH`` levels deep.
     """
+    parent_id = parent.id if isinstance(parent, ThreadedComment) else None
     if "all_comments" not in context:
         comments = defaultdict(list)
         if "request" in context and context["request"].user.is_staff:
             comments_queryset = parent.comments.all()
         else:
             comments_queryset = parent.comments.visible()
-        for comment in comments_queryset.select_related("user"):
+        per_page = settings.COMMENTS_PER_PAGE
+        if per_page and parent_id is None:
+            page_num = 1
+            if "request" in context:
+                page_num = context["request"].GET.get("comments_page", 1)
+            max_depth = settings.COMMENTS_MAX_DEPTH
+            page, thread = comments_page(
+                comments_queryset, page_num, per_page, max_depth
+            )
+            context["comments_page"] = page
+        else:
+            thread = comments_queryset.select_related("user")
+        for comment in thread:
             comments[comment.replied_to_id].append(comment)
         context["all_comments"] = comments
-    parent_id = parent.id if isinstance(parent, ThreadedComment) else None
     try:
         replied_to = int(context["request"].POST["replied_to"])
     except (KeyError, ValueError):
@@ -59,6 +74,9 @@ def comment_thread(context, parent):
         {
             "comments_for_thread": context["all_comments"].get(parent_id, []),
             "no_comments": parent_id is None and not context["all_comments"],
+            "comments_page_for_thread": (
+                context.get("comments_page") if parent_id is None else None
+            ),
             "replied_to": replied_to,
         }
     )
@@ -1,9 +1,9 @@
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count, Model
+from django.db.models import Model
 
 from mezzanine import template
-from mezzanine.conf import settings
-from mezzanine.generic.models import AssignedKeyword, Keyword
+from mezzanine.generic.models import KeywordCount
+from mezzanine.utils.cache import add_cache_tags
 
 register = template.Library()
 
@@ -14,8 +14,11 @@ def keywords_for(*args):
     Return a list of ``Keyword`` objects for the given model instance
     or a model class. In the case of a model class, retrieve all
     keywords for all instances of the model and apply a ``weight``
-    attribute that can be used to create a tag cloud.
+    attribute that can be used to create a tag cloud. The weights are
+    stored with the number of times each keyword is assigned to
+    instances of the model, by ``KeywordCount``.
     """
+    add_cache_tags("generic.keyword")
 
     # Handle a model instance.
     if isinstance(args[0], Model):
@@ -37,17 +40,11 @@ def keywords_for(*args):
     except ValueError:
         return []
 
-    content_type = ContentType.objects.get(app_label=app_label, model=model)
-    assigned = AssignedKeyword.objects.filter(content_type=content_type)
-    keywords = Keyword.objects.filter(assignments__in=assigned)
-    keywords = keywords.annotate(item_count=Count("assignments"))
-    if not keywords:
-        return []
-    counts = [keyword.item_count for keyword in keywords]
-    min_count, max_count = min(counts), max(counts)
-    factor = settings.TAG_CLOUD_SIZES - 1.0
-    if min_count != max_count:
-        factor /= max_count - min_count
-    for kywd in keywords:
-        kywd.weight = int(round((kywd.item_count - min_count) * factor)) + 1
+    content_type = ContentType.objects.get_by_natural_key(app_label, model)
+    counts = KeywordCount.objects.filter(content_type=content_type)
+    keywords = []
+    for count in counts.select_related("keyword").order_by("keyword_id"):
+        count.keyword.item_count = count.item_count
+        count.keyword.weight = count.weight
+        keywords.append(count.keyword)
     return keywords
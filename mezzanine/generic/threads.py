@@ -0,0 +1,97 @@
+"""
+Loads the comments shown for a thread of ``ThreadedComment`` instances.
+
+Each comment stores its path in its thread, made of a fixed width
+segment for the ID of each comment from the top-level comment down to
+it, so that a thread is ordered by path, and the replies to a comment
+at any depth are a range of paths starting with the comment's path.
+With ``COMMENTS_PER_PAGE`` set, only a page of top-level comments is
+loaded, along with their replies up to ``COMMENTS_MAX_DEPTH`` levels
+deep, and deeper replies are loaded on request.
+"""
+from django.db.models import Count
+from django.utils.http import int_to_base36
+
+from mezzanine.conf import settings
+from mezzanine.utils.views import paginate
+
+# Width of each comment's segment of a thread path, as a base 36
+# number, which allows for over 78 billion comments.
+SEGMENT_WIDTH = 7
+
+# Sorts after every segment, for the end of a range of thread paths.
+PATH_END = "~"
+
+
+def thread_path_segment(comment_id):
+    """
+    Returns the segment of a thread path for the given comment ID.
+    """
+    return int_to_base36(comment_id).rjust(SEGMENT_WIDTH, "0")
+
+
+def mark_more_replies(queryset, comments, depth):
+    """
+    Sets ``more_replies`` on each of the comments at the given depth
+    to the number of replies to it in the queryset, since their
+    replies aren't loaded with them.
+    """
+    deepest = [comment for comment in comments if comment.depth == depth]
+    if deepest:
+        replies = queryset.filter(replied_to__in=deepest).order_by()
+        counts = replies.values_list("replied_to").annotate(count=Count("id"))
+        counts = dict(counts)
+        for comment in deepest:
+            comment.more_replies = counts.get(comment.id, 0)
+
+
+def comments_page(queryset, page_num, per_page, max_depth):
+    """
+    Returns a page of the top-level comments in the queryset, and a
+    list of those comments followed by their replies up to
+    ``max_depth`` levels deep, ordered by thread path. The replies are
+    read with a single range query on the thread path.
+    """
+    top_level = queryset.filter(depth=0).order_by("thread_path")
+    page = paginate(
+        top_level.select_related("user"),
+        page_num,
+        per_page,
+        settings.MAX_PAGING_LINKS,
+    )
+    comments = list(page.object_list)
+    if comments and max_depth:
+        replies = queryset.filter(
+            thread_path__gt=comments[0].thread_path,
+            thread_path__lt=comments[-1].thread_path + PATH_END,
+            depth__gt=0,
+            depth__lte=max_depth,
+        )
+        comments += replies.order_by("thread_path").select_related("user")
+    mark_more_replies(queryset, comments, max_depth)
+    return page, comments
+
+
+def replies_for(queryset, comment, max_depth):
+    """
+    Returns a list of the replies in the queryset to the given comment
+    up to ``max_depth`` levels below it, ordered by thread path.
+    """
+    replies = queryset.filter(
+        thread_path__startswith=comment.thread_path,
+        depth__gt=comment.depth,
+        depth__lte=comment.depth + max_depth,
+    )
+    replies = list(replies.order_by("thread_path").select_related("user"))
+    mark_more_replies(queryset, replies, comment.depth + max_depth)
+    return replies
+
+
+def comment_page_number(comment, queryset, per_page):
+    """
+    Returns the number of the page of top-level comments in the
+    queryset that the given comment's thread is on.
+    """
+    top_level_path = comment.thread_path[:SEGMENT_WIDTH]
+    before = queryset.filter(depth=0, thread_path__lt=top_level_path).count()
+    return before // per_page + 1
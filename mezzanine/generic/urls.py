@@ -5,4 +5,9 @@ from mezzanine.generic import views
 urlpatterns = [
     path("rating/", views.rating, name="rating"),
     path("comment/", views.comment, name="comment"),
+    path(
+        "comment/<int:comment_id>/replies/",
+        views.comment_replies,
+        name="comment_replies",
+    ),
 ]
@@ -1,19 +1,22 @@
+from collections import defaultdict
 from json import dumps
 from string import punctuation
 
 from django.apps import apps
 from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.messages import error
 from django.db.models import ObjectDoesNotExist
-from django.http import HttpResponse, HttpResponseBadRequest
-from django.shortcuts import redirect
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404, redirect
 from django.template.response import TemplateResponse
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
 from mezzanine.conf import settings
 from mezzanine.generic.forms import RatingForm, ThreadedCommentForm
-from mezzanine.generic.models import Keyword
+from mezzanine.generic.models import Keyword, ThreadedComment
+from mezzanine.generic.threads import replies_for
 from mezzanine.utils.cache import add_cache_bypass
 from mezzanine.utils.deprecation import is_authenticated, request_is_ajax
 from mezzanine.utils.importing import import_dotted_path
@@ -125,6 +128,46 @@ def comment(request, template="generic/comments.html", extra_context=None):
     return TemplateResponse(request, template, context)
 
 
+def comment_replies(
+    request, comment_id, template="generic/includes/comment.html", extra_context=None
+):
+    """
+    Renders the replies to a comment below ``COMMENTS_MAX_DEPTH``, for
+    the "Load more replies" links shown when comments are paginated.
+    """
+    if request.user.is_staff:
+        comments = ThreadedComment.objects.all()
+    else:
+        comments = ThreadedComment.objects.visible()
+    comment = get_object_or_404(comments, id=comment_id)
+    obj = comment.content_object
+    if obj is None:
+        raise Http404
+    # Check access to the commented object the same way its detail
+    # view and ``PageMiddleware`` do.
+    if getattr(obj, "login_required", False) and not is_authenticated(request.user):
+        return redirect_to_login(request.get_full_path())
+    published = getattr(obj.__class__._default_manager, "published", None)
+    if published and not published(for_user=request.user).filter(pk=obj.pk).exists():
+        raise Http404
+    thread = defaultdict(list)
+    max_depth = max(settings.COMMENTS_MAX_DEPTH, 1)
+    for reply in replies_for(comments, comment, max_depth):
+        thread[reply.replied_to_id].append(reply)
+    form_class = import_dotted_path(settings.COMMENT_FORM_CLASS)
+    form = form_class(request, obj)
+    context = {
+        "comments_for_thread": thread[comment.id],
+        "all_comments": thread,
+        "posted_comment_form": form,
+        "unposted_comment_form": form,
+        "comment_url": reverse("comment"),
+        "object_for_comments": obj,
+    }
+    context.update(extra_context or {})
+    return TemplateResponse(request, template, context)
+
+
 def rating(request):
     """
     Handle a ``RatingForm`` submission and redirect back to its
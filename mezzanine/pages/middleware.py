@@ -6,6 +6,7 @@ from django.utils.deprecation import MiddlewareMixin
 from mezzanine.conf import settings
 from mezzanine.pages import context_processors, page_processors
 from mezzanine.pages.models import Page
+from mezzanine.pages.tree import get_page_tree
 from mezzanine.pages.views import page as page_view
 from mezzanine.utils.conf import middlewares_or_subclasses_installed
 from mezzanine.utils.deprecation import is_authenticated
@@ -59,14 +60,19 @@ class PageMiddleware(MiddlewareMixin):
         Per-request mechanics for the current page object.
         """
 
-        # Load the closest matching page by slug, and assign it to the
-        # request object. If none found, skip all further processing.
+        # Find the closest matching page by slug in the page tree, then
+        # load it and assign it to the request object, along with its
+        # ascendants from the tree. If none found, skip all further
+        # processing.
         slug = path_to_slug(request.path_info)
-        pages = Page.objects.with_ascendants_for_slug(
+        pages = get_page_tree().with_ascendants_for_slug(
             slug, for_user=request.user, include_login_required=True
         )
+        page = None
         if pages:
-            page = pages[0]
+            page = Page.objects.filter(id=pages[0].id).first()
+        if page is not None:
+            page._ascendants = pages[0]._ascendants
             setattr(request, "page", page)
             context_processors.page(request)
         else:
@@ -0,0 +1,48 @@
+from django.db import migrations, models
+
+
+def set_paths(apps, schema_editor):
+    """
+    Populate the path and depth fields for existing pages.
+    """
+    Page = apps.get_model("pages", "Page")
+    parents = dict(Page._base_manager.values_list("id", "parent_id"))
+    paths = {}
+
+    def path_for(id):
+        if id not in paths:
+            parent_id = parents.get(id)
+            if parent_id is None or parent_id not in parents:
+                paths[id] = ""
+            else:
+                paths[id] = f"{path_for(parent_id)}{parent_id}/"
+        return paths[id]
+
+    pages = []
+    for id in parents:
+        path = path_for(id)
+        pages.append(Page(id=id, path=path, depth=path.count("/")))
+    Page._base_manager.bulk_update(pages, ["path", "depth"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pages", "0004_auto_20170411_0504"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="page",
+            name="depth",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="page",
+            name="path",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=255
+            ),
+        ),
+        migrations.RunPython(set_paths, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from urllib.parse import urljoin
 
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_delete, post_save
 from django.urls import resolve, reverse
 from django.utils.translation import gettext
 from django.utils.translation import gettext_lazy as _
@@ -15,7 +18,7 @@ from mezzanine.core.models import (
 )
 from mezzanine.pages.fields import MenusField
 from mezzanine.pages.managers import PageManager
-from mezzanine.utils.sites import override_current_site_id
+from mezzanine.pages.tree import get_page_tree, refresh_page_tree
 from mezzanine.utils.urls import path_to_slug
 
 
@@ -43,12 +46,16 @@ class Page(BasePage, ContentTyped):
     )
     in_menus = MenusField(_("Show in menus"), blank=True, null=True)
     titles = models.CharField(editable=False, max_length=1000, null=True)
+    path = models.CharField(editable=False, max_length=255, default="", db_index=True)
+    depth = models.IntegerField(editable=False, default=0)
     login_required = models.BooleanField(
         _("Login required"),
         default=False,
         help_text=_("If checked, only logged in users can view this page"),
     )
 
+    sitemap_fields = BasePage.sitemap_fields + ("content_model",)
+
     class Meta:
         verbose_name = _("Page")
         verbose_name_plural = _("Pages")
@@ -76,17 +83,45 @@ class Page(BasePage, ContentTyped):
 
     def save(self, *args, **kwargs):
         """
-        Create the titles field using the titles up the parent chain
-        and set the initial value for ordering.
+        Create the titles field from the titles up the parent chain,
+        and the path and depth fields from the parent, and update them
+        for descendants if they've changed.
         """
         self.set_content_model()
-        titles = [self.title]
+        old_titles, old_path, old_depth = self.titles, self.path, self.depth
         parent = self.parent
-        while parent is not None:
-            titles.insert(0, parent.title)
-            parent = parent.parent
-        self.titles = " / ".join(titles)
+        if parent is None:
+            self.titles = self.title
+            self.path = ""
+            self.depth = 0
+        else:
+            self.titles = " / ".join((parent.titles or parent.title, self.title))
+            self.path = f"{parent.path}{parent.id}/"
+            self.depth = parent.depth + 1
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if not adding:
+            self.update_descendants(old_titles, old_path, old_depth)
+
+    def update_descendants(self, old_titles, old_path, old_depth):
+        """
+        Rewrites the titles, path and depth fields of all descendants
+        when the page's own have changed, with a single query.
+        """
+        descendants = self.get_descendants(path=old_path)
+        updates = {}
+        if old_path != self.path:
+            prefix = len(f"{old_path}{self.id}/")
+            updates["path"] = Concat(
+                Value(f"{self.path}{self.id}/"), Substr("path", prefix + 1)
+            )
+            updates["depth"] = F("depth") + (self.depth - old_depth)
+        if old_titles and old_titles != self.titles:
+            updates["titles"] = Concat(
+                Value(self.titles), Substr("titles", len(old_titles) + 1)
+            )
+        if updates and descendants.update(**updates):
+            refresh_page_tree(self.site_id)
 
     def description_from_content(self):
         """
@@ -104,34 +139,39 @@ class Page(BasePage, ContentTyped):
         """
         Returns the ascendants for the page. Ascendants are cached in
         the ``_ascendants`` attribute, which is populated when the page
-        is loaded via ``Page.objects.with_ascendants_for_slug``.
+        is loaded via ``Page.objects.with_ascendants_for_slug``, and
+        are otherwise read from the page tree for the page's site
+        (see ``mezzanine.pages.tree``).
         """
         if not self.parent_id:
             # No parents at all, bail out.
             return []
-        if not hasattr(self, "_ascendants"):
-            # _ascendants has not been either page.get_ascendants or
-            # Page.objects.assigned by with_ascendants_for_slug, so
-            # run it to see if we can retrieve all parents in a single
-            # query, which will occur if the slugs for each of the pages
-            # have not been customised.
-            if self.slug:
-                kwargs = {"for_user": for_user}
-                with override_current_site_id(self.site_id):
-                    pages = Page.objects.with_ascendants_for_slug(self.slug, **kwargs)
-                self._ascendants = pages[0]._ascendants
-            else:
-                self._ascendants = []
-        if not self._ascendants:
-            # Page has a parent but with_ascendants_for_slug failed to
-            # find them due to custom slugs, so retrieve the parents
-            # recursively.
-            child = self
-            while child.parent_id is not None:
-                self._ascendants.append(child.parent)
-                child = child.parent
+        if not getattr(self, "_ascendants", None):
+            # _ascendants has not been assigned by
+            # Page.objects.with_ascendants_for_slug, or it failed to
+            # find them due to custom slugs, so look them up in the
+            # page tree.
+            self._ascendants = get_page_tree(self.site_id).ascendants(self.id)
+        if self._ascendants is None:
+            # Page isn't in the tree yet, most likely as it's unsaved,
+            # so load the parents listed in its path in one query.
+            path = self.path or f"{self.parent.path}{self.parent_id}/"
+            ids = [int(i) for i in path.split("/") if i]
+            parents = Page._base_manager.in_bulk(ids)
+            self._ascendants = [parents[i] for i in reversed(ids) if i in parents]
         return self._ascendants
 
+    def get_descendants(self, path=None):
+        """
+        Returns a queryset of the page's descendants, matched by the
+        start of their path with an indexed lookup.
+        """
+        if path is None:
+            path = self.path
+        return Page._base_manager.filter(
+            site_id=self.site_id, path__startswith=f"{path}{self.id}/"
+        )
+
     def get_slug(self):
         """
         Recursively build the slug from the chain of parents.
@@ -144,13 +184,21 @@ class Page(BasePage, ContentTyped):
     def set_slug(self, new_slug):
         """
         Changes this page's slug, and all other pages whose slugs
-        start with this page's slug.
+        start with this page's slug, with a single query for the
+        latter.
         """
         slug_prefix = "%s/" % self.slug
-        for page in Page.objects.filter(slug__startswith=slug_prefix):
-            if not page.overridden():
-                page.slug = new_slug + page.slug[len(self.slug) :]
-                page.save()
+        pages = Page.objects.filter(slug__startswith=slug_prefix)
+        overridden = [
+            id
+            for id, slug in pages.values_list("id", "slug")
+            if Page(slug=slug).overridden()
+        ]
+        updated = pages.exclude(id__in=overridden).update(
+            slug=Concat(Value(new_slug), Substr("slug", len(self.slug) + 1))
+        )
+        if updated:
+            refresh_page_tree(self.site_id)
         self.slug = new_slug
         self.save()
 
@@ -163,14 +211,13 @@ class Page(BasePage, ContentTyped):
         old_parent_slug = self.parent.slug if self.parent else ""
         new_parent_slug = new_parent.slug if new_parent else ""
 
-        # Make sure setting the new parent won't cause a cycle.
-        parent = new_parent
-        while parent is not None:
-            if parent.pk == self.pk:
+        # Make sure setting the new parent won't cause a cycle, by
+        # checking this page isn't in the new parent's path.
+        if new_parent is not None and self.pk is not None:
+            if str(self.pk) in new_parent.path.split("/") + [str(new_parent.pk)]:
                 raise AttributeError(
                     "You can't set a page or its child as" " a parent."
                 )
-            parent = parent.parent
 
         self.parent = new_parent
         self.save()
@@ -274,6 +321,18 @@ class Page(BasePage, ContentTyped):
         return None
 
 
+def update_page_tree(sender, instance, **kwargs):
+    """
+    Reloads pages into the page tree when they're saved or deleted.
+    """
+    if isinstance(instance, Page):
+        refresh_page_tree(instance.site_id, [instance.id])
+
+
+post_save.connect(update_page_tree)
+post_delete.connect(update_page_tree)
+
+
 class RichTextPage(Page, RichText):
     """
     Implements the default type of page with a single Rich Text
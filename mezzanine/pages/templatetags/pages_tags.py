@@ -1,4 +1,4 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
 
 from django.core.exceptions import ImproperlyConfigured
 from django.template import TemplateSyntaxError, Variable
@@ -7,6 +7,8 @@ from django.utils.translation import gettext_lazy as _
 
 from mezzanine import template
 from mezzanine.pages.models import Page
+from mezzanine.pages.tree import get_page_tree
+from mezzanine.utils.cache import add_cache_tags
 from mezzanine.utils.urls import home_slug
 
 register = template.Library()
@@ -38,6 +40,7 @@ def page_menu(context, token):
             raise TemplateSyntaxError(error)
     context["menu_template_name"] = template_name
     if "menu_pages" not in context:
+        add_cache_tags("pages.page", request=context.get("request"))
         try:
             user = context["request"].user
             slug = context["request"].path
@@ -46,19 +49,16 @@ def page_menu(context, token):
             slug = ""
         num_children = lambda id: lambda: len(context["menu_pages"][id])
         has_children = lambda id: lambda: num_children(id)() > 0
-        rel = [
-            m.__name__.lower() for m in Page.get_content_models() if not m._meta.proxy
-        ]
-        published = Page.objects.published(for_user=user).select_related(*rel)
+        # Pages are read from the page tree stored in cache, so that
+        # building the menu doesn't query the database.
+        tree = get_page_tree()
         # Store the current page being viewed in the context. Used
         # for comparisons in page.set_menu_helpers.
         if "page" not in context:
-            try:
-                context.dicts[0]["_current_page"] = published.exclude(
-                    content_model="link"
-                ).get(slug=slug)
-            except Page.DoesNotExist:
-                context.dicts[0]["_current_page"] = None
+            current_page = tree.get(slug, for_user=user)
+            if current_page is not None and current_page.content_model == "link":
+                current_page = None
+            context.dicts[0]["_current_page"] = current_page
         elif slug:
             context.dicts[0]["_current_page"] = context["page"]
         # Some homepage related context flags. on_home is just a helper
@@ -74,7 +74,7 @@ def page_menu(context, token):
         # page.set_menu_helpers.
         context.dicts[0]["_parent_page_ids"] = {}
         pages = defaultdict(list)
-        for page in published.order_by("_order"):
+        for page in tree.published(for_user=user):
             page.set_helpers(context)
             context["_parent_page_ids"][page.id] = page.parent_id
             setattr(page, "num_children", num_children(page.id))
@@ -102,14 +102,23 @@ def page_menu(context, token):
     # current menu template being rendered.
     context["page_branch"] = context["menu_pages"].get(parent_page_id, [])
     context["page_branch_in_menu"] = False
+    # Count the children of each page in the menu template once per
+    # template, rather than for every branch rendered.
+    if "_children_in_menu" not in context:
+        context.dicts[0]["_children_in_menu"] = {}
+    children_in_menu = context["_children_in_menu"].get(template_name)
+    if children_in_menu is None:
+        children_in_menu = context["_children_in_menu"][template_name] = Counter(
+            child.parent_id
+            for children in context["menu_pages"].values()
+            for child in children
+            if child.in_menu_template(template_name)
+        )
     for page in context["page_branch"]:
         page.in_menu = page.in_menu_template(template_name)
-        page.num_children_in_menu = 0
+        page.num_children_in_menu = children_in_menu[page.id]
         if page.in_menu:
             context["page_branch_in_menu"] = True
-        for child in context["menu_pages"].get(page.id, []):
-            if child.in_menu_template(template_name):
-                page.num_children_in_menu += 1
         page.has_children_in_menu = page.num_children_in_menu > 0
         page.branch_level = context["branch_level"]
         page.parent = parent_page
@@ -0,0 +1,292 @@
+"""
+A compact copy of the page tree for each site and language, stored in
+cache and used to build page menus, find the page for the current URL
+and look up the ascendants of pages, without querying the database.
+
+The tree is a list of rows holding only the fields needed for those,
+which are turned into deferred ``Page`` instances when read. Trees are
+versioned per site: each change to a page increments the version, and
+applies the change to the trees in cache that are at the previous
+version, so that only the pages changed are loaded again. Any tree
+that has missed a change is rebuilt when next used.
+"""
+from collections import namedtuple
+from functools import partial
+from time import time
+
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.timezone import now
+from django.utils.translation import get_language, override
+
+from mezzanine.conf import settings
+from mezzanine.core.request import current_request
+from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.deprecation import is_authenticated
+from mezzanine.utils.sites import current_site_id
+from mezzanine.utils.urls import home_slug
+
+# Fields stored for each page in the tree.
+FIELDS = (
+    "id",
+    "site_id",
+    "parent_id",
+    "slug",
+    "title",
+    "titles",
+    "content_model",
+    "in_menus",
+    "login_required",
+    "status",
+    "publish_date",
+    "expiry_date",
+    "_order",
+)
+
+# Row stored for each page in the tree.
+PageRow = namedtuple("PageRow", [name.lstrip("_") for name in FIELDS])
+
+
+def _languages():
+    """
+    Languages that trees are stored for. Titles and slugs only differ
+    by language when ``USE_MODELTRANSLATION`` is enabled.
+    """
+    if settings.USE_MODELTRANSLATION:
+        return [code for code, name in settings.LANGUAGES]
+    return [""]
+
+
+def _cache_keys(site_id, language):
+    prefix = f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.pages.tree.{site_id}"
+    return f"{prefix}.version", f"{prefix}.{language}"
+
+
+def _sort_key(row):
+    return (row.order is not None, row.order or 0, row.id)
+
+
+def _load_rows(site_id, language, ids=None):
+    """
+    Queries the rows for the pages of the given site, or only the
+    pages with the given IDs, in the given language.
+    """
+    from mezzanine.pages.models import Page
+
+    pages = Page._base_manager.filter(site_id=site_id)
+    if ids is not None:
+        pages = pages.filter(id__in=ids)
+    if not language:
+        return [PageRow(*values) for values in pages.values_list(*FIELDS)]
+    with override(language):
+        return [PageRow(*values) for values in pages.values_list(*FIELDS)]
+
+
+class PageTree:
+    """
+    The pages of a site, ordered by their ``_order`` field, with
+    lookups by ID, parent ID and slug.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=_sort_key)
+        self._by_id = {row.id: row for row in self.rows}
+        self._by_slug = {row.slug: row for row in self.rows}
+        self._pages = {}
+
+    def page(self, row):
+        """
+        Returns a ``Page`` instance for the given row, with the fields
+        that aren't stored in the tree deferred. Instances are reused
+        for the lifetime of the tree.
+        """
+        from mezzanine.pages.models import Page
+
+        try:
+            return self._pages[row.id]
+        except KeyError:
+            pass
+        values = dict(zip(FIELDS, row))
+        names = [f.attname for f in Page._meta.concrete_fields]
+        names = [name for name in names if name in values]
+        db = router.db_for_read(Page)
+        page = Page.from_db(db, names, [values[name] for name in names])
+        self._pages[row.id] = page
+        return page
+
+    def is_published(self, row, for_user=None, include_login_required=False):
+        """
+        Python version of ``PageManager.published`` for a single row.
+        """
+        from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+
+        if for_user is None or not for_user.is_staff:
+            current = now()
+            if row.status != CONTENT_STATUS_PUBLISHED:
+                return False
+            if row.publish_date is not None and row.publish_date > current:
+                return False
+            if row.expiry_date is not None and row.expiry_date < current:
+                return False
+        unauthenticated = for_user and not is_authenticated(for_user)
+        return not (
+            unauthenticated
+            and not include_login_required
+            and not settings.PAGES_PUBLISHED_INCLUDE_LOGIN_REQUIRED
+            and row.login_required
+        )
+
+    def published(self, for_user=None, include_login_required=False):
+        """
+        Returns the pages visible to the given user, in order.
+        """
+        return [
+            self.page(row)
+            for row in self.rows
+            if self.is_published(row, for_user, include_login_required)
+        ]
+
+    def get(self, slug, for_user=None):
+        """
+        Returns the page visible to the given user with the given
+        slug, or ``None``.
+        """
+        row = self._by_slug.get(slug)
+        if row is not None and self.is_published(row, for_user):
+            return self.page(row)
+        return None
+
+    def ascendants(self, page_id):
+        """
+        Returns the chain of parents for the page with the given ID,
+        from its parent up, or ``None`` if the page or one of its
+        parents isn't in the tree.
+        """
+        row = self._by_id.get(page_id)
+        if row is None:
+            return None
+        ascendants = []
+        while row.parent_id is not None:
+            row = self._by_id.get(row.parent_id)
+            if row is None or len(ascendants) == len(self.rows):
+                return None
+            ascendants.append(self.page(row))
+        return ascendants
+
+    def with_ascendants_for_slug(self, slug, **kwargs):
+        """
+        Tree version of ``PageManager.with_ascendants_for_slug``,
+        returning the pages visible to the given user that match the
+        given slug or the slugs within it, from the deepest page up,
+        with the ascendants assigned to the first page when they form
+        a valid chain.
+        """
+        if slug == "/":
+            slugs = [home_slug()]
+        else:
+            parts = slug.split("/")
+            slugs = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+        rows = [self._by_slug.get(s) for s in set(slugs)]
+        rows = [r for r in rows if r is not None and self.is_published(r, **kwargs)]
+        pages = [self.page(r) for r in sorted(rows, key=lambda r: r.slug)[::-1]]
+        if not pages:
+            return []
+        pages[0]._ascendants = []
+        for i, page in enumerate(pages):
+            try:
+                parent = pages[i + 1]
+            except IndexError:
+                if page.parent_id:
+                    break
+            else:
+                if page.parent_id != parent.id:
+                    break
+        else:
+            pages[0]._ascendants = pages[1:]
+        return pages
+
+
+def get_page_tree(site_id=None):
+    """
+    Returns the ``PageTree`` for the given or current site, in the
+    current language. Trees are stored in cache when it's installed,
+    and on the current request so that they're only loaded once per
+    request.
+    """
+    site_id = int(site_id or current_site_id())
+    language = ""
+    if settings.USE_MODELTRANSLATION:
+        language = get_language() or ""
+    request = current_request()
+    trees = getattr(request, "_page_trees", {})
+    try:
+        return trees[(site_id, language)]
+    except KeyError:
+        pass
+    rows = None
+    if cache_installed():
+        version_key, tree_key = _cache_keys(site_id, language)
+        found = cache.get_many([version_key, tree_key])
+        version = found.get(version_key)
+        if version is None:
+            # Start from the current time rather than zero, so that a
+            # tree left in cache from before the version was evicted
+            # can't match it again.
+            cache.add(version_key, int(time() * 1000), None)
+            version = cache.get(version_key)
+        packed = found.get(tree_key)
+        if packed is not None and packed[0] == version:
+            rows = packed[1]
+        else:
+            rows = _load_rows(site_id, language)
+            cache.set(tree_key, (version, rows), None)
+    if rows is None:
+        rows = _load_rows(site_id, language)
+    tree = PageTree(rows)
+    if request is not None:
+        trees[(site_id, language)] = tree
+        request._page_trees = trees
+    return tree
+
+
+def refresh_page_tree(site_id, ids=None):
+    """
+    Reloads the pages with the given IDs into the stored trees for
+    the given site, removing those that no longer exist. Called when
+    pages are saved, deleted or reordered. If no IDs are given, the
+    trees are rebuilt when next used instead, for changes to many
+    pages at once. The stored trees are updated once the transaction
+    is committed, so that trees loaded by other requests in the
+    meantime can't be stored as the new version, and changes that are
+    rolled back are never applied.
+    """
+    request = current_request()
+    if request is not None:
+        request.__dict__.pop("_page_trees", None)
+    if cache_installed():
+        from mezzanine.pages.models import Page
+
+        using = router.db_for_write(Page)
+        refresh = partial(_refresh_stored_trees, int(site_id), ids)
+        transaction.on_commit(refresh, using=using)
+
+
+def _refresh_stored_trees(site_id, ids):
+    version_key, _ = _cache_keys(site_id, "")
+    try:
+        version = cache.incr(version_key)
+    except ValueError:
+        # No version stored, so there are no valid trees to update.
+        return
+    if ids is None:
+        return
+    ids = set(ids)
+    for language in _languages():
+        _, tree_key = _cache_keys(site_id, language)
+        packed = cache.get(tree_key)
+        if packed is None or packed[0] != version - 1:
+            # The tree has missed another change, and will be rebuilt.
+            continue
+        rows = [row for row in packed[1] if row.id not in ids]
+        rows.extend(_load_rows(site_id, language, ids))
+        cache.set(tree_key, (version, sorted(rows, key=_sort_key)), None)
@@ -6,6 +6,7 @@ from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
 
 from mezzanine.pages.models import Page, PageMoveException
+from mezzanine.pages.tree import refresh_page_tree
 from mezzanine.utils.urls import home_slug
 
 
@@ -20,6 +21,8 @@ def admin_page_ordering(request):
         return int(s) if s.isdigit() else None
 
     page = get_object_or_404(Page, id=get_id(request.POST["id"]))
+    site_id = page.site_id
+    reordered = set()
     old_parent_id = page.parent_id
     new_parent_id = get_id(request.POST["parent_id"])
     new_parent = Page.objects.get(id=new_parent_id) if new_parent_id else None
@@ -38,9 +41,14 @@ def admin_page_ordering(request):
         pages = Page.objects.filter(parent_id=old_parent_id)
         for i, page in enumerate(pages.order_by("_order")):
             Page.objects.filter(id=page.id).update(_order=i)
+            reordered.add(page.id)
     # Set the new order for the moved page and its current siblings.
     for i, page_id in enumerate(request.POST.getlist("siblings[]")):
         Page.objects.filter(id=get_id(page_id)).update(_order=i)
+        reordered.add(get_id(page_id))
+    # Orders are updated without saving, so reload the pages that
+    # were reordered into the page tree.
+    refresh_page_tree(site_id, reordered)
 
     return HttpResponse("ok")
 
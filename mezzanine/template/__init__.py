@@ -1,7 +1,44 @@
 import warnings
-from functools import wraps
+from functools import partial, wraps
 
 from django import template
+from django.utils.translation import get_language
+
+
+def cached_call(tag_func, cache_tags, args, kwargs):
+    """
+    Calls the function for a cached ``as_tag`` tag, or returns its
+    value from cache.
+    """
+    from mezzanine.utils.cache import (
+        add_cache_tags,
+        cache_get,
+        cache_installed,
+        cache_release,
+        cache_set,
+    )
+    from mezzanine.utils.sites import current_site_id
+
+    add_cache_tags(*cache_tags)
+    if not cache_installed():
+        return tag_func(*args, **kwargs)
+    key = "{}.{}.{}.{}.{!r}.{!r}".format(
+        tag_func.__module__,
+        tag_func.__name__,
+        current_site_id(),
+        get_language(),
+        args,
+        sorted(kwargs.items()),
+    )
+    value = cache_get(key)
+    if value is None:
+        try:
+            value = tag_func(*args, **kwargs)
+        except Exception:
+            cache_release(key)
+            raise
+        cache_set(key, value, tags=cache_tags)
+    return value
 
 
 class Library(template.Library):
@@ -11,13 +48,21 @@ class Library(template.Library):
     of template tags.
     """
 
-    def as_tag(self, tag_func):
+    def as_tag(self, tag_func=None, cache_tags=None):
         """
         Creates a tag expecting the format:
         ``{% tag_name as var_name %}``
         The decorated func returns the value that is given to
         ``var_name`` in the template.
+
+        When used as ``as_tag(cache_tags=[...])``, the value is stored
+        in cache when it's installed, for each site, language and set
+        of arguments, until any of the given dependency tags are
+        invalidated with ``mezzanine.utils.cache.invalidate_cache_tags``.
+        The tags are also added to the response being rendered.
         """
+        if tag_func is None:
+            return partial(self.as_tag, cache_tags=cache_tags)
         package = tag_func.__module__.split(".")[0]
         if package != "mezzanine":
             warnings.warn(
@@ -49,7 +94,11 @@ class Library(template.Library):
                                 kwargs[name] = resolve(val)
                                 continue
                         args.append(resolve(arg))
-                    context[parts[-1]] = tag_func(*args, **kwargs)
+                    if cache_tags is None:
+                        context[parts[-1]] = tag_func(*args, **kwargs)
+                    else:
+                        value = cached_call(tag_func, cache_tags, args, kwargs)
+                        context[parts[-1]] = value
                     return ""
 
             return AsTagNode()
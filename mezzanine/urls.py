@@ -3,13 +3,12 @@ This is the main ``urlconf`` for Mezzanine - it sets up patterns for
 all the various Mezzanine apps, third-party apps like Grappelli and
 filebrowser.
 """
-from django.contrib.sitemaps.views import sitemap
 from django.http import HttpResponse
 from django.urls import include, path, re_path
 from django.views.i18n import JavaScriptCatalog
 
 from mezzanine.conf import settings
-from mezzanine.core.sitemaps import DisplayableSitemap
+from mezzanine.core import views as core_views
 
 urlpatterns = []
 
@@ -29,11 +28,15 @@ if settings.DEBUG and "debug_toolbar" in settings.INSTALLED_APPS:
             path("__debug__/", include(debug_toolbar.urls)),
         ]
 
-# Django's sitemap app.
+# Sitemap index, with a sitemap for each model split into pages.
 if "django.contrib.sitemaps" in settings.INSTALLED_APPS:
-    sitemaps = {"sitemaps": {"all": DisplayableSitemap}}
     urlpatterns += [
-        path("sitemap.xml", sitemap, sitemaps),
+        path("sitemap.xml", core_views.sitemap_index, name="sitemap"),
+        path(
+            "sitemap-<section>.xml",
+            core_views.sitemap_section,
+            name="sitemap_section",
+        ),
     ]
 
 # Return a robots.txt that disallows all spiders when DEBUG is True.
@@ -1,14 +1,35 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from hashlib import md5
-from time import time
+from time import sleep, time
+from uuid import uuid4
 
 from django.core.cache import cache
+from django.db import connections
+from django.template import Template
 from django.utils.cache import _i18n_cache_key_suffix
 
 from mezzanine.conf import settings
+from mezzanine.core.request import current_request
 from mezzanine.utils.conf import middlewares_or_subclasses_installed
 from mezzanine.utils.sites import current_site_id
 
+# Counters for cache activity in the current process, see ``cache_stats``.
+_stats = {}
+
+# Locks held by the current thread for the cache entries it's
+# regenerating, mapping hashed keys to the token stored in each lock
+# and the time it was acquired, used to measure refresh latency.
+_held = threading.local()
+
+# Thread pool for refreshing entries in the background, created on
+# first use when ``CACHE_REFRESH_THREADS`` is set.
+_refresh_pool = None
+
+# Guards ``_stats`` and the creation of ``_refresh_pool``.
+_lock = threading.Lock()
+
 
 def _hashed_key(key):
     """
@@ -18,7 +39,99 @@ def _hashed_key(key):
     return md5(key.encode("utf-8")).hexdigest()
 
 
-def cache_set(key, value, timeout=None, refreshed=False):
+def _count(name, value=1):
+    with _lock:
+        _stats[name] = _stats.get(name, 0) + value
+
+
+def cache_stats(reset=False):
+    """
+    Returns the counters for cache activity in the current process:
+    ``hits``, ``misses`` (including entries the caller should
+    regenerate), ``stale`` (stale entries served while another client
+    regenerates them), ``coalesced`` (waits for another client to
+    generate a missing entry), ``background`` (refreshes run in the
+    background thread pool), and ``refreshes`` with
+    ``refresh_seconds`` for the total time taken to regenerate entries.
+    """
+    with _lock:
+        stats = dict.fromkeys(
+            ("hits", "misses", "stale", "coalesced", "background", "refreshes"), 0
+        )
+        stats["refresh_seconds"] = 0.0
+        stats.update(_stats)
+        if reset:
+            _stats.clear()
+    return stats
+
+
+def _held_locks():
+    if not hasattr(_held, "locks"):
+        _held.locks = {}
+    return _held.locks
+
+
+def _acquire_lock(hashed_key):
+    """
+    Tries to acquire the lock for regenerating a cache entry. The lock
+    is a separate key in the cache backend, added atomically, so that
+    only one client across all processes regenerates an entry. The lock
+    expires after ``CACHE_SET_DELAY_SECONDS`` in case the client
+    never stores the entry.
+    """
+    token = uuid4().hex
+    if cache.add(hashed_key + ".lock", token, settings.CACHE_SET_DELAY_SECONDS):
+        _held_locks()[hashed_key] = (token, time())
+        return True
+    return False
+
+
+def _release_lock(hashed_key):
+    """
+    Releases the lock for regenerating a cache entry, if it's held by
+    the current thread. The lock is only deleted if it still stores
+    the thread's token, since once it expires another client may
+    acquire it.
+    """
+    try:
+        token, started = _held_locks().pop(hashed_key)
+    except KeyError:
+        return
+    lock_key = hashed_key + ".lock"
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+    _count("refreshes")
+    _count("refresh_seconds", time() - started)
+
+
+def _refresh(key, refresh, timeout, held):
+    """
+    Regenerates a cache entry in the background thread pool, taking
+    over the lock acquired by the requesting thread.
+    """
+    hashed_key = _hashed_key(key)
+    _held_locks()[hashed_key] = held
+    try:
+        cache_set(key, refresh(), timeout)
+        _count("background")
+    finally:
+        _release_lock(hashed_key)
+        connections.close_all()
+
+
+def _refresh_in_background(key, refresh, timeout, held):
+    global _refresh_pool
+    if _refresh_pool is None:
+        with _lock:
+            if _refresh_pool is None:
+                _refresh_pool = ThreadPoolExecutor(
+                    max_workers=settings.CACHE_REFRESH_THREADS,
+                    thread_name_prefix="mezzanine-cache",
+                )
+    _refresh_pool.submit(_refresh, key, refresh, timeout, held)
+
+
+def cache_set(key, value, timeout=None, refreshed=False, tags=None):
     """
     Wrapper for ``cache.set``. Stores the cache entry packed with
     the desired cache expiry time. When the entry is retrieved from
@@ -28,32 +141,163 @@ def cache_set(key, value, timeout=None, refreshed=False):
     is not returned, so that a cache miss occurs and the entry
     should be set by the caller, but all other callers will still get
     the stale entry, so no real cache misses ever occur.
+
+    Storing a fresh entry releases the lock for regenerating it, if
+    it's held by the current thread.
+
+    If ``tags`` is given, the current version of each tag is stored
+    with the entry, and the entry is treated as stale once any of the
+    tags is invalidated with ``invalidate_cache_tags``.
     """
     if timeout is None:
         timeout = settings.CACHE_MIDDLEWARE_SECONDS
     refresh_time = timeout + time()
     real_timeout = timeout + settings.CACHE_SET_DELAY_SECONDS
     packed = (value, refresh_time, refreshed)
-    return cache.set(_hashed_key(key), packed, real_timeout)
+    if tags:
+        packed += (cache_tag_versions(tags),)
+    hashed_key = _hashed_key(key)
+    result = cache.set(hashed_key, packed, real_timeout)
+    if not refreshed:
+        _release_lock(hashed_key)
+    return result
 
 
-def cache_get(key):
+def cache_get(key, refresh=None, timeout=None):
     """
     Wrapper for ``cache.get``. The expiry time for the cache entry
     is stored with the entry. If the expiry time has past, put the
     stale entry back into cache, and don't return it to trigger a
     fake cache miss.
+
+    Only one client regenerates an entry: a lock is acquired in the
+    cache backend by the client that gets the fake cache miss, and
+    every other client is served the stale entry. When the entry
+    doesn't exist at all, other clients wait up to
+    ``CACHE_LOCK_WAIT_SECONDS`` for it to be stored. Callers that get
+    no entry and then don't store one should call ``cache_release``.
+
+    If ``refresh`` is given, it's called with no arguments to
+    regenerate the entry, which is then stored with ``timeout``. This
+    happens in a background thread when the entry is requested within
+    ``CACHE_SET_DELAY_SECONDS`` of its expiry, and
+    ``CACHE_REFRESH_THREADS`` is set.
     """
-    packed = cache.get(_hashed_key(key))
+    hashed_key = _hashed_key(key)
+    packed = cache.get(hashed_key)
     if packed is None:
+        if _acquire_lock(hashed_key):
+            _count("misses")
+            return None
+        # Another client is generating the entry, so wait for it,
+        # until it's stored or the other client releases the lock.
+        lock_key = hashed_key + ".lock"
+        deadline = time() + settings.CACHE_LOCK_WAIT_SECONDS
+        while time() < deadline:
+            sleep(0.05)
+            found = cache.get_many([hashed_key, lock_key])
+            if hashed_key in found:
+                _count("coalesced")
+                return found[hashed_key][0]
+            if lock_key not in found:
+                break
+        _count("misses")
         return None
-    value, refresh_time, refreshed = packed
-    if (time() > refresh_time) and not refreshed:
-        cache_set(key, value, settings.CACHE_SET_DELAY_SECONDS, True)
-        return None
+    value, refresh_time, refreshed = packed[:3]
+    now = time()
+    if refreshed:
+        _count("stale")
+        return value
+    if now > refresh_time or _tags_invalidated(packed):
+        if _acquire_lock(hashed_key):
+            cache_set(key, value, settings.CACHE_SET_DELAY_SECONDS, True)
+            _count("misses")
+            return None
+        _count("stale")
+        return value
+    early = refresh_time - settings.CACHE_SET_DELAY_SECONDS
+    if refresh and settings.CACHE_REFRESH_THREADS and now > early:
+        if _acquire_lock(hashed_key):
+            held = _held_locks().pop(hashed_key)
+            _refresh_in_background(key, refresh, timeout, held)
+    _count("hits")
     return value
 
 
+def cache_tag(obj):
+    """
+    Returns the dependency tag for a model instance or class, used
+    with ``cache_set`` and ``invalidate_cache_tags``. Models using
+    multi-table inheritance share the tags of their base concrete
+    model, so that a ``RichTextPage`` and its ``Page`` are the same.
+    """
+    model = obj._meta.concrete_model
+    while model._meta.parents:
+        model = next(iter(model._meta.parents))
+    if isinstance(obj, type):
+        return model._meta.label_lower
+    return f"{model._meta.label_lower}.{obj.pk}"
+
+
+def _tag_key(tag):
+    return _hashed_key(f"{settings.CACHE_MIDDLEWARE_KEY_PREFIX}.tag.{tag}")
+
+
+def cache_tag_versions(tags):
+    """
+    Returns a dict mapping each of the given tags to its current
+    version, or ``None`` for tags that have never been invalidated.
+    """
+    keys = {tag: _tag_key(tag) for tag in tags}
+    versions = cache.get_many(list(keys.values()))
+    return {tag: versions.get(key) for tag, key in keys.items()}
+
+
+def _tags_invalidated(packed):
+    """
+    Checks whether any tags stored with a packed cache entry have
+    been invalidated since the entry was stored.
+    """
+    if len(packed) < 4:
+        return False
+    versions = packed[3]
+    return cache_tag_versions(versions) != versions
+
+
+def invalidate_cache_tags(*tags):
+    """
+    Marks every cache entry stored with any of the given tags as
+    stale, by giving each tag a new version.
+    """
+    version = time()
+    cache.set_many({_tag_key(tag): version for tag in tags}, None)
+
+
+def add_cache_tags(*tags, request=None):
+    """
+    Records dependency tags for the response to the current request,
+    which are then stored with it by the cache middleware. Used by
+    template tags and context processors that render content outside
+    of the response's template context, such as the page menu.
+    """
+    if request is None:
+        request = current_request()
+    if request is not None:
+        try:
+            request._cache_tags.update(tags)
+        except AttributeError:
+            request._cache_tags = set(tags)
+
+
+def cache_release(key):
+    """
+    Releases the lock acquired when ``cache_get`` returns no entry,
+    for callers that decide not to store the entry with ``cache_set``,
+    so that other clients don't wait for it.
+    """
+    _release_lock(_hashed_key(key))
+
+
 @lru_cache(maxsize=None)
 def cache_installed():
     """
@@ -101,6 +345,47 @@ def nevercache_token():
     return "nevercache." + settings.NEVERCACHE_KEY
 
 
+# Compiled ``nevercache`` fragments, keyed by the hash of their source,
+# so that each fragment is only ever parsed once per process.
+_nevercache_templates = {}
+
+
+def nevercache_split(content):
+    """
+    Splits rendered response content on the ``nevercache`` token,
+    into the packed format stored in cache by Mezzanine's cache
+    middleware: a list where even items are static byte segments, and
+    odd items are ``(key, source)`` pairs for the enclosed template
+    code, ``key`` being a hash of ``source``.
+    """
+    parts = content.split(nevercache_token().encode("utf-8"))
+    for i in range(1, len(parts), 2):
+        parts[i] = (md5(parts[i]).hexdigest(), parts[i].decode("utf-8"))
+    return parts
+
+
+def nevercache_render(parts, context):
+    """
+    Renders the packed content returned by ``nevercache_split``.
+    Static segments are used as is, and only the ``nevercache``
+    fragments are rendered, using templates compiled once and then
+    looked up by the hash of their source.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    rendered = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            key, source = part
+            try:
+                template = _nevercache_templates[key]
+            except KeyError:
+                template = _nevercache_templates[key] = Template(source)
+            part = template.render(context).encode("utf-8")
+        rendered.append(part)
+    return b"".join(rendered)
+
+
 def add_cache_bypass(url):
     """
     Adds the current time to the querystring of the URL to force a
@@ -2,8 +2,11 @@ import os
 import sys
 import threading
 from contextlib import contextmanager
+from time import time
 
 from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db import transaction
 
 from mezzanine.conf import settings
 from mezzanine.core.request import current_request
@@ -11,6 +14,114 @@ from mezzanine.utils.conf import middlewares_or_subclasses_installed
 
 SITE_PERMISSION_MIDDLEWARE = "mezzanine.core.middleware.SitePermissionMiddleware"
 
+# Seconds the site IDs a user has permission for are cached, in case
+# a change to them is missed.
+SITE_PERMISSION_CACHE_SECONDS = 300
+
+# Site IDs mapped to lowercase domains, loaded from ``Site`` once per
+# process, the version of the sites they were loaded for, and when.
+_domains = {"site_ids": None, "version": None, "loaded": 0}
+
+# Seconds after which the table of domains is loaded again when
+# there's no cache to share the version of the sites between
+# processes, so that changes made in other processes are seen.
+DOMAINS_RELOAD_SECONDS = 10
+
+# Counters for site lookups in the current process, see ``site_stats``.
+_stats = {}
+
+# Guards ``_domains`` and ``_stats``.
+_lock = threading.Lock()
+
+
+def _sites_version():
+    """
+    Returns the version of the sites stored in cache when it's
+    installed, which is incremented when a site is saved or deleted,
+    so that each process loads the table of domains again.
+    """
+    from mezzanine.utils.cache import cache_installed
+
+    if not cache_installed():
+        return None
+    # Don't use Mezzanine's cache_key_prefix here, since it uses
+    # current_site_id to create a per-site cache key.
+    version_key = "%s.sites.version" % settings.CACHE_MIDDLEWARE_KEY_PREFIX
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, int(time() * 1000), None)
+        version = cache.get(version_key)
+    return version
+
+
+def site_id_for_domain(domain):
+    """
+    Returns the ID of the ``Site`` with the given domain, ignoring
+    case, or ``None`` if there isn't one. Domains are looked up in a
+    table loaded from the database once per process, and loaded again
+    when sites change, or every ``DOMAINS_RELOAD_SECONDS`` without a
+    cache installed.
+    """
+    version = _sites_version()
+    with _lock:
+        site_ids = _domains["site_ids"]
+        if site_ids is not None:
+            if _domains["version"] != version:
+                site_ids = None
+            elif version is None:
+                if time() - _domains["loaded"] > DOMAINS_RELOAD_SECONDS:
+                    site_ids = None
+        _stats["lookups"] = _stats.get("lookups", 0) + 1
+    if site_ids is None:
+        sites = Site.objects.values_list("domain", "id")
+        site_ids = {domain.lower(): site_id for domain, site_id in sites}
+        with _lock:
+            _domains.update(site_ids=site_ids, version=version, loaded=time())
+            _stats["loads"] = _stats.get("loads", 0) + 1
+    return site_ids.get(domain.lower())
+
+
+def invalidate_sites(sender=None, using=None, **kwargs):
+    """
+    Called when a ``Site`` is saved or deleted. Clears the table of
+    domains once the transaction is committed, since a table loaded
+    any earlier could be kept with the old domains.
+    """
+    transaction.on_commit(clear_domains, using=using)
+
+
+def clear_domains():
+    """
+    Clears the table of domains held by the current process, and
+    increments the version of the sites stored in cache so that other
+    processes load it again.
+    """
+    from mezzanine.utils.cache import cache_installed
+
+    with _lock:
+        _domains.update(site_ids=None, version=None)
+    if cache_installed():
+        try:
+            cache.incr("%s.sites.version" % settings.CACHE_MIDDLEWARE_KEY_PREFIX)
+        except ValueError:
+            pass
+
+
+def site_stats(reset=False):
+    """
+    Returns the counters for site lookups in the current process:
+    ``lookups`` of a domain in the table of domains, and ``loads`` of
+    the table from the database. The number of calls to
+    ``current_site_id`` made for a request is stored on the request
+    as ``site_lookups``.
+    """
+    with _lock:
+        stats = dict.fromkeys(("lookups", "loads"), 0)
+        stats.update(_stats)
+        if reset:
+            _stats.clear()
+    return stats
+
 
 def current_site_id():
     """
@@ -22,43 +133,29 @@ def current_site_id():
       - ``site_id`` in session. Used in the admin so that admin users
         can switch sites and stay on the same domain for the admin.
       - The id of the Site object corresponding to the hostname in the current
-        request. This result is cached.
+        request, looked up in a table of domains held by each process.
       - ``MEZZANINE_SITE_ID`` environment variable, so management
         commands or anything else outside of a request can specify a
         site.
       - ``SITE_ID`` setting.
 
     If a current request exists and the current site is not overridden, the
-    site ID is stored on the request object to speed up subsequent calls.
+    site ID is stored on the request object to speed up subsequent calls,
+    and the number of calls made for the request is stored on it as
+    ``site_lookups``.
     """
 
     if hasattr(override_current_site_id.thread_local, "site_id"):
         return override_current_site_id.thread_local.site_id
 
-    from mezzanine.utils.cache import cache_get, cache_installed, cache_set
-
     request = current_request()
+    if request is not None:
+        request.site_lookups = getattr(request, "site_lookups", 0) + 1
     site_id = getattr(request, "site_id", None)
     if request and not site_id:
         site_id = request.session.get("site_id", None)
         if not site_id:
-            domain = request.get_host().lower()
-            if cache_installed():
-                # Don't use Mezzanine's cache_key_prefix here, since it
-                # uses this very function we're in right now to create a
-                # per-site cache key.
-                bits = (settings.CACHE_MIDDLEWARE_KEY_PREFIX, domain)
-                cache_key = "%s.site_id.%s" % bits
-                site_id = cache_get(cache_key)
-            if not site_id:
-                try:
-                    site = Site.objects.get(domain__iexact=domain)
-                except Site.DoesNotExist:
-                    pass
-                else:
-                    site_id = site.id
-                    if cache_installed():
-                        cache_set(cache_key, site_id)
+            site_id = site_id_for_domain(request.get_host())
     if not site_id:
         site_id = os.environ.get("MEZZANINE_SITE_ID", settings.SITE_ID)
     if request and site_id and not getattr(settings, "TESTING", False):
@@ -72,8 +169,8 @@ def override_current_site_id(site_id):
     Context manager that overrides the current site id for code executed
     within it. Used to access SiteRelated objects outside the current site.
     """
-    if hasattr(override_current_site_id.thread_local,'site_id'):
-        raise RecursionError(f'''override_current_site_id can't be nested''')
+    if hasattr(override_current_site_id.thread_local, "site_id"):
+        raise RecursionError("override_current_site_id can't be nested")
     override_current_site_id.thread_local.site_id = site_id
     try:
         yield
@@ -86,19 +183,90 @@ def override_current_site_id(site_id):
 override_current_site_id.thread_local = threading.local()
 
 
+def _site_permission_keys(user_id):
+    prefix = "%s.site_permissions.%s" % (
+        settings.CACHE_MIDDLEWARE_KEY_PREFIX,
+        user_id,
+    )
+    return f"{prefix}.version", prefix
+
+
+def user_site_ids(user):
+    """
+    Returns the IDs of the sites the user has a ``SitePermission``
+    for. The IDs are stored on the user for the current request, and
+    in cache when it's installed, along with a version number for the
+    user that's incremented whenever their permissions change.
+    """
+    from mezzanine.core.models import SitePermission
+    from mezzanine.utils.cache import cache_installed
+
+    try:
+        return user._site_ids
+    except AttributeError:
+        pass
+    if not user.is_authenticated:
+        return frozenset()
+    if cache_installed():
+        version_key, ids_key = _site_permission_keys(user.pk)
+        cached = cache.get_many([version_key, ids_key])
+        version = cached.get(version_key)
+        if version is None:
+            cache.add(version_key, int(time() * 1000), None)
+            version = cache.get(version_key)
+        packed = cached.get(ids_key)
+        if packed is not None and packed[0] == version:
+            user._site_ids = packed[1]
+            return user._site_ids
+    through = SitePermission.sites.through.objects
+    site_ids = through.filter(sitepermission__user=user.pk)
+    user._site_ids = frozenset(site_ids.values_list("site_id", flat=True))
+    if cache_installed():
+        timeout = SITE_PERMISSION_CACHE_SECONDS
+        cache.set(ids_key, (version, user._site_ids), timeout)
+    return user._site_ids
+
+
+def invalidate_site_permissions(user_id):
+    """
+    Called when a user's ``SitePermission`` or its sites change.
+    Increments the version of their site IDs stored in cache once the
+    change is committed, so that site IDs read before then aren't
+    cached under the new version.
+    """
+    from mezzanine.utils.cache import cache_installed
+
+    def increment_version():
+        version_key, _ = _site_permission_keys(user_id)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            pass
+
+    if cache_installed():
+        transaction.on_commit(increment_version)
+
+
 def has_site_permission(user):
     """
     Checks if a staff user has staff-level access for the current site.
     The actual permission lookup occurs in ``SitePermissionMiddleware``
     which then marks the request with the ``has_site_permission`` flag,
-    so that we only query the db once per request, so this function
-    serves as the entry point for everything else to check access. We
-    also fall back to an ``is_staff`` check if the middleware is not
-    installed, to ease migration.
+    so that we only look up the user's sites once per request, so this
+    function serves as the entry point for everything else to check
+    access. If the user hasn't been marked, their sites are looked up
+    with ``user_site_ids``. We also fall back to an ``is_staff`` check
+    if the middleware is not installed, to ease migration.
     """
     if not middlewares_or_subclasses_installed([SITE_PERMISSION_MIDDLEWARE]):
         return user.is_staff and user.is_active
-    return getattr(user, "has_site_permission", False)
+    try:
+        return user.has_site_permission
+    except AttributeError:
+        pass
+    if user.is_superuser:
+        return True
+    return user.is_staff and int(current_site_id()) in user_site_ids(user)
 
 
 def host_theme_path():
@@ -2,6 +2,7 @@ import os
 from shutil import copyfile, copytree
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.db import connection
 from django.template import Context, Template
 from django.test import TestCase as BaseTestCase
@@ -9,6 +10,7 @@ from django.test.client import RequestFactory
 
 from mezzanine.conf import settings
 from mezzanine.utils.importing import path_for_import
+from mezzanine.utils.sites import clear_domains
 
 
 class TestCase(BaseTestCase):
@@ -21,8 +23,13 @@ class TestCase(BaseTestCase):
         """
         Creates an admin user, sets up the debug cursor, so that we can
         track the number of queries used in various places, and creates
-        a request factory for views testing.
+        a request factory for views testing. Also clears the cache and
+        the table of site domains, so that entries such as page trees
+        stored by tests that install the cache don't outlive the
+        database rows they were built from.
         """
+        cache.clear()
+        clear_domains()
         self._username = "test"
         self._password = "test"
         self._emailaddress = "example@example.com"
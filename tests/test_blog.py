@@ -1,17 +1,30 @@
 import datetime
 import re
 from unittest import skipUnless
+from unittest.mock import patch
 from urllib.parse import urlparse
 
 import pytz
+from django.db import connection
 from django.template import Context, Template
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
+from django.utils.timezone import now
 
-from mezzanine.blog.models import BlogPost
+from mezzanine.blog.archive import get_blog_months
+from mezzanine.blog.feeds import PostsRSS
+from mezzanine.blog.models import BlogCategory, BlogPost
 from mezzanine.conf import settings
-from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+from mezzanine.core import richtext
+from mezzanine.core.models import CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED
 from mezzanine.pages.models import Page, RichTextPage
+from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.deprecation import (
+    get_middleware_setting,
+    get_middleware_setting_name,
+)
 from mezzanine.utils.tests import TestCase
 
 
@@ -32,6 +45,91 @@ class BlogTests(TestCase):
         response = self.client.get(blog_post.get_absolute_url())
         self.assertEqual(response.status_code, 200)
 
+    def test_blog_feed_conditional_get(self):
+        """
+        Test that feeds are validated by the IDs and ``updated`` dates
+        of their items, and that item descriptions are cached.
+        """
+        blog_post = BlogPost.objects.create(
+            title="Post", user=self._user, content="<img src='/image.jpg'>"
+        )
+        url = reverse("blog_post_feed", args=("rss",))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+        with patch.object(PostsRSS, "item_description") as item_description:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        self.assertFalse(item_description.called)
+        # Only the ETag validates the feed, since removing items doesn't
+        # change its latest date.
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        # Scheduled posts are dated when they're published.
+        publish_date = now().replace(microsecond=0) + datetime.timedelta(days=1)
+        scheduled = BlogPost.objects.create(
+            title="Scheduled", user=self._user, publish_date=publish_date
+        )
+        scheduled.updated = publish_date - datetime.timedelta(days=2)
+        BlogPost.objects.filter(id=scheduled.id).update(updated=scheduled.updated)
+        with patch("mezzanine.core.managers.now", return_value=publish_date):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Last-Modified"], http_date(publish_date.timestamp()))
+        scheduled.delete()
+        response = self.client.get(reverse("blog_post_feed", args=("atom",)))
+        self.assertNotEqual(response["ETag"], etag)
+        blog_post.title = "Updated"
+        blog_post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        feed = PostsRSS()
+        feed._request = self._request_factory.get(url)
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                with patch("mezzanine.blog.feeds.absolute_urls") as absolute_urls:
+                    absolute_urls.return_value = "<img src='http://testserver/'>"
+                    for _ in range(2):
+                        description = feed.item_description(blog_post)
+                        self.assertEqual(description, absolute_urls.return_value)
+                self.assertEqual(absolute_urls.call_count, 1)
+            finally:
+                cache_installed.cache_clear()
+
+    def test_blog_post_filtered_content(self):
+        """
+        Test that blog post content is stored once filtered, and only
+        used while the content and filters haven't changed.
+        """
+        filters = ("mezzanine.utils.html.escape",)
+        with override_settings(RICHTEXT_FILTERS=filters):
+            blog_post = BlogPost.objects.create(
+                title="Post", user=self._user, content="<foo><p>Filtered</p></foo>"
+            )
+            blog_post = BlogPost.objects.get(id=blog_post.id)
+            self.assertEqual(blog_post.content_filtered, "<p>Filtered</p>")
+            with patch.object(richtext, "apply_filters") as apply_filters:
+                self.assertEqual(blog_post.filtered_content(), "<p>Filtered</p>")
+            self.assertFalse(apply_filters.called)
+            blog_post.content = "<foo><p>Changed</p></foo>"
+            self.assertEqual(blog_post.filtered_content(), "<p>Changed</p>")
+            with override_settings(RICHTEXT_FILTER_LEVEL=3):
+                self.assertEqual(blog_post.filtered_content(), blog_post.content)
+
     @skipUnless(
         "mezzanine.accounts" in settings.INSTALLED_APPS
         and "mezzanine.pages" in settings.INSTALLED_APPS,
@@ -113,3 +211,98 @@ class BlogTemplatetagsTests(TestCase):
 
         with self.settings(TIME_ZONE="Etc/GMT-1"):
             self.assertEqual(render_blog_months(), "May 1, 2017, midnight")
+
+    @override_settings(USE_TZ=True)
+    def test_blog_months_cached(self):
+        """
+        Test that months are stored in cache for each timezone, and
+        counted again when posts are published, unpublished or deleted.
+        """
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+
+        def make_blog_post(*datetime_args):
+            return BlogPost.objects.create(
+                user=self._user,
+                status=CONTENT_STATUS_PUBLISHED,
+                publish_date=datetime.datetime(*datetime_args, tzinfo=pytz.utc),
+            )
+
+        def months():
+            return [(m["date"].month, m["post_count"]) for m in get_blog_months()]
+
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                make_blog_post(2017, 4, 30, 23)
+                self.assertEqual(months(), [(4, 1)])
+                with self.settings(TIME_ZONE="Etc/GMT-1"):
+                    self.assertEqual(months(), [(5, 1)])
+                with self.captureOnCommitCallbacks(execute=True):
+                    blog_post = make_blog_post(2017, 3, 1)
+                    # Months are counted again once changes commit.
+                    self.assertEqual(months(), [(4, 1)])
+                self.assertEqual(months(), [(4, 1), (3, 1)])
+                with self.captureOnCommitCallbacks(execute=True):
+                    blog_post.status = CONTENT_STATUS_DRAFT
+                    blog_post.save()
+                    make_blog_post(2017, 4, 1).delete()
+                    make_blog_post(2017, 3, 31, 23)
+                self.assertEqual(months(), [(4, 1), (3, 1)])
+                with self.settings(TIME_ZONE="Etc/GMT-1"):
+                    self.assertEqual(months(), [(5, 1), (4, 1)])
+                # Changes that aren't committed, or don't change which
+                # posts are published, don't count them again.
+                with self.captureOnCommitCallbacks(execute=False):
+                    make_blog_post(2017, 2, 1)
+                blog_post.title = "Renamed"
+                with self.captureOnCommitCallbacks(execute=True):
+                    blog_post.save()
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(months(), [(4, 1), (3, 1)])
+                self.assertFalse([q for q in queries if "GROUP BY" in q["sql"]])
+            finally:
+                cache_installed.cache_clear()
+
+    def test_blog_sidebar_tags_cached(self):
+        """
+        Test that the blog sidebar tags are cached until blog posts or
+        categories change.
+        """
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        template = Template(
+            "{% load blog_tags %}{% blog_categories as categories %}"
+            "{% for category in categories %}{{ category }} "
+            "{{ category.post_count }},{% endfor %}"
+        )
+        blog_post = BlogPost.objects.create(
+            title="Post", user=self._user, status=CONTENT_STATUS_PUBLISHED
+        )
+        blog_post.categories.add(BlogCategory.objects.create(title="First"))
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                self.assertEqual(template.render(Context({})), "First 1,")
+                with self.assertNumQueries(0):
+                    self.assertEqual(template.render(Context({})), "First 1,")
+                blog_post.categories.add(BlogCategory.objects.create(title="Second"))
+                self.assertEqual(template.render(Context({})), "First 1,Second 1,")
+            finally:
+                cache_installed.cache_clear()
@@ -2,11 +2,20 @@ import warnings
 from unittest import skipUnless
 
 from django.conf import settings as django_settings
+from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.utils.encoding import force_str
 
 from mezzanine.conf import register_setting, registry, settings
 from mezzanine.conf.context_processors import TemplateSettings
+from mezzanine.conf.forms import SettingsForm
 from mezzanine.conf.models import Setting
+from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.deprecation import (
+    get_middleware_setting,
+    get_middleware_setting_name,
+)
+from mezzanine.utils.sites import override_current_site_id
 from mezzanine.utils.tests import TestCase
 
 
@@ -219,6 +228,78 @@ class ConfTests(TestCase):
         setting.delete()
         self.assertNotEqual(original_site_title, new_site_title)
 
+    def test_editable_shared_cache(self):
+        """
+        Test that editable settings are stored in cache and reused
+        across requests without querying the database, until they're
+        changed.
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from mezzanine.core.request import _thread_local
+
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                Setting.objects.create(name="SITE_TITLE", value="Cached")
+                request = self._request_factory.get("/")
+                request.session = {}
+                _thread_local.request = request
+                self.assertEqual(settings.SITE_TITLE, "Cached")
+                settings.clear_cache()
+                with CaptureQueriesContext(connection) as queries:
+                    self.assertEqual(settings.SITE_TITLE, "Cached")
+                self.assertFalse([q for q in queries if "conf_setting" in q["sql"]])
+                version_key = settings._cache_keys(settings.SITE_ID)[0]
+                version = cache.get(version_key)
+                setting = Setting.objects.get(name="SITE_TITLE")
+                setting.value = "Changed"
+                with self.captureOnCommitCallbacks(execute=True):
+                    setting.save()
+                    # The version is only incremented once committed.
+                    self.assertEqual(cache.get(version_key), version)
+                self.assertEqual(cache.get(version_key), version + 1)
+                self.assertEqual(settings.SITE_TITLE, "Changed")
+                del _thread_local.request
+                self.assertEqual(settings.SITE_TITLE, "Changed")
+                with self.captureOnCommitCallbacks(execute=True):
+                    setting.delete()
+                self.assertNotEqual(settings.SITE_TITLE, "Changed")
+                # Saving the settings form increments the version once.
+                form = SettingsForm()
+                data = {name: field.initial for name, field in form.fields.items()}
+                data["SITE_TITLE"] = "Form"
+                form = SettingsForm(data)
+                self.assertTrue(form.is_valid())
+                version = cache.get(version_key)
+                with self.captureOnCommitCallbacks(execute=True):
+                    form.save()
+                self.assertEqual(cache.get(version_key), version + 1)
+                self.assertEqual(settings.SITE_TITLE, "Form")
+                # Settings loaded outside of a request are kept per site.
+                site = Site.objects.create(domain="other.example.com")
+                with self.captureOnCommitCallbacks(execute=True):
+                    Setting.objects.create(name="SITE_TITLE", value="Other", site=site)
+                self.assertNotEqual(settings.SITE_TITLE, "Other")
+                with override_current_site_id(site.id):
+                    self.assertEqual(settings.SITE_TITLE, "Other")
+                self.assertNotEqual(settings.SITE_TITLE, "Other")
+            finally:
+                _thread_local.__dict__.pop("request", None)
+                settings.clear_cache()
+                cache_installed.cache_clear()
+
 
 class TemplateSettingsTests(TestCase):
     def test_allowed(self):
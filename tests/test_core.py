@@ -1,15 +1,22 @@
+import os
 import re
 import subprocess
+import threading
 from importlib.metadata import requires
+from tempfile import TemporaryDirectory
+from time import time
 from unittest import skipUnless
+from unittest.mock import patch
 from urllib.parse import urlencode
 
 import pytest
 import pytz
 from django.contrib.admin import AdminSite
 from django.contrib.admin.options import InlineModelAdmin
+from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.management import CommandError, call_command
 from django.db import models
@@ -27,23 +34,52 @@ from django.utils.timezone import datetime, now, timedelta
 from requirements import parse
 
 from mezzanine.conf import settings
+from mezzanine.core import richtext
 from mezzanine.core.admin import BaseDynamicInlineAdmin
 from mezzanine.core.fields import MultiChoiceField, RichTextField
 from mezzanine.core.managers import DisplayableManager
 from mezzanine.core.middleware import FetchFromCacheMiddleware
-from mezzanine.core.models import CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED
-from mezzanine.core.templatetags.mezzanine_tags import initialize_nevercache
+from mezzanine.core.models import (
+    CONTENT_STATUS_DRAFT,
+    CONTENT_STATUS_PUBLISHED,
+    Displayable,
+    SearchTerm,
+    SitePermission,
+)
+from mezzanine.core.redirects import _version_key, get_redirect
+from mezzanine.core.sitemaps import DisplayableModelSitemap
+from mezzanine.core.templatetags.mezzanine_tags import (
+    initialize_nevercache,
+    richtext_filters,
+)
 from mezzanine.forms.admin import FieldAdmin
 from mezzanine.forms.models import Form
 from mezzanine.pages.models import Page, RichTextPage
-from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.cache import (
+    _hashed_key,
+    cache_get,
+    cache_installed,
+    cache_release,
+    cache_set,
+    cache_stats,
+    nevercache_render,
+    nevercache_split,
+    nevercache_token,
+)
 from mezzanine.utils.deprecation import (
     get_middleware_setting,
     get_middleware_setting_name,
 )
 from mezzanine.utils.html import TagCloser, escape
 from mezzanine.utils.importing import import_dotted_path
-from mezzanine.utils.sites import current_site_id, override_current_site_id
+from mezzanine.utils.sites import (
+    current_site_id,
+    has_site_permission,
+    override_current_site_id,
+    site_id_for_domain,
+    site_stats,
+    user_site_ids,
+)
 from mezzanine.utils.tests import TestCase
 from mezzanine.utils.urls import admin_url
 
@@ -92,6 +128,24 @@ class CoreTests(TestCase):
         """
         self.assertEqual(escape("<foo><div></div></foo>"), "<div></div>")
 
+    def test_richtext_filters_memoized(self):
+        """
+        Test that content passed through ``RICHTEXT_FILTERS`` is only
+        filtered once for each version of the filters.
+        """
+        content = "<foo><div>Memoized</div></foo>"
+        filters = ("mezzanine.utils.html.escape",)
+        with override_settings(RICHTEXT_FILTERS=filters):
+            with patch.object(
+                richtext, "apply_filters", wraps=richtext.apply_filters
+            ) as apply_filters:
+                self.assertEqual(richtext_filters(content), "<div>Memoized</div>")
+                self.assertEqual(richtext_filters(content), "<div>Memoized</div>")
+                self.assertEqual(apply_filters.call_count, 1)
+                with override_settings(RICHTEXT_FILTER_LEVEL=3):
+                    self.assertEqual(richtext_filters(content), content)
+                self.assertEqual(apply_filters.call_count, 2)
+
     def test_utils(self):
         """
         Miscellanous tests for the ``mezzanine.utils`` package.
@@ -144,6 +198,51 @@ class CoreTests(TestCase):
         """
         Objects with status "Draft" should not be within search results.
         """
+        self._test_search()
+
+    @skipUnless("mezzanine.pages" in settings.INSTALLED_APPS, "pages app required")
+    @override_settings(SEARCH_BACKEND="mezzanine.core.search.IndexSearchBackend")
+    def test_search_index(self):
+        """
+        Test search with the index maintained by ``IndexSearchBackend``.
+        """
+        self._test_search()
+        page = RichTextPage.objects.get(title="test another test page")
+        self.assertEqual(
+            set(SearchTerm.objects.filter(object_pk=page.pk).values_list("term")),
+            {("test",), ("another",), ("page",)},
+        )
+        self.assertEqual(len(RichTextPage.objects.search("anoth")), 0)
+        # Rebuild the index, and search with a phrase again.
+        SearchTerm.objects.all().delete()
+        call_command("rebuild_search_index", verbosity=0)
+        results = RichTextPage.objects.search('"another test"')
+        self.assertEqual([r.id for r in results], [page.id])
+        page.delete()
+        self.assertFalse(SearchTerm.objects.filter(object_pk=page.pk).exists())
+
+    @skipUnless("mezzanine.pages" in settings.INSTALLED_APPS, "pages app required")
+    @override_settings(SEARCH_AGE_SCALE_FACTOR=0)
+    def test_search_results_merged(self):
+        """
+        Results across models are merged by score, and slicing them
+        only reads as many rows from each model as needed.
+        """
+        published = {"status": CONTENT_STATUS_PUBLISHED}
+        for i in range(3):
+            RichTextPage.objects.create(title="merge " * (i * 2 + 1), **published)
+            Form.objects.create(title="merge " * (i * 2 + 2), **published)
+        results = Displayable.objects.search("merge")
+        self.assertEqual(len(results), 6)
+        scores = [r.result_count for r in Displayable.objects.search("merge")]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual([type(r) for r in results[:3]], [Form, RichTextPage, Form])
+        self.assertEqual([r.id for r in results[2:4]], [r.id for r in results][2:4])
+        self.assertEqual(results[1].id, list(results)[1].id)
+        with self.assertNumQueries(len(results.querysets)):
+            Displayable.objects.search("merge")[:2]
+
+    def _test_search(self):
         RichTextPage.objects.all().delete()
         published = {"status": CONTENT_STATUS_PUBLISHED}
         first = RichTextPage.objects.create(
@@ -287,6 +386,68 @@ class CoreTests(TestCase):
         site1.delete()
         site2.delete()
 
+    def test_site_domains(self):
+        """
+        Test that sites are looked up by domain in a table held by the
+        process, which is loaded again when sites change.
+        """
+        site = Site.objects.create(domain="Domains.example.com")
+        self.assertEqual(site_id_for_domain("domains.example.com"), site.id)
+        site_stats(reset=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(site_id_for_domain("DOMAINS.example.com"), site.id)
+            self.assertIsNone(site_id_for_domain("missing.example.com"))
+        self.assertEqual(site_stats(), {"lookups": 2, "loads": 0})
+        # Changes made by other processes are seen after a while
+        # without a cache installed.
+        Site.objects.filter(id=site.id).update(domain="other.example.com")
+        with patch("mezzanine.utils.sites.time", return_value=time() + 60):
+            self.assertEqual(site_id_for_domain("other.example.com"), site.id)
+        self.assertEqual(site_stats()["loads"], 1)
+        site_stats(reset=True)
+        site.domain = "renamed.example.com"
+        with self.captureOnCommitCallbacks(execute=True):
+            site.save()
+            # The table is kept until the change is committed.
+            self.assertIsNone(site_id_for_domain("renamed.example.com"))
+        self.assertIsNone(site_id_for_domain("other.example.com"))
+        self.assertEqual(site_id_for_domain("renamed.example.com"), site.id)
+        self.assertEqual(site_stats()["loads"], 1)
+        # With a cache installed, other processes load the table again
+        # once the change is committed.
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                self.assertEqual(site_id_for_domain("renamed.example.com"), site.id)
+                site.domain = "cached.example.com"
+                with self.captureOnCommitCallbacks(execute=True):
+                    site.save()
+                    self.assertIsNone(site_id_for_domain("cached.example.com"))
+                self.assertEqual(site_id_for_domain("cached.example.com"), site.id)
+            finally:
+                cache_installed.cache_clear()
+
+        request = self._request_factory.get("/", HTTP_HOST="cached.example.com")
+        request.session = {}
+        with patch("mezzanine.utils.sites.current_request", return_value=request):
+            with override_settings(ALLOWED_HOSTS=["cached.example.com"]):
+                self.assertEqual(current_site_id(), site.id)
+            self.assertEqual(current_site_id(), site.id)
+        self.assertEqual(request.site_lookups, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            site.delete()
+        self.assertIsNone(site_id_for_domain("cached.example.com"))
+
     def _static_proxy(self, querystring):
         self.client.login(username=self._username, password=self._password)
         proxy_url = "{}?{}".format(reverse("static_proxy"), querystring)
@@ -310,6 +471,71 @@ class CoreTests(TestCase):
         querystring = urlencode([("u", static("test/image.jpg"))])
         self._static_proxy(querystring)
 
+    def test_sitemaps(self):
+        """
+        Test the sitemap index lists each page of the sitemap for each
+        model, and that pages are read by ranges of IDs and streamed.
+        """
+        published = {"status": CONTENT_STATUS_PUBLISHED}
+        pages = [RichTextPage.objects.create(title=f"Page {i}") for i in range(5)]
+        RichTextPage.objects.create(title="Draft", status=CONTENT_STATUS_DRAFT)
+        RichTextPage.objects.create(title="Hidden", in_sitemap=False, **published)
+        RichTextPage.objects.create(title="External", slug="http://example.com")
+        host = "http://" + Site.objects.get(id=current_site_id()).domain
+        with patch.object(DisplayableModelSitemap, "limit", 2):
+            response = self.client.get(reverse("sitemap"))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            index = b"".join(response.streaming_content).decode("utf-8")
+            locs = re.findall("<loc>(.*?)</loc>", index)
+            section = reverse("sitemap_section", args=("pages.page",))
+            self.assertIn(host + section, locs)
+            self.assertIn(host + section + "?p=3", locs)
+            self.assertNotIn(host + section + "?p=4", locs)
+
+            found = []
+            for page in range(1, 4):
+                response = self.client.get(section, {"p": page})
+                content = b"".join(response.streaming_content).decode("utf-8")
+                found.extend(re.findall("<loc>(.*?)</loc>", content))
+            lastmod = pages[0].updated.strftime("%Y-%m-%d")
+            self.assertIn("<lastmod>%s</lastmod>" % lastmod, content)
+            self.assertEqual(found, [host + p.get_absolute_url() for p in pages])
+            response = self.client.get(section, {"p": 4})
+            self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("sitemap_section", args=("missing",)))
+        self.assertEqual(response.status_code, 404)
+
+    def test_sitemap_pages_sparse_ids(self):
+        """
+        Test that gaps in the IDs of a sitemap's items don't produce
+        empty pages of the sitemap.
+        """
+        pages = [RichTextPage.objects.create(title=f"Page {i}") for i in range(12)]
+        for page in pages[1:-1]:
+            page.delete()
+        sitemap = DisplayableModelSitemap(RichTextPage)
+        with patch.object(DisplayableModelSitemap, "limit", 2):
+            paginator = sitemap.paginator
+            self.assertEqual(paginator.num_pages, 2)
+            found = [list(paginator.page(n).object_list) for n in paginator.page_range]
+            self.assertEqual(found, [[pages[0]], [pages[-1]]])
+
+    def test_render_sitemaps(self):
+        """
+        Test the ``render_sitemaps`` command saves the sitemap index
+        and sitemaps to storage.
+        """
+        page = RichTextPage.objects.create(title="Rendered")
+        with TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                call_command("render_sitemaps", verbosity=0)
+                with open(os.path.join(media_root, "sitemaps", "sitemap.xml")) as f:
+                    self.assertIn("sitemap-pages.page-1.xml", f.read())
+                path = os.path.join(media_root, "sitemaps", "sitemap-pages.page-1.xml")
+                with open(path) as f:
+                    self.assertIn(page.get_absolute_url(), f.read())
+
     def _get_csrftoken(self, response):
         csrf = re.findall(
             rb'<input type="hidden" name="csrfmiddlewaretoken" ' rb'value="([^"]+)">',
@@ -417,6 +643,116 @@ class CoreTests(TestCase):
         site1.delete()
         site2.delete()
 
+    def test_site_permissions_cached(self):
+        """
+        Test that the sites a staff user has permission for are cached
+        until their ``SitePermission`` or its sites change.
+        """
+        User = get_user_model()
+        site1 = Site.objects.get(id=current_site_id())
+        site2 = Site.objects.create(domain="site-permissions.example.com")
+        editor = User.objects.create_user("editor", password="editor", is_staff=True)
+        permission = SitePermission.objects.create(user=editor)
+        permission.sites.add(site1)
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                self.assertEqual(user_site_ids(editor), {site1.id})
+                editor = User.objects.get(id=editor.id)
+                with self.assertNumQueries(0):
+                    self.assertEqual(user_site_ids(editor), {site1.id})
+                    self.assertTrue(has_site_permission(editor))
+                with self.captureOnCommitCallbacks(execute=True):
+                    permission.sites.add(site2)
+                    # The cached IDs are kept until the change is committed.
+                    editor = User.objects.get(id=editor.id)
+                    self.assertEqual(user_site_ids(editor), {site1.id})
+                editor = User.objects.get(id=editor.id)
+                self.assertEqual(user_site_ids(editor), {site1.id, site2.id})
+                with self.captureOnCommitCallbacks(execute=True):
+                    site2.sitepermission_set.remove(permission)
+                editor = User.objects.get(id=editor.id)
+                self.assertEqual(user_site_ids(editor), {site1.id})
+            finally:
+                cache_installed.cache_clear()
+
+        self.client.login(username="editor", password="editor")
+        set_site_url = reverse("set_site")
+        response = self.client.get(set_site_url, {"site_id": site2.id})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(set_site_url, {"site_id": site1.id})
+        self.assertEqual(response.status_code, 302)
+        site2.delete()
+
+    def test_redirects(self):
+        """
+        Test that redirects are looked up in a table held by the
+        process, including those matching a prefix, and that 404s
+        without a redirect don't query it.
+        """
+        from django.contrib.redirects.models import Redirect
+
+        site_id = current_site_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            redirects = [
+                Redirect.objects.create(site_id=site_id, old_path=old, new_path=new)
+                for old, new in (
+                    ("/old/", "/new/"),
+                    ("/gone/", ""),
+                    ("/archive/*", "/blog/*"),
+                    ("/archive/2010/*", "/blog/"),
+                )
+            ]
+        try:
+            self.assertEqual(get_redirect(site_id, "/old/"), "/new/")
+            with self.assertNumQueries(0):
+                self.assertEqual(get_redirect(site_id, "/gone/"), "")
+                self.assertIsNone(get_redirect(site_id, "/missing/"))
+                self.assertIsNone(get_redirect(site_id, "/archive"))
+                path = get_redirect(site_id, "/archive/post/")
+                self.assertEqual(path, "/blog/post/")
+                self.assertEqual(get_redirect(site_id, "/archive/2010/a/"), "/blog/")
+            response = self.client.get("/archive/post/?page=2")
+            self.assertEqual(response.status_code, 301)
+            self.assertEqual(response["Location"], "/blog/post/?page=2")
+            response = self.client.get("/gone/")
+            self.assertEqual(response.status_code, 410)
+            redirects[0].new_path = "/newer/"
+            with self.captureOnCommitCallbacks(execute=True):
+                redirects[0].save()
+                # The table is kept until the change is committed.
+                self.assertEqual(get_redirect(site_id, "/old/"), "/new/")
+            self.assertEqual(get_redirect(site_id, "/old/"), "/newer/")
+            # Changes made by other processes are seen after a while
+            # without a cache installed.
+            Redirect.objects.filter(old_path="/old/").update(new_path="/newest/")
+            self.assertEqual(get_redirect(site_id, "/old/"), "/newer/")
+            with patch("mezzanine.core.redirects.time", return_value=time() + 60):
+                self.assertEqual(get_redirect(site_id, "/old/"), "/newest/")
+            # The version in cache is incremented once per transaction.
+            with patch("mezzanine.core.redirects.cache_installed", return_value=True):
+                with patch("mezzanine.core.redirects.cache") as cache:
+                    with self.captureOnCommitCallbacks(execute=True):
+                        for redirect in redirects:
+                            redirect.save()
+                        self.assertFalse(cache.incr.called)
+                    cache.incr.assert_called_once_with(_version_key(site_id))
+        finally:
+            with self.captureOnCommitCallbacks(execute=True):
+                for redirect in redirects:
+                    redirect.delete()
+        self.assertIsNone(get_redirect(site_id, "/old/"))
+
     def test_dynamic_inline_admins(self):
         """
         Verifies that ``BaseDynamicInlineAdmin`` properly adds the ``_order``
@@ -518,6 +854,88 @@ class CoreTests(TestCase):
         cache_installed.cache_clear()
 
 
+class CacheTests(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache_stats(reset=True)
+
+    def test_cache_get_stale(self):
+        """
+        Test that only one client regenerates a stale entry, and all
+        other clients are served the stale entry meanwhile.
+        """
+        cache_set("stale", "old", timeout=-1)
+        self.assertIsNone(cache_get("stale"))
+        self.assertEqual(cache_get("stale"), "old")
+        self.assertEqual(cache_get("stale"), "old")
+        cache_set("stale", "new")
+        self.assertEqual(cache_get("stale"), "new")
+        stats = cache_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["stale"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["refreshes"], 1)
+
+    def test_cache_get_coalesced(self):
+        """
+        Test that clients wait for a missing entry being generated by
+        another client, instead of generating it themselves.
+        """
+        self.assertIsNone(cache_get("coalesced"))
+        timer = threading.Timer(0.2, lambda: cache_set("coalesced", "value"))
+        timer.start()
+        self.assertEqual(cache_get("coalesced"), "value")
+        timer.join()
+        self.assertEqual(cache_stats()["coalesced"], 1)
+        with self.settings(CACHE_LOCK_WAIT_SECONDS=0):
+            self.assertIsNone(cache_get("coalesced.nowait"))
+            self.assertIsNone(cache_get("coalesced.nowait"))
+        self.assertEqual(cache_stats()["misses"], 3)
+
+    def test_cache_lock_ownership(self):
+        """
+        Test that the lock for regenerating an entry is only released
+        by the client holding it, and not once another client holds it.
+        """
+        lock_key = _hashed_key("owned") + ".lock"
+        self.assertIsNone(cache_get("owned"))
+        thread = threading.Thread(target=lambda: cache_set("owned", "other"))
+        thread.start()
+        thread.join()
+        self.assertIsNotNone(cache.get(lock_key))
+        cache_set("owned", "value")
+        self.assertIsNone(cache.get(lock_key))
+        cache.delete(_hashed_key("owned"))
+        self.assertIsNone(cache_get("owned"))
+        # The lock expired and was acquired by another client.
+        cache.set(lock_key, "other")
+        cache_release("owned")
+        self.assertEqual(cache.get(lock_key), "other")
+        cache.delete(lock_key)
+
+    @override_settings(CACHE_REFRESH_THREADS=1)
+    def test_cache_get_background_refresh(self):
+        """
+        Test that entries close to their expiry are refreshed in the
+        background when a refresh function is given.
+        """
+        refreshed = threading.Event()
+
+        def refresh():
+            refreshed.set()
+            return "new"
+
+        cache_set("background", "old", timeout=1)
+        self.assertEqual(cache_get("background", refresh=refresh), "old")
+        self.assertTrue(refreshed.wait(5))
+        for _ in range(100):
+            if cache_get("background") == "new":
+                break
+            threading.Event().wait(0.05)
+        self.assertEqual(cache_get("background"), "new")
+        self.assertEqual(cache_stats()["background"], 1)
+
+
 class SubclassMiddleware(FetchFromCacheMiddleware):
     pass
 
@@ -623,8 +1041,23 @@ class CSRFTestViews:
 
         return HttpResponse(rendered)
 
+    renders = 0
+
+    def counter_view(request):
+        CSRFTestViews.renders += 1
+        template = "{% load mezzanine_tags %}"
+        template += "renders: " + str(CSRFTestViews.renders)
+        template += "{% nevercache %}"
+        template += " path: {{ request.path }}"
+        template += "{% endnevercache %}"
+
+        rendered = Template(template).render(RequestContext(request))
+
+        return HttpResponse(rendered)
+
     urlpatterns = [
         re_path(r"^nevercache_view/", nevercache_view),
+        re_path(r"^counter_view/", counter_view),
     ]
 
 
@@ -672,6 +1105,55 @@ class CSRFTestCase(TestCase):
         csrf_cookie = response.cookies.get(settings.CSRF_COOKIE_NAME, False)
         self.assertNotEqual(csrf_cookie, False)
 
+    @override_settings(
+        **{
+            "ROOT_URLCONF": CSRFTestViews,
+            "CACHES": {
+                "default": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                }
+            },
+            get_middleware_setting_name(): (
+                "mezzanine.core.middleware.UpdateCacheMiddleware",
+            )
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",),
+            "TESTING": False,
+        }
+    )
+    def test_nevercache_cached_response(self):
+        """
+        Test that responses served from cache only have their
+        ``nevercache`` content rendered.
+        """
+        cache_installed.cache_clear()
+        initialize_nevercache()
+
+        CSRFTestViews.renders = 0
+        for _ in range(2):
+            response = self.client.get("/counter_view/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, b"renders: 1 path: /counter_view/")
+            self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertEqual(CSRFTestViews.renders, 1)
+
+    def test_nevercache_split_render(self):
+        """
+        Test the packed format used for content containing ``nevercache``
+        fragments, and rendering it with different contexts.
+        """
+        token = nevercache_token()
+        content = "<p>{}{{{{ value }}}}{}</p>".format(token, token).encode("utf-8")
+        parts = nevercache_split(content)
+        self.assertEqual(len(parts), 3)
+        self.assertEqual(parts[0], b"<p>")
+        self.assertEqual(parts[1][1], "{{ value }}")
+        self.assertEqual(parts[2], b"</p>")
+        for value in ("foo", "bar"):
+            rendered = nevercache_render(parts, Context({"value": value}))
+            self.assertEqual(rendered, f"<p>{value}</p>".encode("utf-8"))
+        self.assertEqual(nevercache_render([b"static"], Context()), b"static")
+
 
 class DisplayableTestCase(TestCase):
     def test_published(self):
@@ -1,13 +1,22 @@
+import json
+import os
+from datetime import datetime
+from tempfile import TemporaryDirectory
 from unittest import skipUnless
 
 from django import forms
+from django.core.management import call_command
 from django.template import RequestContext
+from django.test import override_settings
+from django.urls import reverse
+from django.utils.timezone import make_aware
 
 from mezzanine.conf import settings
 from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
 from mezzanine.forms import fields
-from mezzanine.forms.forms import FormForForm
-from mezzanine.forms.models import Form
+from mezzanine.forms import forms as entries_forms
+from mezzanine.forms.forms import EntriesForm, FormForForm
+from mezzanine.forms.models import FieldEntry, Form, FormEntry
 from mezzanine.utils.tests import TestCase
 
 
@@ -103,3 +112,168 @@ class TestsForm(TestCase):
 
         self.assertTrue(form.is_valid())
         self.assertEqual(form.email_to(), test_email)
+
+    def create_entries(self, count):
+        """
+        Creates a form with a text field and a checkbox field, and the
+        given number of entries for it.
+        """
+        form = Form.objects.create(title="Entries")
+        name = form.fields.create(label="Name", field_type=fields.TEXT)
+        agree = form.fields.create(label="Agree", field_type=fields.CHECKBOX)
+        for i in range(count):
+            entry_time = make_aware(datetime(2020, 1, i + 1))
+            entry = FormEntry.objects.create(form=form, entry_time=entry_time)
+            entry.fields.create(field_id=name.id, value="Name %s" % i)
+            entry.fields.create(field_id=agree.id, value=str(i % 2 == 0))
+        return form
+
+    def test_export_entries(self):
+        """
+        Test that form entries are streamed from the admin as CSV and
+        JSON Lines, and exported to a file by ``export_form_entries``.
+        """
+        form = self.create_entries(3)
+        self.client.login(username=self._username, password=self._password)
+        url = reverse("admin:form_entries", args=(form.id,))
+        data = {"field_%s_export" % field.id: "on" for field in form.fields.all()}
+        response = self.client.post(url, dict(data, export="Export"))
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines, ["Name,Agree", "Name 2,True", "Name 1,False", "Name 0,True"]
+        )
+
+        response = self.client.post(url, dict(data, export_jsonl="Export"))
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(json.loads(lines[0]), {"Name": "Name 2", "Agree": "True"})
+        self.assertEqual(len(lines), 3)
+
+        with TemporaryDirectory() as directory:
+            path = os.path.join(directory, "entries.jsonl")
+            args = (form.slug, "--format=jsonl", "--output=%s" % path)
+            call_command("export_form_entries", *args, verbosity=0)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(json.loads(lines[-1])["Name"], "Name 0")
+        self.assertEqual(len(lines), 3)
+
+    def test_filter_entries(self):
+        """
+        Test that the filters for each type of field select the
+        matching entries in the database, however they're stored, and
+        that the admin pages through them.
+        """
+        form = self.create_entries(5)
+        name, agree = form.fields.all()
+        colours = form.fields.create(
+            label="Colours",
+            field_type=fields.CHECKBOX_MULTIPLE,
+            choices="Red, Green, Blue",
+        )
+        date = form.fields.create(label="Date", field_type=fields.DATE)
+        values = ["Red, Green", "Green", "", "Red", "Green, Red, Blue"]
+        for i, entry in enumerate(form.entries.order_by("id")):
+            entry.fields.create(field_id=colours.id, value=values[i])
+            entry.fields.create(field_id=date.id, value="2021-02-0%s" % (i + 1))
+        data = {"field_%s_export" % field.id: "on" for field in form.fields.all()}
+
+        def filtered(field, filter_type, **options):
+            field_key = "field_%s_" % field.id
+            filters = {field_key + k: v for k, v in options.items()}
+            filters[field_key + "filter"] = filter_type
+            entries_form = EntriesForm(form, None, dict(data, **filters))
+            self.assertTrue(entries_form.is_valid())
+            return [int(row[0][-1]) for row in entries_form.rows(csv=True)]
+
+        # Filter entries stored as field entries, then as JSON documents.
+        for convert in (False, True):
+            if convert:
+                call_command("convert_form_entries", verbosity=0)
+                self.assertFalse(FieldEntry.objects.exists())
+            self.assertEqual(
+                filtered(name, entries_forms.FILTER_CHOICE_CONTAINS, contains="e 1"),
+                [1],
+            )
+            self.assertEqual(
+                filtered(
+                    name, entries_forms.FILTER_CHOICE_DOESNT_CONTAIN, contains="1"
+                ),
+                [4, 3, 2, 0],
+            )
+            self.assertEqual(
+                filtered(name, entries_forms.FILTER_CHOICE_EQUALS, contains="NAME 3"),
+                [3],
+            )
+            self.assertEqual(
+                filtered(
+                    name, entries_forms.FILTER_CHOICE_DOESNT_EQUAL, contains="Name"
+                ),
+                [4, 3, 2, 1, 0],
+            )
+            self.assertEqual(
+                filtered(
+                    agree, entries_forms.FILTER_CHOICE_CONTAINS_ANY, contains=["True"]
+                ),
+                [4, 2, 0],
+            )
+            for filter_type, choices, expected in (
+                (entries_forms.FILTER_CHOICE_CONTAINS_ANY, ["Red"], [4, 3, 0]),
+                (entries_forms.FILTER_CHOICE_CONTAINS_ALL, ["Red", "Green"], [0]),
+                (entries_forms.FILTER_CHOICE_DOESNT_CONTAIN_ANY, ["Red"], [2, 1]),
+                (
+                    entries_forms.FILTER_CHOICE_DOESNT_CONTAIN_ALL,
+                    ["Green"],
+                    [4, 3, 2, 0],
+                ),
+            ):
+                self.assertEqual(
+                    filtered(colours, filter_type, contains=choices), expected
+                )
+            between = {"from_year": "2021", "from_month": "2", "from_day": "2"}
+            between.update({"to_year": "2021", "to_month": "2", "to_day": "4"})
+            self.assertEqual(
+                filtered(date, entries_forms.FILTER_CHOICE_BETWEEN, **between),
+                [3, 2, 1],
+            )
+
+        self.client.login(username=self._username, password=self._password)
+        url = reverse("admin:form_entries", args=(form.id,))
+        with override_settings(FORMS_ENTRIES_PER_PAGE=2):
+            response = self.client.post(url, dict(data, page="2"))
+        self.assertEqual(response.context["entries_page"].paginator.count, 5)
+        rows = response.context["entry_rows"]
+        self.assertEqual([row[1] for row in rows], ["Name 2", "Name 1"])
+
+    @override_settings(FORMS_ENTRY_STORAGE="json")
+    def test_json_entries(self):
+        """
+        Test that with JSON storage, each submission is a single insert
+        of an entry holding its values, which can be edited and read
+        back for exports.
+        """
+        form = self.create_entries(0)
+        name, agree = form.fields.all()
+        request = self._request_factory.post("/")
+        data = {"field_%s" % name.id: "Name 0", "field_%s" % agree.id: "on"}
+        form_for_form = FormForForm(form, RequestContext(request), data)
+        self.assertTrue(form_for_form.is_valid())
+        with self.assertNumQueries(1):
+            entry = form_for_form.save()
+        self.assertFalse(entry.fields.exists())
+        self.assertEqual(
+            entry.get_field_values(), {name.id: "Name 0", agree.id: "True"}
+        )
+
+        data["field_%s" % name.id] = "Name 1"
+        entry = FormEntry.objects.get(id=entry.id)
+        form_for_form = FormForForm(form, RequestContext(request), data, instance=entry)
+        self.assertEqual(form_for_form.initial["field_%s" % name.id], "Name 0")
+        self.assertTrue(form_for_form.is_valid())
+        form_for_form.save()
+
+        data = {"field_%s_export" % field.id: "on" for field in form.fields.all()}
+        entries_form = EntriesForm(form, None, data)
+        self.assertTrue(entries_form.is_valid())
+        self.assertEqual(list(entries_form.rows(csv=True)), [["Name 1", "True"]])
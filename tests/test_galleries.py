@@ -1,10 +1,17 @@
 import os
 from shutil import rmtree
+from unittest.mock import patch
 from uuid import uuid4
 
+from django.core.management import call_command
+from filebrowser_safe.base import FileObject
+from filebrowser_safe.views import filebrowser_post_upload
+
 from mezzanine.conf import settings
+from mezzanine.core import thumbnails
 from mezzanine.core.templatetags.mezzanine_tags import thumbnail
 from mezzanine.galleries.models import GALLERIES_UPLOAD_DIR, Gallery
+from mezzanine.pages.models import RichTextPage
 from mezzanine.utils.tests import TestCase, copy_test_to_media
 
 
@@ -51,3 +58,60 @@ class GalleriesTests(TestCase):
         os.remove(os.path.join(settings.MEDIA_ROOT, image_name))
         os.remove(os.path.join(thumb_path))
         rmtree(os.path.join(os.path.dirname(thumb_path)))
+
+    def test_thumbnail_manifest(self):
+        """
+        Test that generated thumbnails are recorded in the manifest,
+        and generated in the background when workers are configured.
+        """
+        try:
+            from PIL import Image  # noqa
+        except ImportError:
+            return
+        image_name = "image.jpg"
+        copy_test_to_media("mezzanine.core", image_name)
+        thumb_image = thumbnail(image_name, 30, 30)
+        thumb_path = os.path.join(settings.MEDIA_ROOT, thumb_image)
+        with patch("os.path.exists") as exists:
+            self.assertEqual(thumbnail(image_name, 30, 30), thumb_image)
+        self.assertFalse(exists.called)
+        # Replacing the image via the media library clears its manifest.
+        os.remove(os.path.join(settings.MEDIA_ROOT, thumb_image))
+        filebrowser_post_upload.send(sender=None, path="", file=FileObject(image_name))
+        self.assertEqual(thumbnail(image_name, 30, 30), thumb_image)
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, thumb_image)))
+        with self.settings(THUMBNAILS_WORKERS=1):
+            self.assertEqual(thumbnail(image_name, 40, 40), image_name)
+            thumbnails.wait_for_pending()
+            thumb_image = thumbnail(image_name, 40, 40)
+        self.assertNotEqual(thumb_image, image_name)
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, thumb_image)))
+        # Clean up.
+        os.remove(os.path.join(settings.MEDIA_ROOT, image_name))
+        rmtree(os.path.dirname(thumb_path))
+
+    def test_generate_thumbnails(self):
+        """
+        Test that the ``generate_thumbnails`` command generates the
+        thumbnails for images in rich text content.
+        """
+        try:
+            from PIL import Image  # noqa
+        except ImportError:
+            return
+        image_name = "image.jpg"
+        copy_test_to_media("mezzanine.core", image_name)
+        content = '<img src="%s%s" width="20" height="20">' % (
+            settings.MEDIA_URL,
+            image_name,
+        )
+        RichTextPage.objects.create(title="Thumbnails", content=content)
+        call_command("generate_thumbnails", verbosity=0)
+        thumb_dir = os.path.join(
+            settings.MEDIA_ROOT, settings.THUMBNAILS_DIR_NAME, image_name
+        )
+        thumb_path = os.path.join(thumb_dir, image_name.replace(".", "-20x20."))
+        self.assertTrue(os.path.exists(thumb_path))
+        # Clean up.
+        os.remove(os.path.join(settings.MEDIA_ROOT, image_name))
+        rmtree(thumb_dir)
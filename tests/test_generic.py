@@ -1,14 +1,27 @@
 from unittest import skipUnless
+from unittest.mock import patch
 
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
 from django.template import Context, Template
+from django.test import override_settings
 from django.urls import reverse
 
 from mezzanine.blog.models import BlogPost
 from mezzanine.conf import settings
-from mezzanine.core.models import CONTENT_STATUS_PUBLISHED
+from mezzanine.conf.models import Setting
+from mezzanine.core.models import CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED
+from mezzanine.generic.fields import suspend_related_updates
 from mezzanine.generic.forms import KeywordsWidget, RatingForm
-from mezzanine.generic.models import AssignedKeyword, Keyword, ThreadedComment
+from mezzanine.generic.models import (
+    AssignedKeyword,
+    Keyword,
+    KeywordCount,
+    Rating,
+    ThreadedComment,
+)
+from mezzanine.generic.templatetags.comment_tags import comment_thread
 from mezzanine.generic.views import comment
 from mezzanine.pages.models import RichTextPage
 from mezzanine.utils.tests import TestCase
@@ -43,6 +56,47 @@ class GenericTests(TestCase):
             self.assertEqual(blog_post.rating_sum, _sum)
             self.assertEqual(blog_post.rating_average, average)
 
+    @skipUnless("mezzanine.blog" in settings.INSTALLED_APPS, "blog app required")
+    def test_incremental_aggregates(self):
+        """
+        Test that rating and comment aggregates are updated in place by
+        the difference each rating or comment makes, without saving the
+        object, and that ``reconcile_aggregates`` recalculates them.
+        """
+        blog_post = BlogPost.objects.create(title="Post", user=self._user)
+        content_type = ContentType.objects.get_for_model(blog_post)
+        kwargs = {"content_type": content_type, "object_pk": blog_post.id}
+        low, high = settings.RATINGS_RANGE[0], settings.RATINGS_RANGE[-1]
+        with patch.object(BlogPost, "save") as save:
+            rating = Rating.objects.create(value=low, **kwargs)
+            Rating.objects.create(value=high, **kwargs)
+            rating.value = high
+            rating.save()
+            comment = ThreadedComment.objects.create(site_id=settings.SITE_ID, **kwargs)
+            ThreadedComment.objects.create(site_id=settings.SITE_ID, **kwargs)
+            with override_settings(COMMENTS_REMOVED_VISIBLE=False):
+                comment.is_removed = True
+                comment.save()
+        self.assertFalse(save.called)
+        blog_post = BlogPost.objects.get(id=blog_post.id)
+        self.assertEqual((blog_post.rating_count, blog_post.rating_sum), (2, high * 2))
+        self.assertEqual(blog_post.rating_average, high)
+        self.assertEqual(blog_post.comments_count, 1)
+        rating.delete()
+        blog_post = BlogPost.objects.get(id=blog_post.id)
+        self.assertEqual((blog_post.rating_count, blog_post.rating_sum), (1, high))
+        self.assertEqual(blog_post.rating_average, high)
+
+        BlogPost.objects.filter(id=blog_post.id).update(
+            rating_count=5, rating_sum=0, rating_average=0, comments_count=0
+        )
+        with override_settings(COMMENTS_REMOVED_VISIBLE=False):
+            call_command("reconcile_aggregates", verbosity=0)
+        blog_post = BlogPost.objects.get(id=blog_post.id)
+        self.assertEqual((blog_post.rating_count, blog_post.rating_sum), (1, high))
+        self.assertEqual(blog_post.rating_average, high)
+        self.assertEqual(blog_post.comments_count, 1)
+
     @skipUnless("mezzanine.blog" in settings.INSTALLED_APPS, "blog app required")
     def test_comment_ratings(self):
         """
@@ -97,6 +151,69 @@ class GenericTests(TestCase):
         after = self.queries_used_for_template(template, **context)
         self.assertEqual(before, after)
 
+    @skipUnless("mezzanine.blog" in settings.INSTALLED_APPS, "blog app required")
+    def test_comment_pagination(self):
+        """
+        Test that comments store their thread path and depth, and that
+        paginated comments only load the current page of top-level
+        comments and their replies up to ``COMMENTS_MAX_DEPTH``.
+        """
+        blog_post = BlogPost.objects.create(title="Post", user=self._user)
+        content_type = ContentType.objects.get_for_model(blog_post)
+        threads = []
+        for i in range(3):
+            replied_to = None
+            thread = []
+            for depth in range(3):
+                replied_to = ThreadedComment.objects.create(
+                    content_type=content_type,
+                    object_pk=blog_post.id,
+                    site_id=settings.SITE_ID,
+                    comment=f"Comment {i}.{depth}",
+                    replied_to=replied_to,
+                )
+                thread.append(replied_to)
+            threads.append(thread)
+        top_level, reply, deepest = threads[0]
+        self.assertEqual((top_level.depth, reply.depth, deepest.depth), (0, 1, 2))
+        self.assertTrue(deepest.thread_path.startswith(reply.thread_path))
+        self.assertTrue(reply.thread_path.startswith(top_level.thread_path))
+
+        template = Template("{% load comment_tags %}{% comment_thread blog_post %}")
+        request = self._request_factory.get("/", {"comments_page": 2})
+        request.user = AnonymousUser()
+        context = {
+            "blog_post": blog_post,
+            "request": request,
+            "posted_comment_form": None,
+            "unposted_comment_form": None,
+        }
+        with override_settings(COMMENTS_PER_PAGE=2, COMMENTS_MAX_DEPTH=1):
+            html = template.render(Context(context))
+            self.assertNotIn("Comment 0.0", html)
+            self.assertIn("Comment 2.0", html)
+            self.assertIn("Comment 2.1", html)
+            self.assertNotIn("Comment 2.2", html)
+            replies_url = reverse("comment_replies", args=(threads[2][1].id,))
+            self.assertIn(replies_url, html)
+            self.assertIn("comments_page=1", html)
+            url = threads[2][2].get_absolute_url()
+            self.assertIn("?comments_page=2#comment-", url)
+
+            response = self.client.get(replies_url)
+            self.assertContains(response, "Comment 2.2")
+            self.assertNotContains(response, "Comment 2.1")
+
+            # Without a request, the first page is loaded.
+            thread = comment_thread(Context({"blog_post": blog_post}), blog_post)
+            self.assertEqual(thread["comments_page"].number, 1)
+
+            # Replies aren't shown for unpublished objects.
+            blog_post.status = CONTENT_STATUS_DRAFT
+            blog_post.save()
+            response = self.client.get(replies_url)
+            self.assertEqual(response.status_code, 404)
+
     @skipUnless("mezzanine.pages" in settings.INSTALLED_APPS, "pages app required")
     def test_keywords(self):
         """
@@ -105,19 +222,142 @@ class GenericTests(TestCase):
         page = RichTextPage.objects.create(title="test keywords")
         keywords = {"how", "now", "brown", "cow"}
         Keyword.objects.all().delete()
-        for keyword in keywords:
-            keyword_id = Keyword.objects.get_or_create(title=keyword)[0].id
-            page.keywords.get_or_create(keyword_id=keyword_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            for keyword in keywords:
+                keyword_id = Keyword.objects.get_or_create(title=keyword)[0].id
+                page.keywords.get_or_create(keyword_id=keyword_id)
         page = RichTextPage.objects.get(id=page.id)
         self.assertEqual(keywords, set(page.keywords_string.split()))
         # Test removal.
         first = Keyword.objects.all()[0]
         keywords.remove(first.title)
-        first.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
         page = RichTextPage.objects.get(id=page.id)
         self.assertEqual(keywords, set(page.keywords_string.split()))
         page.delete()
 
+    @skipUnless("mezzanine.blog" in settings.INSTALLED_APPS, "blog app required")
+    def test_related_updates(self):
+        """
+        Test that keywords strings are recalculated once the
+        transaction is committed without saving the object, and that
+        all custom fields are recalculated at the end of a
+        ``suspend_related_updates`` block.
+        """
+        blog_post = BlogPost.objects.create(title="Post", user=self._user)
+        keyword_ids = [
+            Keyword.objects.get_or_create(title=title)[0].id
+            for title in ("how", "now", "brown", "cow")
+        ]
+        with patch.object(BlogPost, "save") as save:
+            with self.captureOnCommitCallbacks(execute=True):
+                for keyword_id in keyword_ids:
+                    blog_post.keywords.create(keyword_id=keyword_id)
+                blog_post = BlogPost.objects.get(id=blog_post.id)
+                self.assertEqual(blog_post.keywords_string, "")
+        self.assertFalse(save.called)
+        blog_post = BlogPost.objects.get(id=blog_post.id)
+        self.assertEqual(blog_post.keywords_string, "how now brown cow")
+
+        value = settings.RATINGS_RANGE[-1]
+        with suspend_related_updates():
+            with suspend_related_updates():
+                blog_post.keywords.all()[0].delete()
+                for _ in range(3):
+                    blog_post.rating.create(value=value)
+            blog_post = BlogPost.objects.get(id=blog_post.id)
+            self.assertEqual(blog_post.rating_count, 0)
+            self.assertEqual(blog_post.keywords_string, "how now brown cow")
+        blog_post = BlogPost.objects.get(id=blog_post.id)
+        self.assertEqual((blog_post.rating_count, blog_post.rating_sum), (3, value * 3))
+        self.assertEqual(blog_post.rating_average, value)
+        self.assertEqual(blog_post.keywords_string, "now brown cow")
+
+    @skipUnless("mezzanine.blog" in settings.INSTALLED_APPS, "blog app required")
+    @override_settings(SEARCH_BACKEND="mezzanine.core.search.IndexSearchBackend")
+    def test_related_updates_indexed(self):
+        """
+        Test that keywords strings recalculated once the transaction
+        is committed are updated in the search index.
+        """
+        blog_post = BlogPost.objects.create(
+            title="Post", user=self._user, status=CONTENT_STATUS_PUBLISHED
+        )
+        keyword = Keyword.objects.create(title="zebrafish")
+        with self.captureOnCommitCallbacks(execute=True):
+            blog_post.keywords.create(keyword=keyword)
+        self.assertEqual(list(BlogPost.objects.search("zebrafish")), [blog_post])
+
+    @skipUnless("mezzanine.pages" in settings.INSTALLED_APPS, "pages app required")
+    def test_save_keywords(self):
+        """
+        Test that saving keywords from the form keeps the assignments
+        of keywords that remain, and updates the keywords string
+        without saving the page, reindexing it for search.
+        """
+        page = RichTextPage.objects.create(title="test keywords")
+        field = RichTextPage._meta.get_field("keywords")
+        how, now, brown, cow = (
+            Keyword.objects.create(title=title)
+            for title in ("how", "now", "brown", "cow")
+        )
+        field.set_keywords(page, [how, now, brown])
+        kept = page.keywords.get(keyword=now).id
+        ContentType.objects.get_for_model(page)
+        with patch.object(RichTextPage, "save") as save:
+            with self.assertNumQueries(18):
+                field.save_form_data(page, f"{cow.id},{now.id},{cow.id}")
+        self.assertFalse(save.called)
+        assigned = list(page.keywords.values_list("id", "keyword__title"))
+        self.assertEqual([title for _, title in assigned], ["cow", "now"])
+        self.assertEqual(assigned[1][0], kept)
+        self.assertFalse(Keyword.objects.filter(title="how").exists())
+        self.assertEqual(page.keywords_string, "cow now")
+        page = RichTextPage.objects.get(id=page.id)
+        self.assertEqual(page.keywords_string, "cow now")
+
+        backend = "mezzanine.core.search.IndexSearchBackend"
+        with override_settings(SEARCH_BACKEND=backend):
+            zebrafish = Keyword.objects.create(title="zebrafish")
+            field.save_form_data(page, f"{now.id},{zebrafish.id}")
+            self.assertEqual(list(RichTextPage.objects.search("zebrafish")), [page])
+
+    @skipUnless("mezzanine.blog" in settings.INSTALLED_APPS, "blog app required")
+    def test_keyword_counts(self):
+        """
+        Test that the number of times each keyword is assigned to blog
+        posts and their weights are maintained as keywords are
+        assigned, and read with a single query for tag clouds.
+        """
+        Keyword.objects.all().delete()
+        field = BlogPost._meta.get_field("keywords")
+        how, now, brown = (
+            Keyword.objects.create(title=title) for title in ("how", "now", "brown")
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            for keywords in ([how, now, brown], [how, now], [how]):
+                blog_post = BlogPost.objects.create(title="Post", user=self._user)
+                field.set_keywords(blog_post, keywords)
+            blog_post.keywords.create(keyword=now)
+        template = Template(
+            "{% load keyword_tags %}{% keywords_for blog.blogpost as tags %}"
+            "{% for tag in tags %}{{ tag }}:{{ tag.item_count }}:{{ tag.weight }} "
+            "{% endfor %}"
+        )
+        self.assertEqual(template.render(Context({})), "how:3:4 now:3:4 brown:1:1 ")
+        with self.assertNumQueries(1):
+            template.render(Context({}))
+        with self.captureOnCommitCallbacks(execute=True):
+            blog_post.keywords.filter(keyword=how).delete()
+        self.assertEqual(template.render(Context({})), "how:2:3 now:3:4 brown:1:1 ")
+        with self.captureOnCommitCallbacks(execute=True):
+            Setting.objects.create(name="TAG_CLOUD_SIZES", value="2")
+        self.assertEqual(template.render(Context({})), "how:2:1 now:3:2 brown:1:1 ")
+        KeywordCount.objects.all().delete()
+        call_command("reconcile_aggregates", verbosity=0)
+        self.assertEqual(template.render(Context({})), "how:2:1 now:3:2 brown:1:1 ")
+
     def test_delete_unused(self):
         """
         Only ``Keyword`` instances without any assignments should be deleted.
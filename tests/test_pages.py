@@ -20,7 +20,13 @@ from mezzanine.pages.admin import PageAdminForm
 from mezzanine.pages.checks import check_context_processor
 from mezzanine.pages.fields import MenusField
 from mezzanine.pages.models import Page, RichTextPage
+from mezzanine.pages.tree import get_page_tree
 from mezzanine.urls import PAGES_SLUG
+from mezzanine.utils.cache import cache_installed
+from mezzanine.utils.deprecation import (
+    get_middleware_setting,
+    get_middleware_setting_name,
+)
 from mezzanine.utils.sites import override_current_site_id
 from mezzanine.utils.tests import TestCase
 
@@ -90,17 +96,21 @@ class PagesTests(TestCase):
 
         # Use a custom slug in the page path, and test that
         # Page.objects.with_ascendants_for_slug fails, but
-        # correctly falls back to recursive queries.
+        # correctly falls back to the page tree.
         secondary.slug += "custom"
         secondary.save()
         pages_for_slug = Page.objects.with_ascendants_for_slug(tertiary.slug)
         self.assertEqual(len(pages_for_slug[0]._ascendants), 0)
         connection.queries_log.clear()
         ascendants = pages_for_slug[0].get_ascendants()
-        self.assertEqual(len(connection.queries), 2)  # 2 parent queries
+        self.assertEqual(len(connection.queries), 1)  # Page tree query
         self.assertEqual(pages_for_slug[0].id, tertiary.id)
         self.assertEqual(ascendants[0].id, secondary.id)
         self.assertEqual(ascendants[1].id, primary.id)
+        # The tree is kept for the rest of the request.
+        connection.queries_log.clear()
+        self.assertEqual(Page.objects.get(id=tertiary.id).get_ascendants(), ascendants)
+        self.assertEqual(len(connection.queries), 1)  # Page query
 
     def test_set_parent(self):
         old_parent, _ = RichTextPage.objects.get_or_create(title="Old parent")
@@ -152,6 +162,38 @@ class PagesTests(TestCase):
         with self.assertRaises(AttributeError):
             p1.set_parent(p2c)
 
+    def test_page_path(self):
+        """
+        Test that the path, depth and titles fields of descendants are
+        rewritten when a page is moved or renamed, and that they're
+        used to look up descendants and ascendants.
+        """
+        section = RichTextPage.objects.create(title="Section")
+        other = RichTextPage.objects.create(title="Other")
+        child = RichTextPage.objects.create(title="Child", parent=section)
+        grandchild = RichTextPage.objects.create(title="Grandchild", parent=child)
+        self.assertEqual(grandchild.path, f"{section.id}/{child.id}/")
+        self.assertEqual(grandchild.depth, 2)
+        self.assertEqual(
+            set(section.get_descendants().values_list("id", flat=True)),
+            {child.id, grandchild.id},
+        )
+
+        section.set_parent(other)
+        section.title = "Moved"
+        section.save()
+        grandchild = Page.objects.get(id=grandchild.id)
+        self.assertEqual(grandchild.path, f"{other.id}/{section.id}/{child.id}/")
+        self.assertEqual(grandchild.depth, 3)
+        self.assertEqual(grandchild.titles, "Other / Moved / Child / Grandchild")
+        self.assertEqual(grandchild.slug, "other/section/child/grandchild")
+        self.assertEqual(
+            [p.id for p in grandchild.get_ascendants()],
+            [child.id, section.id, other.id],
+        )
+        with self.assertRaises(AttributeError):
+            other.set_parent(grandchild)
+
     def test_set_slug(self):
         parent, _ = RichTextPage.objects.get_or_create(title="Parent", slug="parent")
         child, _ = RichTextPage.objects.get_or_create(
@@ -495,6 +537,87 @@ class PagesTests(TestCase):
         with self.assertNumQueries(1):
             self.assertListEqual(grandchild.get_ascendants(), [child, parent])
 
+    def test_cached_page_invalidated_on_save(self):
+        """
+        Test that cached pages are served until the page they depend on
+        is saved.
+        """
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        page = RichTextPage.objects.create(title="Cached", content="cached-one")
+        url = page.get_absolute_url()
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                self.assertContains(self.client.get(url), "cached-one")
+                RichTextPage.objects.filter(pk=page.pk).update(content="cached-two")
+                self.assertContains(self.client.get(url), "cached-one")
+                page.content = "cached-three"
+                page.save()
+                self.assertContains(self.client.get(url), "cached-three")
+            finally:
+                cache_installed.cache_clear()
+
+    def test_page_tree_cached(self):
+        """
+        Test that the page tree is stored in cache, so that rendering a
+        page menu doesn't query the database, and that pages are
+        reloaded into it once saves or deletes are committed.
+        """
+        middleware = (
+            ("mezzanine.core.middleware.UpdateCacheMiddleware",)
+            + get_middleware_setting()
+            + ("mezzanine.core.middleware.FetchFromCacheMiddleware",)
+        )
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+        template = "{% load pages_tags %}" '{% page_menu "pages/menus/tree.html" %}'
+        published = {"status": CONTENT_STATUS_PUBLISHED}
+
+        def render():
+            # Start again as if on a new request.
+            current_request().__dict__.pop("_page_trees", None)
+            return Template(template).render(Context({}))
+
+        with self.settings(
+            TESTING=False, CACHES=caches, **{get_middleware_setting_name(): middleware}
+        ):
+            cache_installed.cache_clear()
+            try:
+                page = RichTextPage.objects.create(title="Tree page", **published)
+                self.assertIn("Tree page", render())
+                with self.assertNumQueries(0):
+                    self.assertIn("Tree page", render())
+                with self.captureOnCommitCallbacks(execute=True):
+                    page.title = "Renamed page"
+                    page.save()
+                    child = page.children.create(title="Tree child", **published)
+                    # Other requests keep the old tree until committed.
+                    self.assertIn("Tree page", render())
+                with self.assertNumQueries(0):
+                    self.assertIn("Renamed page", render())
+                    tree = get_page_tree()
+                    self.assertEqual(tree.get(child.slug).title, "Tree child")
+                    self.assertEqual(
+                        [p.id for p in tree.ascendants(child.id)], [page.id]
+                    )
+                with self.captureOnCommitCallbacks(execute=True):
+                    page.delete()
+                with self.assertNumQueries(0):
+                    self.assertNotIn("Renamed page", render())
+                    self.assertIsNone(get_page_tree().get(child.slug))
+            finally:
+                cache_installed.cache_clear()
+
     def test_check_context_processor(self):
         context_processor = "mezzanine.pages.context_processors.page"
         templates = [{"OPTIONS": {"context_processors": context_processor}}]